@@ -8,6 +8,7 @@ from django.db.models import Count
 from django import forms
 from django.urls import reverse
 from django.utils.html import format_html
+from django.utils import timezone
 from reversion.admin import VersionAdmin 
 from .models import (User, Tag, Course, Chapter, Exercise,
                       CertificationRequest, Subscription, 
@@ -20,6 +21,9 @@ from .models import (User, Tag, Course, Chapter, Exercise,
                       PendingCertificationRequest,PendingCommunityPost,
                       PendingCourse,PendingGalleryItem,
                       Message,MessageThread)
+from .services import images as image_service
+from .services import file_metadata as file_metadata_service
+from search import buffer as search_buffer
 
 # --- 自定义表单 ---
 class CommunityAdminForm(forms.ModelForm):
@@ -241,7 +245,9 @@ class UserAdmin(BaseUserAdmin):
         obj 代表当前的 User 实例。
         """
         if obj.avatarUrl:
-            return format_html('<a href="{}"><img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 50%;" /></a>', obj.avatarUrl.url, obj.avatarUrl.url)
+            # 列表中使用缩略图，避免加载原图
+            thumbnail_url = image_service.get_thumbnail_url(obj.avatarUrl, 'avatar', 128)
+            return format_html('<a href="{}"><img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 50%;" /></a>', obj.avatarUrl.url, thumbnail_url)
         return "无头像"
     
     avatar_thumbnail.short_description = '头像预览'
@@ -419,7 +425,7 @@ class TagAdmin(admin.ModelAdmin):
 # ===============================================
 @admin.register(GalleryItem)
 class GalleryItemAdmin(RichTextAdminMixin, VersionAdmin): 
-    list_display = ('id', 'title', 'author', 'status', 'display_tags_summary','version', 'requiredPoints', 'rating', 'download_count', 'collection_count','is_vip_free')
+    list_display = ('id', 'title', 'author', 'status', 'display_tags_summary','version', 'requiredPoints', 'rating', 'rating_count', 'download_count', 'collection_count','is_vip_free')
     list_editable = ('status', 'is_vip_free',) 
     list_filter = ('tags',)
     inlines = [GalleryDownloadRecordInline,GalleryCollectionInline]
@@ -435,14 +441,14 @@ class GalleryItemAdmin(RichTextAdminMixin, VersionAdmin):
             )
         }),
         ('数据统计', {
-            'fields': ('rating', 'estimated_download_time_formatted', 'created_at', 'updated_at')
+            'fields': ('rating', 'rating_count', 'bayesian_score', 'file_metadata_summary', 'estimated_download_time_formatted', 'created_at', 'updated_at')
         }),
     ) 
 
     readonly_fields = (
         'title', 'author', 'workFile',
         'requiredPoints', 'prerequisiteWork', 'version', 
-        'rating', 'estimated_download_time_formatted', 'created_at', 'updated_at'
+        'rating', 'rating_count', 'bayesian_score', 'file_metadata_summary', 'estimated_download_time_formatted', 'created_at', 'updated_at'
     )
     #def has_add_permission(self, request, obj=None):
         #return False
@@ -492,6 +498,17 @@ class GalleryItemAdmin(RichTextAdminMixin, VersionAdmin):
         return "N/A" # 如果没有时间数据，则显示 N/A
     estimated_download_time_formatted.short_description = '预计下载时间'
 
+    def file_metadata_summary(self, obj):
+        """显示后台任务算好的文件信息，不直接访问存储"""
+        metadata = file_metadata_service.get_current_metadata(obj)
+        if metadata is None:
+            return "计算中..."
+        summary = f"{metadata.size_bytes / 1024 / 1024:.2f} MB · {metadata.mime_type}"
+        if metadata.archive_entry_count is not None:
+            summary += f" · {metadata.archive_entry_count} 个文件"
+        return format_html('{}<br><code>{}</code>', summary, metadata.sha256)
+    file_metadata_summary.short_description = '文件信息'
+
 @admin.register(GalleryCollection)
 class GalleryCollectionAdmin(admin.ModelAdmin):
     list_display = ('user', 'gallery_item', 'collected_at')
@@ -624,6 +641,17 @@ class VipPlanAdmin(admin.ModelAdmin):
 # =======       审核中心后台管理         =======
 # ===============================================
 
+def update_and_reindex(queryset, **values):
+    """
+    批量修改状态。queryset.update 不触发 post_save，也不会刷新 auto_now 的 updated_at：
+    这里一并写入 updated_at，并把这些对象放入搜索索引缓冲区 (审核模型是代理模型，按实际模型入队)
+    """
+    model = queryset.model._meta.concrete_model
+    pks = list(queryset.values_list('pk', flat=True))
+    model.objects.filter(pk__in=pks).update(updated_at=timezone.now(), **values)
+    search_buffer.enqueue_update(model, pks)
+
+
 @admin.register(PendingCourse)
 class PendingCourseAdmin(admin.ModelAdmin):
     # 将其归入新的 "review_center" 应用（显示为“审核中心”）
@@ -637,11 +665,11 @@ class PendingCourseAdmin(admin.ModelAdmin):
     actions = ['approve_selected', 'reject_selected']
 
     def approve_selected(self, request, queryset):
-        queryset.update(status='published')
+        update_and_reindex(queryset, status='published')
     approve_selected.short_description = "批准选中的课程"
 
     def reject_selected(self, request, queryset):
-        queryset.update(status='rejected')
+        update_and_reindex(queryset, status='rejected')
     reject_selected.short_description = "驳回选中的课程"
 
 @admin.register(PendingGalleryItem)
@@ -650,9 +678,9 @@ class PendingGalleryItemAdmin(admin.ModelAdmin):
         return {'view': True, 'change': True}
     list_display = ('title', 'author', 'created_at')
     actions = ['approve_selected', 'reject_selected']
-    def approve_selected(self, request, queryset): queryset.update(status='published')
+    def approve_selected(self, request, queryset): update_and_reindex(queryset, status='published')
     approve_selected.short_description = "批准选中的作品"
-    def reject_selected(self, request, queryset): queryset.update(status='rejected')
+    def reject_selected(self, request, queryset): update_and_reindex(queryset, status='rejected')
     reject_selected.short_description = "驳回选中的作品"
 
 
@@ -663,9 +691,9 @@ class PendingCommunityPostAdmin(admin.ModelAdmin):
         return {'view': True, 'change': True}
     list_display = ('title', 'author', 'created_at')
     actions = ['approve_selected', 'reject_selected']
-    def approve_selected(self, request, queryset): queryset.update(status='published')
+    def approve_selected(self, request, queryset): update_and_reindex(queryset, status='published')
     approve_selected.short_description = "批准选中的帖子"
-    def reject_selected(self, request, queryset): queryset.update(status='rejected')
+    def reject_selected(self, request, queryset): update_and_reindex(queryset, status='rejected')
     reject_selected.short_description = "驳回选中的帖子"
 
 
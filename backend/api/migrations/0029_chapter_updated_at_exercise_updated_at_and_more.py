@@ -0,0 +1,44 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_pointstransaction_balance_after_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新时间'),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新时间'),
+        ),
+        migrations.AddField(
+            model_name='option',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新时间'),
+        ),
+        migrations.CreateModel(
+            name='CourseContentChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', models.BigIntegerField(verbose_name='所属课程ID')),
+                ('kind', models.CharField(choices=[('chapter', '章节'), ('exercise', '练习'), ('option', '选项')], max_length=20, verbose_name='内容类型')),
+                ('object_id', models.BigIntegerField(verbose_name='内容ID')),
+                ('action', models.CharField(choices=[('upsert', '新增/更新'), ('delete', '删除')], max_length=10, verbose_name='变更动作')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='变更时间')),
+            ],
+            options={
+                'verbose_name': '课程内容变更',
+                'verbose_name_plural': '课程内容变更',
+                'indexes': [models.Index(fields=['course_id', 'id'], name='api_coursec_course__e38d01_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_chapter_updated_at_exercise_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseBundle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_version', models.CharField(max_length=64, verbose_name='内容版本')),
+                ('status', models.CharField(choices=[('building', '生成中'), ('ready', '已就绪'), ('failed', '生成失败')], default='building', max_length=20, verbose_name='生成状态')),
+                ('bundle_file', models.FileField(blank=True, null=True, upload_to='course_bundles/', verbose_name='离线包文件')),
+                ('size_bytes', models.PositiveBigIntegerField(default=0, verbose_name='文件大小(字节)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='请求时间')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='生成完成时间')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bundles', to='api.course', verbose_name='所属课程')),
+            ],
+            options={
+                'verbose_name': '课程离线包',
+                'verbose_name_plural': '课程离线包',
+                'unique_together': {('course', 'content_version')},
+            },
+        ),
+    ]
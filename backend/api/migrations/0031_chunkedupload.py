@@ -0,0 +1,37 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_coursebundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('purpose', models.CharField(choices=[('gallery_work', '画廊作品文件'), ('course_cover', '课程封面'), ('certification', '认证文件')], max_length=20, verbose_name='用途')),
+                ('filename', models.CharField(max_length=255, verbose_name='原始文件名')),
+                ('size', models.PositiveBigIntegerField(verbose_name='文件总大小(字节)')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='已接收字节数')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256')),
+                ('mime_type', models.CharField(blank=True, max_length=100, verbose_name='MIME 类型')),
+                ('status', models.CharField(choices=[('uploading', '上传中'), ('complete', '已完成')], default='uploading', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='最后写入时间')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='过期时间')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL, verbose_name='上传者')),
+            ],
+            options={
+                'verbose_name': '分块上传',
+                'verbose_name_plural': '分块上传',
+            },
+        ),
+    ]
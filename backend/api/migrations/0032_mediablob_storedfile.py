@@ -0,0 +1,41 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='文件大小(字节)')),
+                ('ref_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='引用计数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('released_at', models.DateTimeField(blank=True, null=True, verbose_name='引用归零时间')),
+            ],
+            options={
+                'verbose_name': '媒体文件内容',
+                'verbose_name_plural': '媒体文件内容',
+            },
+        ),
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='文件名')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='files', to='api.mediablob', verbose_name='文件内容')),
+            ],
+            options={
+                'verbose_name': '存储文件',
+                'verbose_name_plural': '存储文件',
+            },
+        ),
+    ]
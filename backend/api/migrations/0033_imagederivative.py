@@ -0,0 +1,32 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_mediablob_storedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(db_index=True, max_length=255, verbose_name='原图文件名')),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10, verbose_name='格式')),
+                ('target_width', models.PositiveIntegerField(verbose_name='目标宽度')),
+                ('file', models.FileField(upload_to='derivatives/', verbose_name='派生图片')),
+                ('width', models.PositiveIntegerField(default=0, verbose_name='实际宽度')),
+                ('height', models.PositiveIntegerField(default=0, verbose_name='实际高度')),
+                ('size_bytes', models.PositiveIntegerField(default=0, verbose_name='文件大小(字节)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='生成时间')),
+            ],
+            options={
+                'verbose_name': '图片派生版本',
+                'verbose_name_plural': '图片派生版本',
+                'unique_together': {('source_name', 'format', 'target_width')},
+            },
+        ),
+    ]
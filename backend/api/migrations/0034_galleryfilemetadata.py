@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_imagederivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryFileMetadata',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='对应的文件名')),
+                ('size_bytes', models.PositiveBigIntegerField(default=0, verbose_name='文件大小(字节)')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256')),
+                ('mime_type', models.CharField(blank=True, max_length=100, verbose_name='MIME 类型')),
+                ('archive_entry_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='压缩包内文件数')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='计算时间')),
+                ('gallery_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='file_metadata', to='api.galleryitem', verbose_name='所属作品')),
+            ],
+            options={
+                'verbose_name': '作品文件信息',
+                'verbose_name_plural': '作品文件信息',
+            },
+        ),
+    ]
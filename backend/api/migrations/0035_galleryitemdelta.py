@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_galleryfilemetadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryItemDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_sha256', models.CharField(max_length=64, verbose_name='旧版本文件 SHA-256')),
+                ('target_sha256', models.CharField(max_length=64, verbose_name='新版本文件 SHA-256')),
+                ('status', models.CharField(choices=[('building', '生成中'), ('ready', '可用'), ('unprofitable', '补丁过大(不使用)'), ('failed', '生成失败')], default='building', max_length=20, verbose_name='状态')),
+                ('patch_file', models.FileField(blank=True, null=True, upload_to='gallery_deltas/', verbose_name='补丁文件')),
+                ('patch_size', models.PositiveBigIntegerField(default=0, verbose_name='补丁大小(字节)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='生成完成时间')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_deltas', to='api.galleryitem', verbose_name='旧版本')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_deltas', to='api.galleryitem', verbose_name='新版本')),
+            ],
+            options={
+                'verbose_name': '作品版本差分',
+                'verbose_name_plural': '作品版本差分',
+                'unique_together': {('source', 'target')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-19 07:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """按现有评分记录计算 rating_sum / rating_count / rating / bayesian_score"""
+    GalleryItem = apps.get_model('api', 'GalleryItem')
+    GalleryItemRating = apps.get_model('api', 'GalleryItemRating')
+    weight = float(settings.GALLERY_RATING_PRIOR_WEIGHT)
+    mean = float(settings.GALLERY_RATING_PRIOR_MEAN)
+
+    rows = GalleryItemRating.objects.values('gallery_item').annotate(total=Sum('rating'), count=Count('id'))
+    items = []
+    for row in rows:
+        items.append(GalleryItem(
+            pk=row['gallery_item'],
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            rating=row['total'] / row['count'],
+            bayesian_score=(weight * mean + row['total']) / (weight + row['count']),
+        ))
+    GalleryItem.objects.bulk_update(
+        items, ['rating_sum', 'rating_count', 'rating', 'bayesian_score'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_galleryitemdelta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='galleryitem',
+            name='bayesian_score',
+            field=models.FloatField(default=0.0, verbose_name='贝叶斯平均分'),
+        ),
+        migrations.AddField(
+            model_name='galleryitem',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='评分人数'),
+        ),
+        migrations.AddField(
+            model_name='galleryitem',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='评分总和'),
+        ),
+        migrations.AddIndex(
+            model_name='galleryitem',
+            index=models.Index(fields=['status', '-bayesian_score', '-id'], name='api_gallery_status_b23923_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def backfill_hot_scores(apps, schema_editor):
+    """按现有点赞 / 回复 / 最佳答案估算热度，整体按发帖时间衰减"""
+    CommunityPost = apps.get_model('api', 'CommunityPost')
+    weights = settings.COMMUNITY_HOT_WEIGHTS
+    half_life = settings.COMMUNITY_HOT_HALF_LIFE_HOURS * 3600
+    now = timezone.now()
+
+    posts = CommunityPost.objects.annotate(
+        num_likes=Count('likes', distinct=True), num_replies=Count('replies', distinct=True)
+    ).only('id', 'created_at', 'best_answer_id')
+    updated = []
+    for post in posts.iterator(chunk_size=1000):
+        score = (weights['post'] + weights['like'] * post.num_likes + weights['reply'] * post.num_replies
+                 + (weights['best_answer'] if post.best_answer_id else 0))
+        score *= 0.5 ** ((now - post.created_at).total_seconds() / half_life)
+        post.hot_score = score if score >= 0.01 else 0.0
+        updated.append(post)
+    CommunityPost.objects.bulk_update(updated, ['hot_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_galleryitem_bayesian_score_galleryitem_rating_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communitypost',
+            name='hot_score',
+            field=models.FloatField(default=0.0, verbose_name='热度'),
+        ),
+        migrations.AddIndex(
+            model_name='communitypost',
+            index=models.Index(fields=['community', 'status', '-hot_score', '-id'], name='api_communi_communi_cabdc4_idx'),
+        ),
+        migrations.RunPython(backfill_hot_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_communitypost_hot_score_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BountyEscrow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='托管积分')),
+                ('status', models.CharField(choices=[('held', '托管中'), ('awarded', '已发放'), ('refunded', '已退回')], default='held', max_length=20, verbose_name='状态')),
+                ('expires_at', models.DateTimeField(verbose_name='到期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('settled_at', models.DateTimeField(blank=True, null=True, verbose_name='结算时间')),
+                ('payer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='bounty_escrows', to=settings.AUTH_USER_MODEL, verbose_name='出资人')),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='bounty_escrow', to='api.communitypost', verbose_name='悬赏帖子')),
+            ],
+            options={
+                'verbose_name': '悬赏托管',
+                'verbose_name_plural': '悬赏托管',
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='api_bountye_status_b62cdf_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """按标题 (权重 A) + 正文 (权重 B) 计算已有数据的 search_vector，只在 PostgreSQL 上执行"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = settings.SEARCH_PG_CONFIG
+    for model_name, body in (('Course', 'description'), ('GalleryItem', 'description'), ('CommunityPost', 'content')):
+        model = apps.get_model('api', model_name)
+        model.objects.update(
+            search_vector=SearchVector('title', weight='A', config=config) + SearchVector(body, weight='B', config=config)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_bountyescrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communitypost',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='galleryitem',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='communitypost',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_communi_search__7a7f9f_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_course_search__338630_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='galleryitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_gallery_search__a34f27_gin'),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
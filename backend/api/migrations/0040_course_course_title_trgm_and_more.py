@@ -0,0 +1,37 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_communitypost_search_vector_course_search_vector_and_more'),
+    ]
+
+    operations = [
+        # gin_trgm_ops 由 pg_trgm 扩展提供 (其他数据库上这一步什么也不做)
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='course_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='galleryitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='galleryitem_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='tag_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['username'], name='user_username_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nickname'], name='user_nickname_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
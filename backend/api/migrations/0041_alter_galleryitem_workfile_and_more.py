@@ -0,0 +1,69 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:32
+
+import os
+import shutil
+import api.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _move(source, target):
+    if os.path.lexists(source) and not os.path.lexists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+
+
+def move_private_files(apps, schema_editor):
+    """
+    把去重存储的内容文件从 MEDIA_ROOT/blobs 移到 MEDIA_BLOB_ROOT，把作品文件和差分补丁移到 PROTECTED_MEDIA_ROOT。
+    os.replace 不改变 inode，业务文件名上的硬链接仍然有效；符号链接 (不支持硬链接时的退路) 重新指向新位置。
+    """
+    old_blob_root = os.path.join(settings.MEDIA_ROOT, 'blobs')
+    if os.path.isdir(old_blob_root) and os.path.abspath(old_blob_root) != os.path.abspath(settings.MEDIA_BLOB_ROOT):
+        for dirpath, _, filenames in os.walk(old_blob_root):
+            for filename in filenames:
+                source = os.path.join(dirpath, filename)
+                _move(source, os.path.join(settings.MEDIA_BLOB_ROOT, os.path.relpath(source, old_blob_root)))
+        # 剩下的只可能是新位置已有的重复内容；删除目录项不影响已有的硬链接
+        shutil.rmtree(old_blob_root, ignore_errors=True)
+
+    for model_name, field in (('GalleryItem', 'workFile'), ('GalleryItemDelta', 'patch_file')):
+        names = (
+            apps.get_model('api', model_name).objects
+            .exclude(**{f"{field}__isnull": True}).exclude(**{field: ''})
+            .values_list(field, flat=True)
+        )
+        for name in names.iterator():
+            _move(os.path.join(settings.MEDIA_ROOT, name), os.path.join(settings.PROTECTED_MEDIA_ROOT, name))
+
+    StoredFile = apps.get_model('api', 'StoredFile')
+    for name in StoredFile.objects.values_list('name', flat=True).iterator():
+        for root in (settings.MEDIA_ROOT, settings.PROTECTED_MEDIA_ROOT):
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                continue
+            target = os.readlink(path)
+            if target.startswith(old_blob_root + os.sep):
+                os.remove(path)
+                os.symlink(os.path.join(settings.MEDIA_BLOB_ROOT, os.path.relpath(target, old_blob_root)), path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_course_course_title_trgm_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='galleryitem',
+            name='workFile',
+            field=models.FileField(storage=api.storage.protected_storage, upload_to='gallery_files/', verbose_name='作品文件(压缩包等)'),
+        ),
+        migrations.AlterField(
+            model_name='galleryitemdelta',
+            name='patch_file',
+            field=models.FileField(blank=True, null=True, storage=api.storage.protected_storage, upload_to='gallery_deltas/', verbose_name='补丁文件'),
+        ),
+        migrations.RunPython(move_private_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:38
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Value
+from search import cjk
+
+BATCH_SIZE = 500
+
+
+def rebuild_search_vectors(apps, schema_editor):
+    """中日韩文本展开成两字词后重新计算 search_vector (见 search/cjk.py)，只在 PostgreSQL 上执行"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = settings.SEARCH_PG_CONFIG
+    for model_name, body in (('Course', 'description'), ('GalleryItem', 'description'), ('CommunityPost', 'content')):
+        model = apps.get_model('api', model_name)
+        rows = model.objects.order_by('pk').values_list('pk', 'title', body).iterator(chunk_size=BATCH_SIZE)
+        for pk, title, text in rows:
+            model.objects.filter(pk=pk).update(
+                search_vector=SearchVector(Value(cjk.expand(title)), weight='A', config=config)
+                + SearchVector(Value(cjk.expand(text)), weight='B', config=config)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_alter_galleryitem_workfile_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_vectors, migrations.RunPython.noop),
+    ]
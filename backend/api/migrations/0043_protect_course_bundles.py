@@ -0,0 +1,37 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:56
+
+import os
+import api.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_course_bundles(apps, schema_editor):
+    """
+    把已生成的离线包从 MEDIA_ROOT 移到 PROTECTED_MEDIA_ROOT (同一文件系统)。
+    os.replace 不改变 inode，指向去重内容文件的硬链接仍然有效；StoredFile 只记录文件名，不需要修改。
+    """
+    CourseBundle = apps.get_model('api', 'CourseBundle')
+    names = CourseBundle.objects.exclude(bundle_file__isnull=True).exclude(bundle_file='').values_list('bundle_file', flat=True)
+    for name in names.iterator():
+        source = os.path.join(settings.MEDIA_ROOT, name)
+        target = os.path.join(settings.PROTECTED_MEDIA_ROOT, name)
+        if os.path.lexists(source) and not os.path.lexists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_rebuild_cjk_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='coursebundle',
+            name='bundle_file',
+            field=models.FileField(blank=True, null=True, storage=api.storage.protected_storage, upload_to='course_bundles/', verbose_name='离线包文件'),
+        ),
+        migrations.RunPython(move_course_bundles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.5 on 2026-10-19 08:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0043_protect_course_bundles'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bountyescrow',
+            name='post',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bounty_escrow', to='api.communitypost', verbose_name='悬赏帖子'),
+        ),
+    ]
@@ -1,10 +1,33 @@
+import os
+import uuid
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
 from django_bleach.models import BleachField
+from .storage import protected_storage
+
+
+class PreserveMaintainedFieldsMixin:
+    """
+    MAINTAINED_FIELDS 中的列只由 F() / 单独的 UPDATE 维护；
+    普通保存 (没有指定 update_fields) 时不写回这些列，避免用加载时的旧值覆盖期间的新值。
+    """
+    MAINTAINED_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            skipped = set(self.MAINTAINED_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
 
 class User(AbstractUser):
     # 用户角色
@@ -47,6 +70,9 @@ class User(AbstractUser):
         models.Index(fields=['role', 'accountStatus']), 
         models.Index(fields=['currentPoints']), 
         models.Index(fields=['is_deleted']), 
+        # 站内信收件人输入提示的数据库后备 (ILIKE '%q%')，依赖 pg_trgm 扩展
+        GinIndex(fields=['username'], name='user_username_trgm', opclasses=['gin_trgm_ops']),
+        GinIndex(fields=['nickname'], name='user_nickname_trgm', opclasses=['gin_trgm_ops']),
     ]
     verbose_name = "用户"
     verbose_name_plural = "用户"
@@ -141,6 +167,9 @@ class Tag(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['name', 'scope'], name='unique_name_scope_combination')
         ]
+        indexes = [
+            GinIndex(fields=['name'], name='tag_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
         ordering = ['scope', 'name'] 
 
 # ===============================================
@@ -148,7 +177,7 @@ class Tag(models.Model):
 # ===============================================
 
 
-class Course(models.Model):
+class Course(PreserveMaintainedFieldsMixin, models.Model):
     """课程模型"""
     class StatusChoices(models.TextChoices):
         DRAFT = 'draft', '草稿'
@@ -175,12 +204,21 @@ class Course(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     subscribers = models.ManyToManyField(User, related_name='subscribed_courses', blank=True, through='Subscription',verbose_name="订阅者")
     collectors = models.ManyToManyField(User, related_name='collected_courses', blank=True, through='Collection',verbose_name="收藏者")
+    # 数据库全文检索 (ES 不可用时的后备搜索) 用的 tsvector，保存后由 search/signals.py 重新计算，不要直接写
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # search_vector 由 search/signals.py 单独更新
+    MAINTAINED_FIELDS = ('search_vector',)
    
     def __str__(self):
         return self.title
     class Meta:
         verbose_name = "课程"
         verbose_name_plural = verbose_name
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['title'], name='course_title_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
 class Chapter(models.Model):
     """章节模型"""
@@ -188,6 +226,7 @@ class Chapter(models.Model):
     title = models.CharField(max_length=200, verbose_name="章节标题")
     order = models.PositiveIntegerField(default=0, verbose_name="章节顺序")
     videoUrl = models.URLField(max_length=500, blank=True, null=True, verbose_name="视频链接")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
         verbose_name = "章节"
@@ -202,6 +241,7 @@ class Option(models.Model):
     exercise = models.ForeignKey('Exercise', on_delete=models.CASCADE, related_name='options')
     text = models.CharField(max_length=500, verbose_name="选项内容")
     is_correct = models.BooleanField(default=False, verbose_name="是否为正确答案") 
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     def __str__(self):
         return self.text
@@ -239,6 +279,7 @@ class Exercise(models.Model):
     explanation = BleachField(blank=True, null=True, verbose_name="答案解析")
     image_upload = models.ImageField(upload_to='exercises/', blank=True, null=True, verbose_name="上传图片")
     image_url = models.URLField(blank=True, null=True, verbose_name="图片链接")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
     
     class Meta:
         verbose_name = "练习"
@@ -330,10 +371,72 @@ class UserExerciseCompletion(models.Model):
         verbose_name = "用戶練習完成記錄"
 
 
+class CourseContentChange(models.Model):
+    """
+    课程内容变更日志 (离线增量同步用)。
+    章节/练习/选项每次保存或删除都会追加一条记录，自增 id 即同步游标
+    (事务可能乱序提交，游标只推进到安全窗口之前，见 services/sync.py)。
+    course_id 不使用外键：级联删除课程时，子对象的删除记录仍需要能写入。
+    """
+    class Kind(models.TextChoices):
+        CHAPTER = 'chapter', '章节'
+        EXERCISE = 'exercise', '练习'
+        OPTION = 'option', '选项'
+
+    class Action(models.TextChoices):
+        UPSERT = 'upsert', '新增/更新'
+        DELETE = 'delete', '删除'
+
+    course_id = models.BigIntegerField(verbose_name="所属课程ID")
+    kind = models.CharField(max_length=20, choices=Kind.choices, verbose_name="内容类型")
+    object_id = models.BigIntegerField(verbose_name="内容ID")
+    action = models.CharField(max_length=10, choices=Action.choices, verbose_name="变更动作")
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name="变更时间")
+
+    class Meta:
+        verbose_name = "课程内容变更"
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 优化 "某课程自游标之后的变更" 查询
+            models.Index(fields=['course_id', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} course={self.course_id} {self.kind}:{self.object_id} {self.action}"
+
+
+class CourseBundle(models.Model):
+    """
+    课程离线包 (zip + manifest.json)。
+    按课程内容版本缓存，同一版本只生成一次，内容变化后才会重新生成。
+    """
+    class StatusChoices(models.TextChoices):
+        BUILDING = 'building', '生成中'
+        READY = 'ready', '已就绪'
+        FAILED = 'failed', '生成失败'
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='bundles', verbose_name="所属课程")
+    content_version = models.CharField(max_length=64, verbose_name="内容版本")
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.BUILDING, verbose_name="生成状态")
+    # 离线包含付费课程内容，不能放在公开的 MEDIA_URL 下，只经过订阅检查的 bundle 接口下发
+    bundle_file = models.FileField(upload_to='course_bundles/', storage=protected_storage, blank=True, null=True, verbose_name="离线包文件")
+    size_bytes = models.PositiveBigIntegerField(default=0, verbose_name="文件大小(字节)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="请求时间")
+    built_at = models.DateTimeField(null=True, blank=True, verbose_name="生成完成时间")
+
+    class Meta:
+        verbose_name = "课程离线包"
+        verbose_name_plural = verbose_name
+        unique_together = ('course', 'content_version')
+
+    def __str__(self):
+        return f"{self.course_id} @ {self.content_version} ({self.get_status_display()})"
+
+
 # ===============================================
 # =======         画廊模块模型         =======
 # ===============================================
-class GalleryItem(models.Model):
+class GalleryItem(PreserveMaintainedFieldsMixin, models.Model):
     """画廊作品模型"""
     class StatusChoices(models.TextChoices):
         DRAFT = 'draft', '草稿'
@@ -346,7 +449,8 @@ class GalleryItem(models.Model):
     description = BleachField(verbose_name="作品描述") 
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='gallery_items_authored', verbose_name="作者")
     coverImage = models.ImageField(upload_to='gallery_covers/', blank=True, null=True, verbose_name="封面图片")
-    workFile = models.FileField(upload_to='gallery_files/', verbose_name="作品文件(压缩包等)") # 用于存储实际的作品文件
+    # 作品文件不公开，只能通过签名下载链接获取 (见 GalleryItemViewSet.file)
+    workFile = models.FileField(upload_to='gallery_files/', storage=protected_storage, verbose_name="作品文件(压缩包等)") # 用于存储实际的作品文件
     is_vip_free = models.BooleanField(default=False, verbose_name="VIP免费")
     tags = models.ManyToManyField(
         Tag, 
@@ -360,37 +464,81 @@ class GalleryItem(models.Model):
     prerequisiteWork = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="往期版本")
     version = models.CharField(max_length=20, blank=True, null=True, verbose_name="版本号")
     rating = models.FloatField(default=0.0, verbose_name="平均评分")
+    # 以下三个字段由 api.services.ratings 在评分增删改时用 F() 原子更新，不要直接写
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="评分总和")
+    rating_count = models.PositiveIntegerField(default=0, verbose_name="评分人数")
+    bayesian_score = models.FloatField(default=0.0, verbose_name="贝叶斯平均分")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     collectors = models.ManyToManyField(User, related_name='collected_gallery_items', blank=True, through='GalleryCollection',verbose_name="收藏者")
     downloaders = models.ManyToManyField(User, related_name='downloaded_gallery_items', blank=True, through='GalleryDownloadRecord',verbose_name="下载者")
+    # 由 api.tasks.compute_gallery_file_metadata 在作品文件变化后异步计算，save() 本身不访问存储
     estimated_download_time = models.FloatField(default=0.0, verbose_name="估计下载时间(分钟)")
+    # 数据库全文检索 (ES 不可用时的后备搜索) 用的 tsvector，保存后由 search/signals.py 重新计算，不要直接写
+    search_vector = SearchVectorField(null=True, editable=False)
     class Meta:
         verbose_name = "画廊作品"
         verbose_name_plural = verbose_name
+        indexes = [
+            # ?ordering=top_rated
+            models.Index(fields=['status', '-bayesian_score', '-id']),
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['title'], name='galleryitem_title_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    RATING_AGGREGATE_FIELDS = ('rating', 'rating_sum', 'rating_count', 'bayesian_score')
+    # 评分聚合字段只由 F() 更新维护，search_vector 由 search/signals.py 单独更新，
+    # estimated_download_time 由文件元数据任务 (services/file_metadata.py) 写入
+    MAINTAINED_FIELDS = RATING_AGGREGATE_FIELDS + ('search_vector', 'estimated_download_time')
     
     def __str__(self):
         return self.title
-    def save(self, *args, **kwargs):
-        DOWNLOAD_RATE_BYTES_PER_SECOND = 3 * 1024 * 1024  # 3 MB/s
-        
-        # 确保 workFile 字段有文件存在
-        if self.workFile:
-            try:
-                self.file_size_bytes = self.workFile.size
-            except:
-                self.file_size_bytes = 0
-                
-            # 2. 计算预计下载时间
-            if self.file_size_bytes > 0 and DOWNLOAD_RATE_BYTES_PER_SECOND > 0:
-                self.estimated_download_time = self.file_size_bytes / DOWNLOAD_RATE_BYTES_PER_SECOND
-            else:
-                self.estimated_download_time = 0.0
-        else:
-            self.file_size_bytes = 0
-            self.estimated_download_time = 0.0
 
-        super().save(*args, **kwargs)
+class GalleryFileMetadata(models.Model):
+    """画廊作品文件的元数据，作品文件变化后在后台计算一次。"""
+    gallery_item = models.OneToOneField(GalleryItem, on_delete=models.CASCADE, related_name='file_metadata', verbose_name="所属作品")
+    file_name = models.CharField(max_length=255, verbose_name="对应的文件名")
+    size_bytes = models.PositiveBigIntegerField(default=0, verbose_name="文件大小(字节)")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256")
+    mime_type = models.CharField(max_length=100, blank=True, verbose_name="MIME 类型")
+    archive_entry_count = models.PositiveIntegerField(null=True, blank=True, verbose_name="压缩包内文件数")
+    computed_at = models.DateTimeField(auto_now=True, verbose_name="计算时间")
+
+    class Meta:
+        verbose_name = "作品文件信息"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.file_name} ({self.size_bytes} bytes)"
+
+class GalleryItemDelta(models.Model):
+    """
+    相邻两个作品版本 (prerequisiteWork -> 新版本) 之间的二进制差分补丁。
+    已拥有旧版本的用户下载补丁即可在本地还原新版本文件。
+    """
+    class StatusChoices(models.TextChoices):
+        BUILDING = 'building', '生成中'
+        READY = 'ready', '可用'
+        UNPROFITABLE = 'unprofitable', '补丁过大(不使用)'
+        FAILED = 'failed', '生成失败'
+
+    source = models.ForeignKey(GalleryItem, on_delete=models.CASCADE, related_name='outgoing_deltas', verbose_name="旧版本")
+    target = models.ForeignKey(GalleryItem, on_delete=models.CASCADE, related_name='incoming_deltas', verbose_name="新版本")
+    source_sha256 = models.CharField(max_length=64, verbose_name="旧版本文件 SHA-256")
+    target_sha256 = models.CharField(max_length=64, verbose_name="新版本文件 SHA-256")
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.BUILDING, verbose_name="状态")
+    patch_file = models.FileField(upload_to='gallery_deltas/', storage=protected_storage, blank=True, null=True, verbose_name="补丁文件")
+    patch_size = models.PositiveBigIntegerField(default=0, verbose_name="补丁大小(字节)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    built_at = models.DateTimeField(null=True, blank=True, verbose_name="生成完成时间")
+
+    class Meta:
+        verbose_name = "作品版本差分"
+        verbose_name_plural = verbose_name
+        unique_together = ('source', 'target')
+
+    def __str__(self):
+        return f"{self.source_id} -> {self.target_id} ({self.get_status_display()})"
 
 class GalleryCollection(models.Model):
     """画廊作品收藏关系模型"""
@@ -473,7 +621,7 @@ class Community(models.Model):
         verbose_name = "社群板块"
         verbose_name_plural = verbose_name
 
-class CommunityPost(models.Model):
+class CommunityPost(PreserveMaintainedFieldsMixin, models.Model):
     """社群帖子模型"""
     class StatusChoices(models.TextChoices):
         PENDING_REVIEW = 'pending_review', '待审核'
@@ -489,8 +637,15 @@ class CommunityPost(models.Model):
     status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.PENDING_REVIEW, verbose_name="帖子状态")
     rewardPoints = models.PositiveIntegerField(default=0, verbose_name="悬赏积分")
     best_answer = models.OneToOneField('CommunityReply', on_delete=models.SET_NULL, null=True, blank=True, related_name='best_for_post', verbose_name="最佳答案")
+    # 由 api.services.hot_ranking 在点赞 / 回复 / 采纳时用 F() 累加，并由定时任务按半衰期衰减，不要直接写
+    hot_score = models.FloatField(default=0.0, verbose_name="热度")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="发布时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    # 数据库全文检索 (ES 不可用时的后备搜索) 用的 tsvector，保存后由 search/signals.py 重新计算，不要直接写
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # 热度只由 F() 更新维护，search_vector 由 search/signals.py 单独更新
+    MAINTAINED_FIELDS = ('hot_score', 'search_vector')
     
     def __str__(self):
         return self.title
@@ -498,6 +653,11 @@ class CommunityPost(models.Model):
     class Meta:
         verbose_name = "社群帖子"
         verbose_name_plural = verbose_name
+        indexes = [
+            # ?ordering=hot
+            models.Index(fields=['community', 'status', '-hot_score', '-id']),
+            GinIndex(fields=['search_vector']),
+        ]
 
 class CommunityReply(models.Model):
     """社群回帖模型"""
@@ -513,6 +673,36 @@ class CommunityReply(models.Model):
         verbose_name = "社群回帖"
         verbose_name_plural = verbose_name
 
+class BountyEscrow(models.Model):
+    """
+    悬赏托管：发帖时扣除的悬赏积分记在这里，采纳最佳答案时发放，
+    到期仍未采纳时由 api.tasks.refund_expired_bounties 批量退回给发帖人。
+    帖子被删除时托管中的积分立即退回 (api/signals.py)，托管记录保留 (post 置空) 作为结算凭据。
+    """
+    class StatusChoices(models.TextChoices):
+        HELD = 'held', '托管中'
+        AWARDED = 'awarded', '已发放'
+        REFUNDED = 'refunded', '已退回'
+
+    post = models.OneToOneField(CommunityPost, on_delete=models.SET_NULL, null=True, related_name='bounty_escrow', verbose_name="悬赏帖子")
+    payer = models.ForeignKey(User, on_delete=models.PROTECT, related_name='bounty_escrows', verbose_name="出资人")
+    amount = models.PositiveIntegerField(verbose_name="托管积分")
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.HELD, verbose_name="状态")
+    expires_at = models.DateTimeField(verbose_name="到期时间")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    settled_at = models.DateTimeField(null=True, blank=True, verbose_name="结算时间")
+
+    class Meta:
+        verbose_name = "悬赏托管"
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 退款任务：status='held' AND expires_at <= now，按到期时间顺序
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id}: {self.amount} ({self.get_status_display()})"
+
 # ===============================================
 # =======         积分流水模型         =======
 # ===============================================
@@ -724,4 +914,109 @@ class Message(models.Model):
     class Meta:
         verbose_name = "单条消息"
         verbose_name_plural = verbose_name
-        ordering = ['sent_at']
\ No newline at end of file
+        ordering = ['sent_at']
+# ===============================================
+# =======        分块上传 (断点续传)        =======
+# ===============================================
+
+class ChunkedUpload(models.Model):
+    """
+    可续传的分块上传会话 (类 tus 协议)。
+    分块按偏移量追加到磁盘上的临时文件，完成后直接移动到目标字段的存储位置。
+    """
+    class PurposeChoices(models.TextChoices):
+        GALLERY_WORK = 'gallery_work', '画廊作品文件'
+        COURSE_COVER = 'course_cover', '课程封面'
+        CERTIFICATION = 'certification', '认证文件'
+
+    class StatusChoices(models.TextChoices):
+        UPLOADING = 'uploading', '上传中'
+        COMPLETE = 'complete', '已完成'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads', verbose_name="上传者")
+    purpose = models.CharField(max_length=20, choices=PurposeChoices.choices, verbose_name="用途")
+    filename = models.CharField(max_length=255, verbose_name="原始文件名")
+    size = models.PositiveBigIntegerField(verbose_name="文件总大小(字节)")
+    offset = models.PositiveBigIntegerField(default=0, verbose_name="已接收字节数")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256")
+    mime_type = models.CharField(max_length=100, blank=True, verbose_name="MIME 类型")
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.UPLOADING, verbose_name="状态")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="最后写入时间")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="过期时间")
+
+    class Meta:
+        verbose_name = "分块上传"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{self.pk}.part")
+
+
+# ===============================================
+# =======      内容寻址媒体存储 (去重)      =======
+# ===============================================
+
+class MediaBlob(models.Model):
+    """
+    按 SHA-256 存放的文件内容，相同内容只在磁盘上保存一份。
+    ref_count 为指向它的 StoredFile 数量，归零后由定时任务回收。
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True, verbose_name="SHA-256")
+    size = models.PositiveBigIntegerField(verbose_name="文件大小(字节)")
+    ref_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="引用计数")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    released_at = models.DateTimeField(null=True, blank=True, verbose_name="引用归零时间")
+
+    class Meta:
+        verbose_name = "媒体文件内容"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.sha256[:12]} x{self.ref_count}"
+
+
+class StoredFile(models.Model):
+    """存储中的一个文件名 (即 FileField 里保存的 name)，指向它的内容 MediaBlob。"""
+    name = models.CharField(max_length=255, unique=True, verbose_name="文件名")
+    blob = models.ForeignKey(MediaBlob, on_delete=models.PROTECT, related_name='files', verbose_name="文件内容")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "存储文件"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.name
+
+
+class ImageDerivative(models.Model):
+    """
+    图片的缩略图 / WebP 派生版本。
+    以原图的存储文件名关联，原图被替换后文件名变化，自然会生成新的派生图。
+    """
+    class FormatChoices(models.TextChoices):
+        WEBP = 'webp', 'WebP'
+        JPEG = 'jpeg', 'JPEG'
+
+    source_name = models.CharField(max_length=255, db_index=True, verbose_name="原图文件名")
+    format = models.CharField(max_length=10, choices=FormatChoices.choices, verbose_name="格式")
+    target_width = models.PositiveIntegerField(verbose_name="目标宽度")
+    file = models.FileField(upload_to='derivatives/', verbose_name="派生图片")
+    width = models.PositiveIntegerField(default=0, verbose_name="实际宽度")
+    height = models.PositiveIntegerField(default=0, verbose_name="实际高度")
+    size_bytes = models.PositiveIntegerField(default=0, verbose_name="文件大小(字节)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="生成时间")
+
+    class Meta:
+        verbose_name = "图片派生版本"
+        verbose_name_plural = verbose_name
+        unique_together = ('source_name', 'format', 'target_width')
+
+    def __str__(self):
+        return f"{self.source_name} @{self.target_width}w.{self.format}"
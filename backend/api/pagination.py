@@ -0,0 +1,13 @@
+# backend/api/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class ReplyCursorPagination(CursorPagination):
+    """
+    帖子回复的游标分页，按 (created_at, id) 从早到晚。
+    游标只依赖上一页最后一条的位置，新回复不断追加时翻页也不会重复或漏掉。
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('created_at', 'id')
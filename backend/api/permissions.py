@@ -1,7 +1,7 @@
 # backend/api/permissions.py
 
 from rest_framework.permissions import BasePermission,SAFE_METHODS
-from .models import Community, Subscription, GalleryDownloadRecord
+from .services import entitlements as entitlement_service
 
 # ===============================================
 # =======    角色权限 (Role Permissions)     =======
@@ -60,26 +60,14 @@ class IsOwner(BasePermission):
 class IsPaidUsers(BasePermission):
     """
     自訂權限：檢查用戶是否有權限在「門禁社群」中發言。
+    社群的門禁目標和用戶的訂閱 / 下載記錄都走 services/entitlements.py 的快取，正常情況下不查資料庫。
     """
     message = "您需要先訂閱關聯課程或下載關聯作品才能在此社群發言。"
 
     def has_permission(self, request, view):
         # 從 URL 中獲取正在操作的社群 ID
-        community_pk = view.kwargs.get('community_pk')
         try:
-            community = Community.objects.get(pk=community_pk)
-        except Community.DoesNotExist:
+            community_pk = int(view.kwargs.get('community_pk'))
+        except (TypeError, ValueError):
             return False
-        
-        if community.related_course is None and community.related_gallery_item is None:
-            return True
-         
-        user = request.user
-        if community.related_course:
-            if Subscription.objects.filter(user=user, course=community.related_course).exists():
-                return True  
-        if community.related_gallery_item:
-            if GalleryDownloadRecord.objects.filter(user=user, gallery_item=community.related_gallery_item).exists():
-                return True  
-
-        return False
\ No newline at end of file
+        return entitlement_service.can_post_in_community(request.user, community_pk)
@@ -1,14 +1,24 @@
 # backend/api/serializers.py
 import random
 from rest_framework import serializers
+from rest_framework.fields import SkipField
 from django.contrib.auth import authenticate
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count
+from django.urls import reverse
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User,CertificationRequest,Course,Chapter,Exercise
 from .models import (Subscription, Collection, Option, fill_in_blank,Tag,
                      GalleryItem, GalleryCollection, GalleryDownloadRecord, 
                      GalleryItemRating,Community,CommunityPost,CommunityReply,
                      Message,MessageThread,UserExerciseSubmission,
-                     PointsTransaction)
+                     PointsTransaction,ChunkedUpload)
+from .services import uploads as upload_service
+from .services import images as image_service
+from .services import likes as like_service
+from .services import access as access_service
+from .services import delivery as delivery_service
+from .pagination import ReplyCursorPagination
 
 class TagsField(serializers.Field):
     """
@@ -52,6 +62,98 @@ class TagsField(serializers.Field):
         return tags_list
 
 
+class ImageSrcsetField(serializers.Field):
+    """
+    只读字段，返回图片字段对应的派生图 srcset：{"webp": "url 320w, ...", "jpeg": "..."}。
+    派生图尚未生成时返回 null (前端使用原图)，并在后台投递生成任务。
+    """
+    def __init__(self, *args, **kwargs):
+        self.profile = kwargs.pop('profile')
+        kwargs['read_only'] = True
+        super().__init__(*args, **kwargs)
+
+    def _prefetched(self):
+        """所在列表 (SrcsetListSerializer) 批量取回的 srcset，不在列表中时为 None"""
+        node = self.parent
+        while node is not None:
+            srcsets = getattr(node, '_srcsets', None)
+            if srcsets is not None:
+                return srcsets
+            node = node.parent
+        return None
+
+    def to_representation(self, value):
+        return image_service.get_srcset(value, self.profile, self.context.get('request'), self._prefetched())
+
+
+def _collect_image_names(serializer, instance, names):
+    """收集 serializer 序列化 instance 时要用到的原图名 (包括嵌套的单个对象，例如作者头像)"""
+    for field in serializer.fields.values():
+        if field.write_only or not isinstance(field, (ImageSrcsetField, serializers.Serializer)):
+            continue
+        try:
+            value = field.get_attribute(instance)
+        except (AttributeError, KeyError, ObjectDoesNotExist, SkipField):
+            continue
+        if value is None:
+            continue
+        if isinstance(field, ImageSrcsetField):
+            if value:
+                names.add(value.name)
+        else:
+            _collect_image_names(field, value, names)
+
+
+class SrcsetListSerializer(serializers.ListSerializer):
+    """
+    列表序列化时一次取回整页图片的 srcset (一次 cache.get_many，未命中的一条查询)，
+    子序列化器中的 ImageSrcsetField 不再逐个对象读取缓存。
+    """
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        names = set()
+        for item in items:
+            _collect_image_names(self.child, item, names)
+        self._srcsets = image_service.load_srcsets(names)
+        return super().to_representation(items)
+
+
+class LikeStateListSerializer(SrcsetListSerializer):
+    """
+    列表序列化时一次取回整页对象的点赞数和当前用户的点赞状态 (一次 Redis pipeline)，
+    子序列化器需要混入 LikeStateMixin。
+    """
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child._like_states = like_service.get_like_states(
+            self.child.Meta.model, [item.pk for item in items], self.child._request_user()
+        )
+        return super().to_representation(items)
+
+
+class LikeStateMixin(serializers.Serializer):
+    """为帖子 / 回帖序列化器提供 likes_count 和 liked_by_me 两个只读字段"""
+    likes_count = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
+
+    def _request_user(self):
+        return getattr(self.context.get('request'), 'user', None)
+
+    def _like_state(self, obj):
+        states = getattr(self, '_like_states', None) or {}
+        if obj.pk not in states:
+            # 单个对象序列化 (详情) 时没有整页预取
+            states = {**states, **like_service.get_like_states(type(obj), [obj.pk], self._request_user())}
+            self._like_states = states
+        return states[obj.pk]
+
+    def get_likes_count(self, obj):
+        return self._like_state(obj)[0]
+
+    def get_liked_by_me(self, obj):
+        return self._like_state(obj)[1]
+
+
 # ===============================================
 # =======       基础配置  Serializers     =======
 # ===============================================
@@ -205,24 +307,82 @@ class ChangeEmailCommitSerializer(serializers.Serializer):
     newCode = serializers.CharField(max_length=6, min_length=6, label="新邮箱验证码")
 
 #身份认证
-class CertificationRequestSerializer(serializers.ModelSerializer):
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    """分块上传会话 (创建时只需 purpose / filename / size)"""
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'purpose', 'filename', 'size', 'offset', 'sha256', 'mime_type', 'status', 'expires_at']
+        read_only_fields = ['id', 'offset', 'sha256', 'mime_type', 'status', 'expires_at']
+
+
+class ChunkedUploadAttachMixin:
+    """
+    允许用已完成的分块上传 ID 代替 multipart 文件字段。
+    子类声明 upload_fields = {'<上传ID字段>': ('<模型文件字段>', ChunkedUpload.PurposeChoices.xxx)}，
+    并在 Meta.fields 中加入对应的上传ID字段。
+    """
+    upload_fields = {}
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        user = self.context['request'].user
+        self._pending_uploads = {}
+        for upload_field, (file_field, purpose) in self.upload_fields.items():
+            upload_id = attrs.pop(upload_field, None)
+            if upload_id is None:
+                continue
+            upload = ChunkedUpload.objects.filter(
+                pk=upload_id, owner=user, purpose=purpose, status=ChunkedUpload.StatusChoices.COMPLETE
+            ).first()
+            if upload is None:
+                raise serializers.ValidationError({upload_field: "上传不存在或尚未完成。"})
+            self._pending_uploads[file_field] = upload
+
+        if self.instance is None:
+            for upload_field, (file_field, _) in self.upload_fields.items():
+                if not attrs.get(file_field) and file_field not in self._pending_uploads \
+                        and not self.Meta.model._meta.get_field(file_field).blank:
+                    raise serializers.ValidationError({file_field: f"请上传文件或提供 {upload_field}。"})
+        return attrs
+
+    def _attach_uploads(self, validated_data):
+        for file_field, upload in getattr(self, '_pending_uploads', {}).items():
+            validated_data[file_field] = upload_service.attach_upload(upload, self.Meta.model, file_field)
+        self._pending_uploads = {}
+
+    def create(self, validated_data):
+        self._attach_uploads(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._attach_uploads(validated_data)
+        return super().update(instance, validated_data)
+
+
+class CertificationRequestSerializer(ChunkedUploadAttachMixin, serializers.ModelSerializer):
+    certificationFileUploadId = serializers.UUIDField(write_only=True, required=False)
+    upload_fields = {'certificationFileUploadId': ('certificationFile', ChunkedUpload.PurposeChoices.CERTIFICATION)}
+
     class Meta:
         model = CertificationRequest
-        fields = ['id', 'applicant', 'status', 'certificationFile', 'notes', 'submissionDate']
+        fields = ['id', 'applicant', 'status', 'certificationFile', 'certificationFileUploadId', 'notes', 'submissionDate']
         read_only_fields = ['id', 'applicant', 'status', 'submissionDate']
+        extra_kwargs = {'certificationFile': {'required': False}}
 
     def validate(self, attrs):
         # 检查用户是否已有待处理的申请
         user = self.context['request'].user
         if CertificationRequest.objects.filter(applicant=user, status='pending').exists():
             raise serializers.ValidationError("You already have a pending certification request.")
-        return attrs
+        return super().validate(attrs)
     
 class UserSummarySerializer(serializers.ModelSerializer):
     """用于嵌套在其他模型中的简化版用户信息"""
+    avatarSrcset = ImageSrcsetField(source='avatarUrl', profile='avatar')
     class Meta:
         model = User
-        fields = ['id', 'nickname', 'avatarUrl']
+        fields = ['id', 'nickname', 'avatarUrl', 'avatarSrcset']
+        list_serializer_class = SrcsetListSerializer
 
 # ===============================================
 # =======         课程模块 Serializers     =======
@@ -283,13 +443,15 @@ class ExerciseStudentSerializer(serializers.ModelSerializer):
     """【學生版】練習題序列化器 (安全，且包含用戶提交記錄)"""
     options = OptionStudentSerializer(many=True, read_only=True)
     user_submission = serializers.SerializerMethodField()
+    imageSrcset = ImageSrcsetField(source='image_upload', profile='exercise')
 
     class Meta:
         model = Exercise
         fields = [
-            'id', 'type', 'prompt', 'image_upload', 
+            'id', 'type', 'prompt', 'image_upload', 'imageSrcset',
             'image_url', 'options', 'user_submission'
         ]
+        list_serializer_class = SrcsetListSerializer
 
     def get_user_submission(self, obj):
         request = self.context.get('request', None)
@@ -321,12 +483,14 @@ class CourseListSerializer(serializers.ModelSerializer):
     chapterCount = serializers.IntegerField(source='chapters.count', read_only=True)
     followers_count = serializers.SerializerMethodField()
     display_tags = serializers.StringRelatedField(many=True, source='tags', read_only=True) 
+    coverImageSrcset = ImageSrcsetField(source='coverImage', profile='cover')
 
     class Meta:
         model = Course
-        fields = ['id', 'title', 'description', 'coverImage', 
+        fields = ['id', 'title', 'description', 'coverImage', 'coverImageSrcset',
                   'author', 'display_tags', 'chapterCount', 
                   'created_at', 'status', 'followers_count']
+        list_serializer_class = SrcsetListSerializer
     
     def get_followers_count(self, obj):
         return obj.collectors.count() + obj.subscribers.count()
@@ -441,10 +605,80 @@ class ExerciseAdminSerializer(serializers.ModelSerializer):
             return FillInBlankAnswerAdminSerializer(obj.fill_in_blanks.all(), many=True).data
         return None
 
+# ==============================================================================
+# F. 離線增量同步序列化器 (扁平結構，不含答案)
+# ==============================================================================
+
+class SyncChapterSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Chapter
+        fields = ['id', 'title', 'order', 'videoUrl', 'updated_at']
+
+class SyncExerciseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Exercise
+        fields = ['id', 'chapter', 'type', 'prompt', 'image_upload', 'image_url', 'updated_at']
+
+class SyncOptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Option
+        fields = ['id', 'exercise', 'text', 'updated_at']
+
+class CourseChangesSerializer(serializers.Serializer):
+    """課程內容增量同步結果 (由 services.sync 生成)"""
+    SERIALIZERS = {
+        'chapter': SyncChapterSerializer,
+        'exercise': SyncExerciseSerializer,
+        'option': SyncOptionSerializer,
+    }
+
+    def to_representation(self, instance):
+        data = {
+            'cursor': instance['cursor'],
+            'has_more': instance['has_more'],
+            'full': instance.get('full', False),
+        }
+        for kind, serializer_class in self.SERIALIZERS.items():
+            data[f'{kind}s'] = {
+                'upserted': serializer_class(instance['upserted'][kind], many=True, context=self.context).data,
+                'deleted': instance['deleted'][kind],
+            }
+        return data
+
 # ===============================================
 # =======         画廊模块 Serializers     =======
 # ===============================================
 
+def gallery_followers_counts(item_ids):
+    """
+    作品的关注人数 (收藏人数 + 下载过的用户数)，只统计给定的作品：
+    按作品分组读取两张关系表，不在列表查询上对整个画廊做 GROUP BY。
+    """
+    counts = dict.fromkeys(item_ids, 0)
+    if not counts:
+        return counts
+    collections = (
+        GalleryCollection.objects.filter(gallery_item_id__in=item_ids)
+        .values_list('gallery_item_id').annotate(count=Count('pk')).order_by()
+    )
+    downloads = (
+        GalleryDownloadRecord.objects.filter(gallery_item_id__in=item_ids)
+        .values_list('gallery_item_id').annotate(count=Count('user', distinct=True)).order_by()
+    )
+    for rows in (collections, downloads):
+        for item_id, count in rows:
+            counts[item_id] += count
+    return counts
+
+
+class GalleryFollowersListSerializer(SrcsetListSerializer):
+    """列表序列化时一次取回整页作品的关注人数 (两条分组查询)"""
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child._followers_counts = gallery_followers_counts([item.pk for item in items])
+        return super().to_representation(items)
+
+
 class GalleryListSerializer(serializers.ModelSerializer):
     """用于画廊作品列表的序列化器"""
     author = UserSummarySerializer(read_only=True)
@@ -452,17 +686,24 @@ class GalleryListSerializer(serializers.ModelSerializer):
     followers_count = serializers.SerializerMethodField()
     is_collected = serializers.SerializerMethodField()
     is_downloaded = serializers.SerializerMethodField()
+    coverImageSrcset = ImageSrcsetField(source='coverImage', profile='cover')
     
     class Meta:
         model = GalleryItem
         fields = [
-            'id', 'title', 'description', 'coverImage', 'author', 'created_at',
-            'display_tags', 'requiredPoints', 'rating', 'version', 'followers_count',
+            'id', 'title', 'description', 'coverImage', 'coverImageSrcset', 'author', 'created_at',
+            'display_tags', 'requiredPoints', 'rating', 'rating_count', 'version', 'followers_count',
             'is_collected','is_downloaded'
         ]
+        list_serializer_class = GalleryFollowersListSerializer
 
     def get_followers_count(self, obj):
-        return obj.annotated_collectors_count + obj.annotated_downloaders_count
+        counts = getattr(self, '_followers_counts', None) or {}
+        if obj.pk not in counts:
+            # 单个对象序列化 (详情) 时没有整页预取
+            counts = {**counts, **gallery_followers_counts([obj.pk])}
+            self._followers_counts = counts
+        return counts[obj.pk]
     def get_is_collected(self, obj):
         return getattr(obj, 'annotated_is_collected', False)
     def get_is_downloaded(self, obj):
@@ -480,8 +721,47 @@ class GalleryDetailSerializer(GalleryListSerializer):
     """
     用于画廊作品详情的序列化器，并包含当前用户的下载，收藏状态
     """
+    # 作品文件不返回存储路径，只给有权下载的用户 (下载过的用户、作者) 返回签名下载链接
+    workFileUrl = serializers.SerializerMethodField()
+
     class Meta(GalleryListSerializer.Meta):
-        fields = GalleryListSerializer.Meta.fields + ['workFile']
+        fields = GalleryListSerializer.Meta.fields + ['workFileUrl']
+
+    def get_workFileUrl(self, obj):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if not obj.workFile or user is None or not user.is_authenticated:
+            return None
+        if obj.author_id != user.pk and not getattr(obj, 'annotated_is_downloaded', False):
+            return None
+        return delivery_service.signed_gallery_file_url(request, obj, user)
+
+class GalleryVersionSerializer(serializers.Serializer):
+    """版本链中的一个版本 (数据来自 services/versions.py 的递归查询)"""
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    version = serializers.CharField(allow_null=True)
+    prerequisiteWork = serializers.IntegerField(allow_null=True)
+    created_at = serializers.DateTimeField()
+    depth = serializers.IntegerField()
+    is_current = serializers.BooleanField()
+    is_downloaded = serializers.BooleanField()
+
+class AccessCheckItemSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=access_service.TYPES)
+    id = serializers.IntegerField(min_value=1)
+
+
+class AccessCheckSerializer(serializers.Serializer):
+    """批量查询访问状态：{"items": [{"type": "course", "id": 1}, {"type": "gallery", "id": 2}]}"""
+    items = serializers.ListField(
+        child=AccessCheckItemSerializer(), allow_empty=False, max_length=access_service.MAX_ITEMS
+    )
+
+
+class GalleryRatingSerializer(serializers.Serializer):
+    """用户对画廊作品的评分 (1-5)"""
+    rating = serializers.IntegerField(min_value=1, max_value=5)
 
 # ===============================================
 # =======         社群模块 Serializers     =======
@@ -491,17 +771,18 @@ class CommunityListSerializer(serializers.ModelSerializer):
     founder = UserSummarySerializer(read_only=True)
     post_count = serializers.SerializerMethodField()
     tags = serializers.StringRelatedField(many=True, read_only=True)
-    
+    coverImageSrcset = ImageSrcsetField(source='coverImage', profile='cover')
 
     class Meta:
         model = Community
-        fields = ['id', 'name', 'description', 'founder', 'coverImage', 'tags', 'post_count'] 
+        fields = ['id', 'name', 'description', 'founder', 'coverImage', 'coverImageSrcset', 'tags', 'post_count'] 
+        list_serializer_class = SrcsetListSerializer
 
     def get_post_count(self, obj):
         return obj.posts.filter(status='published').count()
 
 
-class CommunityPostListSerializer(serializers.ModelSerializer):
+class CommunityPostListSerializer(LikeStateMixin, serializers.ModelSerializer):
     """
     【第二级页面使用】：用于展示“特定社群下的帖子列表” (/communities/<id>/posts/)
     """
@@ -510,14 +791,16 @@ class CommunityPostListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CommunityPost
-        fields = ['id', 'title', 'author', 'rewardPoints', 'created_at', 'reply_count','community']
+        fields = ['id', 'title', 'author', 'rewardPoints', 'created_at', 'reply_count','community',
+                  'likes_count', 'liked_by_me']
+        list_serializer_class = LikeStateListSerializer
 
     def get_reply_count(self, obj):
         # 计算该帖子下的回复总数
         return obj.replies.count()
 
 
-class CommunityReplySerializer(serializers.ModelSerializer):
+class CommunityReplySerializer(LikeStateMixin, serializers.ModelSerializer):
     """
     【第三级页面使用】：用于嵌套在帖子详情中，展示单个回帖
     """
@@ -525,16 +808,18 @@ class CommunityReplySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CommunityReply
-        fields = ['id', 'author', 'content', 'created_at']
+        fields = ['id', 'author', 'content', 'created_at', 'likes_count', 'liked_by_me']
+        list_serializer_class = LikeStateListSerializer
 
 
-class CommunityPostDetailSerializer(serializers.ModelSerializer):
+class CommunityPostDetailSerializer(LikeStateMixin, serializers.ModelSerializer):
     """
     【第三级页面使用】：用于“帖子详情页” (/communities/posts/<id>/)
+    回复只返回第一页和下一页的游标链接，后续页面请求回复列表接口。
     """
     author = UserSummarySerializer(read_only=True)
-    # 嵌套导入该帖子下的所有回帖
-    replies = CommunityReplySerializer(many=True, read_only=True)
+    replies = serializers.SerializerMethodField()
+    best_answer_reply = serializers.SerializerMethodField()
     
     class Meta:
         model = CommunityPost
@@ -542,10 +827,48 @@ class CommunityPostDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'content', 'author', 'status', 
             'rewardPoints', 'created_at', 'updated_at', 
+            'likes_count', 'liked_by_me',
             'best_answer', # 最佳答案的 ID
-            'replies'      # 嵌套的回复列表
+            'best_answer_reply', # 置顶的最佳答案 (随帖子一起 select_related 取出)
+            'replies'      # 第一页回复: {"results": [...], "next": "...replies/?cursor=..."}
         ]
 
+    def _serialized_replies(self, obj):
+        """第一页回复和最佳答案一起序列化，点赞状态只取一次"""
+        cached = getattr(self, '_replies_cache', None)
+        if cached is not None and cached[0] == obj.pk:
+            return cached[1]
+
+        request = self.context.get('request')
+        paginator = ReplyCursorPagination()
+        queryset = obj.replies.select_related('author')
+        if request is not None:
+            page = paginator.paginate_queryset(queryset, request)
+            # 下一页链接指向回复列表接口，而不是帖子详情
+            paginator.base_url = request.build_absolute_uri(reverse('post-reply-list', kwargs={
+                'community_pk': obj.community_id, 'post_post_pk': obj.pk,
+            }))
+            next_link = paginator.get_next_link()
+        else:
+            page = list(queryset.order_by(*paginator.ordering)[:paginator.page_size])
+            next_link = None
+
+        best_answer = obj.best_answer if obj.best_answer_id else None
+        items = ([best_answer] if best_answer is not None else []) + list(page)
+        data = CommunityReplySerializer(items, many=True, context=self.context).data
+        if best_answer is not None:
+            result = {'best_answer': data[0], 'replies': {'results': data[1:], 'next': next_link}}
+        else:
+            result = {'best_answer': None, 'replies': {'results': data, 'next': next_link}}
+        self._replies_cache = (obj.pk, result)
+        return result
+
+    def get_replies(self, obj):
+        return self._serialized_replies(obj)['replies']
+
+    def get_best_answer_reply(self, obj):
+        return self._serialized_replies(obj)['best_answer']
+
 class CommunityPostCreateSerializer(serializers.ModelSerializer):
     """【发帖用】用于创作者提交新帖子的序列化器"""
     class Meta:
@@ -689,21 +1012,27 @@ class PointsTransactionSerializer(serializers.ModelSerializer):
         return None
 
 
-class CourseCreateSerializer(serializers.ModelSerializer):
+class CourseCreateSerializer(ChunkedUploadAttachMixin, serializers.ModelSerializer):
     """【创建课程用】的序列化器"""
     tags = TagsField(scope=Tag.TagScope.COURSE, required=False)
+    coverImageUploadId = serializers.UUIDField(write_only=True, required=False)
+    upload_fields = {'coverImageUploadId': ('coverImage', ChunkedUpload.PurposeChoices.COURSE_COVER)}
     class Meta:
         model = Course
-        fields = ['id', 'title', 'description', 'coverImage', 'tags', 'pricePoints', 'is_vip_free','status']
+        fields = ['id', 'title', 'description', 'coverImage', 'coverImageUploadId', 'tags', 'pricePoints', 'is_vip_free','status']
         read_only_fields = ['id','status']
 
-class GalleryItemCreateSerializer(serializers.ModelSerializer):
+class GalleryItemCreateSerializer(ChunkedUploadAttachMixin, serializers.ModelSerializer):
     """【创建作品用】的序列化器"""
     tags = TagsField(scope=Tag.TagScope.GALLERY, required=False)
+    workFileUploadId = serializers.UUIDField(write_only=True, required=False)
+    upload_fields = {'workFileUploadId': ('workFile', ChunkedUpload.PurposeChoices.GALLERY_WORK)}
     class Meta:
         model = GalleryItem
-        fields = ['id','title', 'description', 'coverImage', 'workFile', 'tags', 'requiredPoints', 'prerequisiteWork', 'version', 'is_vip_free','status']
+        fields = ['id','title', 'description', 'coverImage', 'workFile', 'workFileUploadId', 'tags', 'requiredPoints', 'prerequisiteWork', 'version', 'is_vip_free','status']
         read_only_fields = ['id','status']
+        # 作品文件不在响应中返回 (不公开的存储没有可访问的 URL)，下载走签名链接
+        extra_kwargs = {'workFile': {'required': False, 'write_only': True}}
 
 class CommunityCreateSerializer(serializers.ModelSerializer):
     """【创建社群用】的序列化器 """
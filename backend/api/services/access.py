@@ -0,0 +1,102 @@
+from ..models import Course, GalleryItem
+from . import entitlements as entitlement_service
+
+# -----------------------------------------------------------------------------
+# 批量访问状态服务 (目录页 / 搜索结果的卡片角标)
+# 一次请求最多 MAX_ITEMS 个 (类型, id)，查询次数固定：课程、作品各一条查询，
+# 订阅 / 下载状态走 entitlements 的 Redis 集合，VIP 和积分余额直接读已加载的 request.user。
+# 每个结果是一个位掩码整数，前端按 FLAGS 解读。
+# -----------------------------------------------------------------------------
+
+MAX_ITEMS = 300
+
+COURSE = 'course'
+GALLERY = 'gallery'
+TYPES = (COURSE, GALLERY)
+
+FOUND = 1              # 对象存在且当前用户可见
+OWNED = 1 << 1         # 当前用户是作者
+ACQUIRED = 1 << 2      # 已订阅 (课程) / 已下载 (作品)
+FREE = 1 << 3          # 价格为 0
+VIP_FREE = 1 << 4      # VIP 免费且当前用户是 VIP
+AFFORDABLE = 1 << 5    # 积分余额足够支付
+PREREQUISITE_MET = 1 << 6  # 没有前置要求，或已下载前置作品
+
+FLAGS = {
+    'FOUND': FOUND,
+    'OWNED': OWNED,
+    'ACQUIRED': ACQUIRED,
+    'FREE': FREE,
+    'VIP_FREE': VIP_FREE,
+    'AFFORDABLE': AFFORDABLE,
+    'PREREQUISITE_MET': PREREQUISITE_MET,
+}
+
+_SOURCES = {
+    COURSE: (Course, 'pricePoints', entitlement_service.COURSES),
+    GALLERY: (GalleryItem, 'requiredPoints', entitlement_service.GALLERY),
+}
+
+
+def _visible_rows(kind, ids, user_id):
+    """一条查询取出需要的列；未发布的对象只对作者本人可见"""
+    model, price_field, _ = _SOURCES[kind]
+    columns = ['id', 'author_id', 'status', 'is_vip_free', price_field]
+    if kind == GALLERY:
+        columns.append('prerequisiteWork_id')
+    rows = model.objects.filter(pk__in=ids).values(*columns)
+    return {
+        row['id']: row for row in rows
+        if row['status'] == model.StatusChoices.PUBLISHED or row['author_id'] == user_id
+    }
+
+
+def check_access(user, items):
+    """
+    [公共] items 为 [(类型, id), ...]，返回与之一一对应的位掩码列表。
+    """
+    authenticated = user is not None and user.is_authenticated
+    user_id = user.pk if authenticated else None
+    is_vip = authenticated and user.is_vip
+    balance = user.currentPoints if authenticated else 0
+
+    ids_by_kind = {kind: {obj_id for item_kind, obj_id in items if item_kind == kind} for kind in TYPES}
+    rows_by_kind = {
+        kind: _visible_rows(kind, ids, user_id) if ids else {}
+        for kind, ids in ids_by_kind.items()
+    }
+
+    # 前置作品的下载状态和作品本身一起查
+    prerequisites = {
+        row['prerequisiteWork_id'] for row in rows_by_kind[GALLERY].values() if row['prerequisiteWork_id']
+    }
+    acquired = {
+        COURSE: entitlement_service.owned_ids(user, entitlement_service.COURSES, list(rows_by_kind[COURSE])),
+        GALLERY: entitlement_service.owned_ids(
+            user, entitlement_service.GALLERY, list(set(rows_by_kind[GALLERY]) | prerequisites)
+        ),
+    }
+
+    result = []
+    for kind, obj_id in items:
+        row = rows_by_kind[kind].get(obj_id)
+        if row is None:
+            result.append(0)
+            continue
+        price = row[_SOURCES[kind][1]] or 0
+        flags = FOUND
+        if user_id is not None and row['author_id'] == user_id:
+            flags |= OWNED
+        if obj_id in acquired[kind]:
+            flags |= ACQUIRED
+        if price <= 0:
+            flags |= FREE
+        if row['is_vip_free'] and is_vip:
+            flags |= VIP_FREE
+        if authenticated and balance >= price:
+            flags |= AFFORDABLE
+        prerequisite = row.get('prerequisiteWork_id')
+        if prerequisite is None or prerequisite in acquired[GALLERY]:
+            flags |= PREREQUISITE_MET
+        result.append(flags)
+    return result
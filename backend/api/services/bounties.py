@@ -0,0 +1,141 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import BountyEscrow, CommunityPost, PointsTransaction
+from . import points as points_service
+
+# -----------------------------------------------------------------------------
+# 悬赏托管服务
+# 发帖时扣除的悬赏积分进入托管；采纳最佳答案时发放给回答者，
+# 到期未采纳的由定时任务按 (status, expires_at) 索引分批找出，批量退回给发帖人；
+# 帖子被删除时托管中的积分立即退回。
+# -----------------------------------------------------------------------------
+
+
+def hold(post: CommunityPost, payer, amount):
+    """[公共] 发布悬赏帖子时调用：扣除积分并创建托管记录 (需在事务中调用)。"""
+    points_service.adjust_points(
+        user=payer,
+        amount=-amount,
+        transaction_type=PointsTransaction.TransactionType.BOUNTY_POST,
+        description=f"发布悬赏帖子: {post.title}",
+        related_object=post,
+    )
+    return BountyEscrow.objects.create(
+        post=post,
+        payer=payer,
+        amount=amount,
+        expires_at=timezone.now() + timedelta(days=settings.BOUNTY_ESCROW_DAYS),
+    )
+
+
+@transaction.atomic
+def award(post: CommunityPost, winner):
+    """
+    [公共] 采纳最佳答案时调用，返回实际发放的积分。
+    - 托管已过期退回 (或从未托管) 时不发放；已到期但退款任务还没处理的，直接退回给发帖人；
+    - 发帖人采纳自己的回答时，托管积分退回给发帖人。
+    """
+    escrow = BountyEscrow.objects.select_for_update().filter(post=post).first()
+    if escrow is None or escrow.status != BountyEscrow.StatusChoices.HELD:
+        return 0
+
+    if escrow.expires_at <= timezone.now():
+        points_service.adjust_points(
+            user=escrow.payer,
+            amount=escrow.amount,
+            transaction_type=PointsTransaction.TransactionType.REFUND,
+            description=f"悬赏到期未采纳，积分退回: '{post.title}'",
+            related_object=post,
+        )
+        escrow.status = BountyEscrow.StatusChoices.REFUNDED
+        awarded = 0
+    elif winner.pk == escrow.payer_id:
+        points_service.adjust_points(
+            user=winner,
+            amount=escrow.amount,
+            transaction_type=PointsTransaction.TransactionType.REFUND,
+            description=f"悬赏退回 (采纳自己的回答): '{post.title}'",
+            related_object=post,
+        )
+        escrow.status = BountyEscrow.StatusChoices.REFUNDED
+        awarded = 0
+    else:
+        points_service.adjust_points(
+            user=winner,
+            amount=escrow.amount,
+            transaction_type=PointsTransaction.TransactionType.BOUNTY_AWARD,
+            description=f"赢得悬赏: '{post.title}'",
+            related_object=post,
+        )
+        escrow.status = BountyEscrow.StatusChoices.AWARDED
+        awarded = escrow.amount
+    escrow.settled_at = timezone.now()
+    escrow.save(update_fields=['status', 'settled_at'])
+    return awarded
+
+
+@transaction.atomic
+def refund_deleted(post: CommunityPost):
+    """
+    [公共] 帖子删除前调用 (pre_delete 信号)：托管中的积分退回给发帖人，返回退回的积分。
+    托管记录随后由 SET_NULL 与帖子解除关联，退款流水关联到托管记录。
+    """
+    escrow = BountyEscrow.objects.select_for_update().filter(post=post).first()
+    if escrow is None or escrow.status != BountyEscrow.StatusChoices.HELD:
+        return 0
+
+    points_service.adjust_points(
+        user=escrow.payer,
+        amount=escrow.amount,
+        transaction_type=PointsTransaction.TransactionType.REFUND,
+        description=f"悬赏帖子已删除，积分退回: '{post.title}'",
+        related_object=escrow,
+    )
+    escrow.status = BountyEscrow.StatusChoices.REFUNDED
+    escrow.settled_at = timezone.now()
+    escrow.save(update_fields=['status', 'settled_at'])
+    return escrow.amount
+
+
+def _refund_batch(now, batch_size):
+    with transaction.atomic():
+        # skip_locked：正在被采纳的托管跳过，由采纳流程结算
+        escrows = list(
+            BountyEscrow.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status=BountyEscrow.StatusChoices.HELD, expires_at__lte=now)
+            .select_related('post')
+            .order_by('expires_at')[:batch_size]
+        )
+        if not escrows:
+            return 0
+
+        points_service.bulk_adjust_points(
+            [
+                (escrow.payer_id, escrow.amount, f"悬赏到期未采纳，积分退回: '{escrow.post.title}'", escrow.post)
+                for escrow in escrows
+            ],
+            transaction_type=PointsTransaction.TransactionType.REFUND,
+        )
+        BountyEscrow.objects.filter(pk__in=[escrow.pk for escrow in escrows]).update(
+            status=BountyEscrow.StatusChoices.REFUNDED, settled_at=now
+        )
+    return len(escrows)
+
+
+def refund_expired(batch_size=None, max_batches=None):
+    """
+    [公共] 退回所有到期未采纳的悬赏 (由 Celery 定时任务调用)，返回退回的托管数。
+    每批一个事务；单次运行最多处理 max_batches 批，剩余的留给下一次。
+    """
+    batch_size = batch_size or settings.BOUNTY_REFUND_BATCH_SIZE
+    max_batches = max_batches or settings.BOUNTY_REFUND_MAX_BATCHES
+    now = timezone.now()
+    refunded = 0
+    for _ in range(max_batches):
+        count = _refund_batch(now, batch_size)
+        refunded += count
+        if count < batch_size:
+            break
+    return refunded
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.utils import timezone
+from ..models import Course, Chapter, Exercise, Option, CourseBundle, CourseContentChange
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 课程离线包服务
+# 离线包按 "内容版本" 缓存：版本由课程内容变更日志的最新游标和课程本身的
+# 更新时间组成，任意章节/练习/选项/封面变化都会得到一个新版本。
+# -----------------------------------------------------------------------------
+
+# 生成中的离线包超过这个时间仍未完成，视为 worker 已丢失，允许重新排队
+STALE_BUILD_AFTER = timedelta(hours=1)
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def get_content_version(course: Course) -> str:
+    """[公共] 计算课程当前的内容版本号。"""
+    latest_change = CourseContentChange.objects.filter(course_id=course.pk).aggregate(latest=Max('id'))['latest'] or 0
+    return f"{latest_change}-{int(course.updated_at.timestamp())}"
+
+
+def request_bundle(course: Course) -> CourseBundle:
+    """
+    [公共] 获取当前内容版本的离线包；不存在时创建记录并投递生成任务。
+    同一版本只会有一条记录 (唯一约束)，并发请求不会重复生成。
+    """
+    from ..tasks import build_course_bundle
+
+    bundle, created = CourseBundle.objects.get_or_create(
+        course=course,
+        content_version=get_content_version(course),
+    )
+
+    needs_build = created or bundle.status == CourseBundle.StatusChoices.FAILED or (
+        bundle.status == CourseBundle.StatusChoices.BUILDING
+        and bundle.created_at < timezone.now() - STALE_BUILD_AFTER
+    )
+    if needs_build:
+        if not created:
+            CourseBundle.objects.filter(pk=bundle.pk).update(
+                status=CourseBundle.StatusChoices.BUILDING, created_at=timezone.now()
+            )
+            bundle.status = CourseBundle.StatusChoices.BUILDING
+        transaction.on_commit(lambda: build_course_bundle.delay(bundle.pk))
+
+    return bundle
+
+
+def _copy_into_zip(zf, field_file, arcname):
+    """把存储中的文件按块写入 zip，不整体载入内存。"""
+    with field_file.storage.open(field_file.name, 'rb') as src, zf.open(arcname, 'w', force_zip64=True) as dst:
+        shutil.copyfileobj(src, dst, COPY_BLOCK_SIZE)
+
+
+def _media_arcname(prefix, field_file):
+    return f"media/{prefix}/{os.path.basename(field_file.name)}"
+
+
+def _build_manifest_and_media(course, zf):
+    chapters = Chapter.objects.filter(course=course).order_by('order').prefetch_related(
+        Prefetch('exercises', queryset=Exercise.objects.order_by('pk').prefetch_related(
+            Prefetch('options', queryset=Option.objects.order_by('pk'))
+        ))
+    )
+
+    cover = None
+    if course.coverImage:
+        cover = _media_arcname('cover', course.coverImage)
+        _copy_into_zip(zf, course.coverImage, cover)
+
+    manifest_chapters = []
+    for chapter in chapters:
+        manifest_exercises = []
+        for exercise in chapter.exercises.all():
+            image = None
+            if exercise.image_upload:
+                image = _media_arcname(f'exercises/{exercise.pk}', exercise.image_upload)
+                _copy_into_zip(zf, exercise.image_upload, image)
+            manifest_exercises.append({
+                'id': exercise.pk,
+                'type': exercise.type,
+                'prompt': exercise.prompt,
+                'image': image,
+                'image_url': exercise.image_url,
+                # 与学生端 API 一致，不包含正确答案
+                'options': [{'id': option.pk, 'text': option.text} for option in exercise.options.all()],
+            })
+        manifest_chapters.append({
+            'id': chapter.pk,
+            'title': chapter.title,
+            'order': chapter.order,
+            'videoUrl': chapter.videoUrl,
+            'exercises': manifest_exercises,
+        })
+
+    return {
+        'course': {
+            'id': course.pk,
+            'title': course.title,
+            'description': course.description,
+            'cover': cover,
+        },
+        'chapters': manifest_chapters,
+    }
+
+
+def build_bundle(bundle: CourseBundle):
+    """
+    [公共] 生成离线包 (由 Celery 任务调用)。
+    先写到本地临时文件，再整体保存到存储，最后清理同课程更早的已就绪离线包。
+    """
+    course = bundle.course
+    tmp = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
+    try:
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_STORED) as zf:
+            manifest = _build_manifest_and_media(course, zf)
+            manifest['content_version'] = bundle.content_version
+            manifest['generated_at'] = timezone.now().isoformat()
+            zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2),
+                        compress_type=zipfile.ZIP_DEFLATED)
+        tmp.close()
+
+        with open(tmp.name, 'rb') as fp:
+            bundle.bundle_file.save(f"course_{course.pk}_{bundle.content_version}.zip", File(fp), save=False)
+        bundle.size_bytes = os.path.getsize(tmp.name)
+    finally:
+        tmp.close()
+        os.unlink(tmp.name)
+
+    bundle.status = CourseBundle.StatusChoices.READY
+    bundle.built_at = timezone.now()
+    bundle.save(update_fields=['bundle_file', 'size_bytes', 'status', 'built_at'])
+
+    # 只清理比这一个更早请求的已就绪版本：生成中的和更新的版本可能还在被别的任务写入，
+    # 旧任务晚完成时也不能删掉新版本
+    stale = CourseBundle.objects.filter(course=course, status=CourseBundle.StatusChoices.READY, pk__lt=bundle.pk)
+    for old in stale:
+        if old.bundle_file:
+            old.bundle_file.delete(save=False)
+        old.delete()
+
+    return bundle
@@ -0,0 +1,219 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+# -----------------------------------------------------------------------------
+# 文件下发服务
+# 为离线包、作品文件等大文件提供 HTTP Range (断点续传) 支持；
+# 配置了 SENDFILE_BACKEND 时把字节传输交给前端 Web 服务器 (nginx / Apache)。
+# -----------------------------------------------------------------------------
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+DOWNLOAD_SIGNING_SALT = 'api.delivery.download'
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Range 请求头合法但超出文件范围 (416)。"""
+
+
+def parse_range_header(header, size):
+    """
+    解析单段 Range 请求头，返回闭区间 (start, end)。
+    - 没有 Range 头、格式不识别或多段 Range 时返回 None (按完整文件响应，RFC 7233 允许)
+    - 区间完全落在文件之外时抛出 RangeNotSatisfiable
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # bytes=-500：最后 500 字节
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+class RangedFileWrapper:
+    """按块读取文件的指定区间，不会把整个区间载入内存。"""
+
+    def __init__(self, file_obj, start, length, block_size=STREAM_BLOCK_SIZE):
+        self.file_obj = file_obj
+        self.remaining = length
+        self.block_size = block_size
+        self.file_obj.seek(start)
+
+    def __iter__(self):
+        try:
+            while self.remaining > 0:
+                data = self.file_obj.read(min(self.block_size, self.remaining))
+                if not data:
+                    break
+                self.remaining -= len(data)
+                yield data
+        finally:
+            self.close()
+
+    def close(self):
+        if hasattr(self.file_obj, 'close'):
+            self.file_obj.close()
+
+
+def if_range_matches(request, etag=None, last_modified=None):
+    """
+    判断 If-Range 条件是否成立 (RFC 7233 3.2)。
+    不成立说明客户端手上的部分内容已过期，应忽略 Range 返回完整文件。
+    """
+    header = request.META.get('HTTP_IF_RANGE')
+    if not header:
+        return True
+    header = header.strip()
+
+    if header.startswith('"') or header.startswith('W/'):
+        # If-Range 只允许强校验，弱 ETag 一律视为不匹配
+        return etag is not None and not header.startswith('W/') and header == etag
+
+    if last_modified is None:
+        return False
+    since = parse_http_date_safe(header)
+    return since is not None and int(last_modified) == since
+
+
+def _set_validators(response, etag, last_modified):
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+
+
+def ranged_file_response(request, file_obj, size, filename, content_type=None, etag=None, last_modified=None):
+    """
+    [公共] 返回支持 Range / If-Range 的文件响应。
+    - 无 Range (或 If-Range 不匹配)：FileResponse (可由 WSGI 服务器的 file_wrapper 零拷贝发送)
+    - 单段 Range：206 + Content-Range，仅流式读取请求的区间
+    - 越界：416
+    etag 需带双引号；last_modified 为 Unix 时间戳。
+    """
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    try:
+        byte_range = None
+        if if_range_matches(request, etag, last_modified):
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        file_obj.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(file_obj, as_attachment=True, filename=filename, content_type=content_type)
+        response['Content-Length'] = str(size)
+        response['Accept-Ranges'] = 'bytes'
+        _set_validators(response, etag, last_modified)
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        RangedFileWrapper(file_obj, start, length),
+        status=206,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def _sendfile_response(field_file, filename, content_type, backend):
+    """
+    (内部使用) 只返回响应头，由前端 Web 服务器读取并发送文件。
+    Range / If-Range 也由 Web 服务器处理，gunicorn worker 立即释放。
+    """
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    if backend == 'nginx':
+        # nginx 需要 internal location 把 SENDFILE_URL_PREFIX 映射到 MEDIA_ROOT、
+        # SENDFILE_PROTECTED_URL_PREFIX 映射到 PROTECTED_MEDIA_ROOT (作品文件等不公开的文件)
+        protected = os.path.abspath(field_file.storage.location) == os.path.abspath(settings.PROTECTED_MEDIA_ROOT)
+        prefix = (settings.SENDFILE_PROTECTED_URL_PREFIX if protected else settings.SENDFILE_URL_PREFIX).rstrip('/')
+        response['X-Accel-Redirect'] = f"{prefix}/{quote(field_file.name)}"
+    else:
+        response['X-Sendfile'] = field_file.path
+    return response
+
+
+def serve_file(request, field_file, filename, content_type=None, etag=None, last_modified=None, size=None):
+    """
+    [公共] 下发 FileField 中的文件。
+    SENDFILE_BACKEND 为 'nginx' (X-Accel-Redirect) 或 'xsendfile' (X-Sendfile) 时交给 Web 服务器，
+    未配置时退回到本进程内的 ranged_file_response。
+    已知文件大小时传入 size，可省去一次存储查询。
+    """
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    backend = getattr(settings, 'SENDFILE_BACKEND', None)
+    if backend in ('nginx', 'xsendfile'):
+        return _sendfile_response(field_file, filename, content_type, backend)
+
+    return ranged_file_response(
+        request, field_file.open('rb'), field_file.size if size is None else size, filename,
+        content_type=content_type, etag=etag, last_modified=last_modified,
+    )
+
+
+def make_download_token(payload):
+    """[公共] 为下载链接生成带时间戳的签名令牌。"""
+    return signing.TimestampSigner(salt=DOWNLOAD_SIGNING_SALT).sign_object(payload, compress=True)
+
+
+def read_download_token(token):
+    """
+    [公共] 校验下载令牌并返回其中的数据。
+    签名无效或超过 DOWNLOAD_URL_MAX_AGE 秒时返回 None。
+    """
+    if not token:
+        return None
+    try:
+        return signing.TimestampSigner(salt=DOWNLOAD_SIGNING_SALT).unsign_object(
+            token, max_age=settings.DOWNLOAD_URL_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+
+
+def signed_gallery_file_url(request, work, user, delta=None):
+    """
+    [公共] 生成画廊作品文件 (或差分补丁) 短期有效的签名下载链接。令牌绑定作品、用户和当前文件，
+    持有者在有效期内重复请求 (包括断点续传) 不再经过积分 / 下载记录检查，调用方必须先确认用户有权下载。
+    """
+    if delta is not None:
+        token_payload = {'w': work.pk, 'u': user.pk, 'd': delta.pk, 'f': delta.patch_file.name}
+    else:
+        token_payload = {'w': work.pk, 'u': user.pk, 'f': work.workFile.name}
+    url = reverse('gallery-item-file', kwargs={'pk': work.pk})
+    return request.build_absolute_uri(f"{url}?token={make_download_token(token_payload)}")
@@ -0,0 +1,276 @@
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import zipfile
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from ..models import GalleryItem, GalleryItemDelta
+from . import file_metadata as file_metadata_service
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 作品版本差分服务
+#
+# 补丁格式 (大端序)：
+#   头部  b'BMDELTA1' | 旧文件大小 Q | 新文件大小 Q | 旧文件 SHA-256 (32 字节)
+#   指令  b'C' | 旧文件偏移 Q | 长度 Q            从旧文件复制一段
+#         b'D' | 长度 Q | 数据                     直接写入补丁中携带的数据
+#   结尾  b'E' | 新文件 SHA-256 (32 字节)           客户端还原后校验
+#
+# 作品大多是 zip 包：按 (文件名, CRC, 大小, 压缩方式) 匹配没有变化的成员，
+# 直接复制其压缩数据；不是 zip 时按固定块对齐比较。
+# 逐字节滚动哈希 (rsync/bsdiff) 在 Python 中处理 GB 级文件太慢，这里不采用。
+# -----------------------------------------------------------------------------
+
+MAGIC = b'BMDELTA1'
+OP_COPY = b'C'
+OP_DATA = b'D'
+OP_END = b'E'
+
+# 比这个更短的相同片段不值得单独生成复制指令
+MIN_COPY_LENGTH = 4096
+# 非 zip 文件的比较块大小
+BLOCK_SIZE = 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+_ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+class DeltaError(Exception):
+    """补丁格式错误或还原结果校验失败。"""
+
+
+# --- 生成 -------------------------------------------------------------------
+
+def _zip_members(fp):
+    """
+    返回 zip 中每个成员压缩数据所在的区间：[(key, data_start, length), ...]，按偏移排序。
+    key 相同说明压缩数据完全相同。
+    """
+    members = []
+    with zipfile.ZipFile(fp) as zf:
+        for info in sorted(zf.infolist(), key=lambda i: i.header_offset):
+            fp.seek(info.header_offset)
+            header = _ZIP_LOCAL_HEADER.unpack(fp.read(_ZIP_LOCAL_HEADER.size))
+            name_length, extra_length = header[-2], header[-1]
+            data_start = info.header_offset + _ZIP_LOCAL_HEADER.size + name_length + extra_length
+            key = (info.filename, info.CRC, info.compress_size, info.file_size, info.compress_type)
+            members.append((key, data_start, info.compress_size))
+    return members
+
+
+def _zip_copy_ranges(source_fp, target_fp):
+    """zip 成员级匹配：返回 [(target_offset, source_offset, length), ...]"""
+    source_members = {key: start for key, start, _ in _zip_members(source_fp)}
+    ranges = []
+    for key, start, length in _zip_members(target_fp):
+        if length >= MIN_COPY_LENGTH and key in source_members:
+            ranges.append((start, source_members[key], length))
+    return ranges
+
+
+def _block_copy_ranges(source_fp, target_fp):
+    """固定块匹配：新文件中与旧文件某个对齐块完全相同的块直接复制。"""
+    source_blocks = {}
+    source_fp.seek(0)
+    offset = 0
+    for block in iter(lambda: source_fp.read(BLOCK_SIZE), b''):
+        source_blocks.setdefault(hashlib.sha256(block).digest(), (offset, len(block)))
+        offset += len(block)
+
+    ranges = []
+    target_fp.seek(0)
+    offset = 0
+    for block in iter(lambda: target_fp.read(BLOCK_SIZE), b''):
+        match = source_blocks.get(hashlib.sha256(block).digest())
+        if match is not None and match[1] == len(block):
+            ranges.append((offset, match[0], len(block)))
+        offset += len(block)
+    return ranges
+
+
+def _find_copy_ranges(source_fp, target_fp):
+    try:
+        return _zip_copy_ranges(source_fp, target_fp)
+    except (zipfile.BadZipFile, struct.error):
+        return _block_copy_ranges(source_fp, target_fp)
+
+
+def _merge_ranges(ranges):
+    """合并首尾相接 (新旧文件中都连续) 的复制区间，减少指令数。"""
+    merged = []
+    for target_offset, source_offset, length in sorted(ranges):
+        if merged:
+            last_target, last_source, last_length = merged[-1]
+            if last_target + last_length == target_offset and last_source + last_length == source_offset:
+                merged[-1] = (last_target, last_source, last_length + length)
+                continue
+        merged.append((target_offset, source_offset, length))
+    return merged
+
+
+def _write_data(out, target_fp, start, length):
+    if length <= 0:
+        return
+    out.write(OP_DATA + struct.pack('>Q', length))
+    target_fp.seek(start)
+    remaining = length
+    while remaining:
+        chunk = target_fp.read(min(COPY_BUFFER_SIZE, remaining))
+        if not chunk:
+            raise DeltaError("新版本文件在生成补丁时被截断")
+        out.write(chunk)
+        remaining -= len(chunk)
+
+
+def write_delta(source_fp, target_fp, source_size, target_size, source_sha256, target_sha256, out):
+    """[公共] 生成从旧文件到新文件的补丁，写入 out (需可写的二进制文件对象)。"""
+    out.write(MAGIC + struct.pack('>QQ', source_size, target_size) + bytes.fromhex(source_sha256))
+
+    position = 0
+    for target_offset, source_offset, length in _merge_ranges(_find_copy_ranges(source_fp, target_fp)):
+        _write_data(out, target_fp, position, target_offset - position)
+        out.write(OP_COPY + struct.pack('>QQ', source_offset, length))
+        position = target_offset + length
+    _write_data(out, target_fp, position, target_size - position)
+
+    out.write(OP_END + bytes.fromhex(target_sha256))
+
+
+# --- 还原 (客户端算法的参考实现) ---------------------------------------------
+
+def apply_delta(source_fp, patch_fp, out):
+    """[公共] 用旧文件和补丁还原新文件，写入 out 并校验 SHA-256。"""
+    header = patch_fp.read(len(MAGIC) + 16 + 32)
+    if len(header) != len(MAGIC) + 48 or not header.startswith(MAGIC):
+        raise DeltaError("不是有效的补丁文件")
+    _, target_size = struct.unpack('>QQ', header[len(MAGIC):len(MAGIC) + 16])
+
+    hasher = hashlib.sha256()
+    written = 0
+
+    def emit(data):
+        nonlocal written
+        out.write(data)
+        hasher.update(data)
+        written += len(data)
+
+    while True:
+        op = patch_fp.read(1)
+        if op == OP_COPY:
+            source_offset, length = struct.unpack('>QQ', patch_fp.read(16))
+            source_fp.seek(source_offset)
+            reader = source_fp
+        elif op == OP_DATA:
+            (length,) = struct.unpack('>Q', patch_fp.read(8))
+            reader = patch_fp
+        elif op == OP_END:
+            expected = patch_fp.read(32)
+            if written != target_size or hasher.digest() != expected:
+                raise DeltaError("还原结果校验失败")
+            return written
+        else:
+            raise DeltaError("补丁文件已损坏")
+
+        while length:
+            chunk = reader.read(min(COPY_BUFFER_SIZE, length))
+            if not chunk:
+                raise DeltaError("补丁或旧版本文件不完整")
+            emit(chunk)
+            length -= len(chunk)
+
+
+# --- 调度 -------------------------------------------------------------------
+
+def request_delta(target: GalleryItem):
+    """
+    [公共] 新版本文件元数据算好后调用：为 (前一版本 -> 当前版本) 排队生成补丁。
+    两个文件都没变化且已有结果时不重复生成。
+    """
+    from ..tasks import build_gallery_delta
+
+    source = target.prerequisiteWork
+    if source is None:
+        return None
+    source_meta = file_metadata_service.get_current_metadata(source)
+    target_meta = file_metadata_service.get_current_metadata(target)
+    if source_meta is None or target_meta is None:
+        return None
+
+    delta, created = GalleryItemDelta.objects.get_or_create(
+        source=source, target=target,
+        defaults={'source_sha256': source_meta.sha256, 'target_sha256': target_meta.sha256},
+    )
+    unchanged = delta.source_sha256 == source_meta.sha256 and delta.target_sha256 == target_meta.sha256
+    if not created and unchanged and delta.status != GalleryItemDelta.StatusChoices.FAILED:
+        return delta
+
+    GalleryItemDelta.objects.filter(pk=delta.pk).update(
+        source_sha256=source_meta.sha256,
+        target_sha256=target_meta.sha256,
+        status=GalleryItemDelta.StatusChoices.BUILDING,
+    )
+    transaction.on_commit(lambda: build_gallery_delta.delay(delta.pk))
+    return delta
+
+
+def build_delta(delta: GalleryItemDelta):
+    """[公共] 生成补丁文件 (由 Celery 任务调用)。补丁不够小时标记为 UNPROFITABLE。"""
+    source, target = delta.source, delta.target
+    source_meta = file_metadata_service.get_current_metadata(source)
+    target_meta = file_metadata_service.get_current_metadata(target)
+    if (source_meta is None or target_meta is None
+            or source_meta.sha256 != delta.source_sha256 or target_meta.sha256 != delta.target_sha256):
+        # 文件在排队期间又变了，等新的元数据任务重新触发
+        return None
+
+    tmp = tempfile.NamedTemporaryFile(suffix='.delta', delete=False)
+    try:
+        with source.workFile.storage.open(source.workFile.name, 'rb') as source_fp, \
+                target.workFile.storage.open(target.workFile.name, 'rb') as target_fp:
+            write_delta(source_fp, target_fp, source_meta.size_bytes, target_meta.size_bytes,
+                        source_meta.sha256, target_meta.sha256, tmp)
+        tmp.close()
+        patch_size = os.path.getsize(tmp.name)
+
+        old_patch = delta.patch_file.name if delta.patch_file else None
+        delta.patch_size = patch_size
+        delta.built_at = timezone.now()
+        if patch_size > target_meta.size_bytes * settings.GALLERY_DELTA_MAX_RATIO:
+            delta.status = GalleryItemDelta.StatusChoices.UNPROFITABLE
+            delta.patch_file = None
+        else:
+            with open(tmp.name, 'rb') as fp:
+                delta.patch_file.save(f"{source.pk}_to_{target.pk}.delta", File(fp), save=False)
+            delta.status = GalleryItemDelta.StatusChoices.READY
+        delta.save(update_fields=['patch_file', 'patch_size', 'status', 'built_at'])
+
+        if old_patch and old_patch != (delta.patch_file.name if delta.patch_file else None):
+            delta.patch_file.storage.delete(old_patch)
+    finally:
+        tmp.close()
+        os.unlink(tmp.name)
+    return delta
+
+
+def get_usable_delta(base: GalleryItem, target: GalleryItem):
+    """[公共] 返回可以直接下发的补丁 (与两个版本当前的文件一致)，否则返回 None。"""
+    if target.prerequisiteWork_id != base.pk:
+        return None
+    delta = GalleryItemDelta.objects.filter(
+        source=base, target=target, status=GalleryItemDelta.StatusChoices.READY
+    ).first()
+    if delta is None or not delta.patch_file:
+        return None
+    source_meta = file_metadata_service.get_current_metadata(base)
+    target_meta = file_metadata_service.get_current_metadata(target)
+    if source_meta is None or target_meta is None:
+        return None
+    if (source_meta.sha256, target_meta.sha256) != (delta.source_sha256, delta.target_sha256):
+        return None
+    return delta
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+import uuid
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from ..models import Community, Subscription, GalleryDownloadRecord
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 用户权益索引服务
+# 每个用户订阅的课程 id、下载过的作品 id 分别保存在 Redis 集合中 (含哨兵成员，区分空集合和未加载)，
+# 订阅 / 下载记录增删时同步更新；未加载时从数据库整体加载一次。
+# 每次增删同时递增版本号：加载前记下版本号，写入时版本号变了说明读取数据库期间有提交，
+# 这份快照可能缺少那次变化，直接丢弃，下次访问重新加载。
+# VIP 状态直接取自请求中已经加载的 User (vip_expiration_date)，不需要额外存储。
+# 社群 -> 门禁目标 (关联课程 / 作品) 的映射缓存在进程内存中。
+# -----------------------------------------------------------------------------
+
+COURSES = 'courses'
+GALLERY = 'gallery'
+
+_SOURCES = {
+    COURSES: (Subscription, 'course_id'),
+    GALLERY: (GalleryDownloadRecord, 'gallery_item_id'),
+}
+
+SENTINEL = '-'
+SET_TTL = 60 * 60 * 24
+# 进程内社群门禁映射的有效期 (秒)；修改关联课程 / 作品后其他进程最多延迟这么久生效
+COMMUNITY_GATE_TTL = 60
+
+# 只在集合已加载时增删成员，未加载的集合保持未加载，下次访问时从数据库完整加载；
+# 无论是否已加载都递增版本号 (KEYS[2])，让正在进行的加载放弃
+_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    if ARGV[1] == 'add' then
+        redis.call('SADD', KEYS[1], ARGV[2])
+    else
+        redis.call('SREM', KEYS[1], ARGV[2])
+    end
+end
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+# 版本号 (KEYS[3]) 与加载前读到的 (ARGV[1]) 相同时才把临时键 (KEYS[1]) 改名为集合 (KEYS[2])
+_INSTALL_SCRIPT = """
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[1] or redis.call('RENAMENX', KEYS[1], KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+_community_gates = {}
+_community_gates_lock = threading.Lock()
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _key(user_id, kind):
+    return f"entitlements:{user_id}:{kind}"
+
+
+def _version_key(user_id, kind):
+    return f"{_key(user_id, kind)}:version"
+
+
+def _load(user_id, kind):
+    """
+    从数据库加载用户的一类权益，返回 id 集合。结果写入 Redis 时用 RENAMENX，已被其他请求加载时放弃；
+    读取期间版本号变化 (有订阅 / 下载记录提交) 时也放弃。
+    """
+    redis = _redis()
+    version = redis.get(_version_key(user_id, kind)) or b'0'
+    model, column = _SOURCES[kind]
+    ids = set(model.objects.filter(user_id=user_id).values_list(column, flat=True))
+
+    temp_key = f"{_key(user_id, kind)}:load:{uuid.uuid4().hex}"
+    pipe = redis.pipeline(transaction=False)
+    pipe.sadd(temp_key, SENTINEL, *ids)
+    pipe.expire(temp_key, SET_TTL)
+    pipe.execute()
+    install = redis.register_script(_INSTALL_SCRIPT)
+    install(keys=[temp_key, _key(user_id, kind), _version_key(user_id, kind)], args=[version])
+    return ids
+
+
+def owned_ids(user, kind, ids):
+    """
+    [公共] 返回 ids 中用户拥有的那些 (kind 为 COURSES 或 GALLERY)。
+    已加载时只有一次 pipeline；未加载时从数据库加载一次；Redis 不可用时直接查数据库。
+    """
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    if not ids or user is None or not user.is_authenticated:
+        return set()
+
+    key = _key(user.pk, kind)
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.exists(key)
+        for obj_id in ids:
+            pipe.sismember(key, obj_id)
+        results = pipe.execute()
+        if results[0]:
+            return {obj_id for obj_id, is_member in zip(ids, results[1:]) if is_member}
+        return _load(user.pk, kind) & set(ids)
+    except RedisError:
+        logger.warning("Entitlement cache unavailable, falling back to database", exc_info=True)
+        model, column = _SOURCES[kind]
+        return set(
+            model.objects.filter(user_id=user.pk, **{f"{column}__in": ids}).values_list(column, flat=True)
+        )
+
+
+def has(user, kind, obj_id):
+    """[公共] 用户是否拥有某一门课程 / 某一件作品"""
+    return obj_id in owned_ids(user, kind, [obj_id])
+
+
+def record_change(user_id, kind, obj_id, added):
+    """[公共] 订阅 / 下载记录创建或删除后调用 (见 signals.py)"""
+    try:
+        script = _redis().register_script(_UPDATE_SCRIPT)
+        script(
+            keys=[_key(user_id, kind), _version_key(user_id, kind)],
+            args=['add' if added else 'remove', obj_id, SET_TTL],
+        )
+    except RedisError:
+        # 更新失败时丢弃整个集合，避免之后读到过期的结果
+        logger.warning(f"Failed to update entitlement cache for user {user_id}", exc_info=True)
+        try:
+            pipe = _redis().pipeline(transaction=False)
+            pipe.delete(_key(user_id, kind))
+            pipe.incr(_version_key(user_id, kind))
+            pipe.execute()
+        except RedisError:
+            logger.error(f"Failed to drop entitlement cache for user {user_id}")
+
+
+def get_community_gate(community_id):
+    """
+    [公共] 返回社群的门禁目标 (related_course_id, related_gallery_item_id)，社群不存在时返回 None。
+    结果在进程内缓存 COMMUNITY_GATE_TTL 秒。
+    """
+    now = time.monotonic()
+    cached = _community_gates.get(community_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    gate = (
+        Community.objects.filter(pk=community_id)
+        .values_list('related_course_id', 'related_gallery_item_id')
+        .first()
+    )
+    with _community_gates_lock:
+        _community_gates[community_id] = (now + COMMUNITY_GATE_TTL, gate)
+    return gate
+
+
+def forget_community_gate(community_id):
+    """[公共] 社群保存 / 删除后清除本进程中的门禁映射"""
+    with _community_gates_lock:
+        _community_gates.pop(community_id, None)
+
+
+def can_post_in_community(user, community_id):
+    """
+    [公共] 用户能否在社群中发言：没有关联课程 / 作品的社群对所有人开放，
+    否则需要订阅了关联课程或下载过关联作品。社群不存在时返回 False。
+    """
+    gate = get_community_gate(community_id)
+    if gate is None:
+        return False
+    course_id, gallery_item_id = gate
+    if course_id is None and gallery_item_id is None:
+        return True
+    if course_id is not None and has(user, COURSES, course_id):
+        return True
+    if gallery_item_id is not None and has(user, GALLERY, gallery_item_id):
+        return True
+    return False
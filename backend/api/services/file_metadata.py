@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import zipfile
+from ..models import GalleryItem, GalleryFileMetadata, StoredFile
+from .uploads import sniff_mime
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 画廊作品文件元数据服务
+# 作品文件变化后由 Celery 任务计算一次 大小 / SHA-256 / MIME / 压缩包文件数，
+# 之后管理后台、下载接口和预计下载时间都直接读取 GalleryFileMetadata。
+# -----------------------------------------------------------------------------
+
+# 估算下载时间使用的带宽 (字节/秒)
+DOWNLOAD_RATE_BYTES_PER_SECOND = 3 * 1024 * 1024  # 3 MB/s
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _hash_file(field_file):
+    hasher = hashlib.sha256()
+    size = 0
+    with field_file.storage.open(field_file.name, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def _archive_entry_count(field_file):
+    """只读取 zip 的中央目录，不解压内容。"""
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as fp, zipfile.ZipFile(fp) as zf:
+            return sum(1 for info in zf.infolist() if not info.is_dir())
+    except zipfile.BadZipFile:
+        return None
+
+
+def compute_metadata(item: GalleryItem):
+    """
+    [公共] 计算并保存作品当前文件的元数据，同时更新 estimated_download_time。
+    去重存储中已记录 SHA-256 和大小的文件不再整体读取。
+    """
+    field_file = item.workFile
+    if not field_file:
+        GalleryFileMetadata.objects.filter(gallery_item=item).delete()
+        GalleryItem.objects.filter(pk=item.pk).update(estimated_download_time=0.0)
+        return None
+
+    stored = StoredFile.objects.select_related('blob').filter(name=field_file.name).first()
+    if stored is not None:
+        sha256, size = stored.blob.sha256, stored.blob.size
+    else:
+        sha256, size = _hash_file(field_file)
+
+    with field_file.storage.open(field_file.name, 'rb') as fp:
+        mime_type = sniff_mime(fp.read(16), field_file.name)
+
+    archive_entry_count = _archive_entry_count(field_file) if mime_type == 'application/zip' else None
+
+    metadata, _ = GalleryFileMetadata.objects.update_or_create(
+        gallery_item=item,
+        defaults={
+            'file_name': field_file.name,
+            'size_bytes': size,
+            'sha256': sha256,
+            'mime_type': mime_type,
+            'archive_entry_count': archive_entry_count,
+        },
+    )
+    # 用 update 写回，避免再次触发 save() 和文件变更信号
+    GalleryItem.objects.filter(pk=item.pk).update(
+        estimated_download_time=size / DOWNLOAD_RATE_BYTES_PER_SECOND if size else 0.0
+    )
+    return metadata
+
+
+def get_current_metadata(item: GalleryItem):
+    """[公共] 返回与作品当前文件一致的元数据；尚未计算或已过期时返回 None。"""
+    try:
+        metadata = item.file_metadata
+    except GalleryFileMetadata.DoesNotExist:
+        return None
+    if metadata.file_name != item.workFile.name:
+        return None
+    return metadata
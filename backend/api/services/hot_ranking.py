@@ -0,0 +1,128 @@
+import math
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Max, Value
+from django.db.models.functions import Greatest
+from django_redis import get_redis_connection
+from ..models import CommunityPost
+
+# -----------------------------------------------------------------------------
+# 社群帖子热度服务
+# hot_score 是各类事件加分的指数衰减累计值：事件发生时直接累加 (F() 单条 UPDATE)，
+# 定时任务按半衰期整体乘以衰减系数。热度排序因此只是对 (community, status, -hot_score)
+# 索引的一次范围读取，不需要在请求时聚合点赞表和回复表。
+# 撤销事件 (取消点赞、删除回复) 只减去该事件当前剩下的贡献，即按事件发生后经历的衰减折算的权重；
+# 点赞表没有时间戳，写回时把点赞时间记在有序集合 LIKE_TIMES_KEY 中，衰减到可忽略后清理。
+# -----------------------------------------------------------------------------
+
+# 低于这个值的热度直接归零，衰减任务不再反复改写这些行
+MIN_SCORE = 0.01
+DECAY_BATCH_SIZE = 10000
+_LAST_DECAY_KEY = 'community-hot:last-decay'
+DECAY_LOCK_KEY = 'community-hot:decay-lock'
+DECAY_LOCK_TIMEOUT = 60 * 30
+# 成员为 "<帖子 id>:<用户 id>"，分数为点赞写回时间
+LIKE_TIMES_KEY = 'community-hot:like-times'
+
+
+def _weight(event):
+    return settings.COMMUNITY_HOT_WEIGHTS[event]
+
+
+def _timestamp(value):
+    return value.timestamp() if hasattr(value, 'timestamp') else value
+
+
+def remaining_weight(event, occurred_at):
+    """[公共] 发生在 occurred_at (datetime 或时间戳) 的事件对热度当前剩下的贡献"""
+    last = cache.get(_LAST_DECAY_KEY)
+    if not last:
+        return _weight(event)
+    return _weight(event) * decay_factor(max(last - _timestamp(occurred_at), 0))
+
+
+def record_event(post_id, event, count=1, occurred_at=None):
+    """
+    [公共] 记录帖子上的热度事件 (post / like / reply / best_answer)，count 可以为负 (例如取消点赞)。
+    撤销以前的事件时传入事件发生的时间 occurred_at，只减去衰减后剩下的贡献。
+    热度不会被减到 0 以下。
+    """
+    weight = _weight(event) if occurred_at is None else remaining_weight(event, occurred_at)
+    delta = weight * count
+    if not delta:
+        return
+    CommunityPost.objects.filter(pk=post_id).update(
+        hot_score=Greatest(F('hot_score') + delta, Value(0.0))
+    )
+
+
+def record_events(post_deltas, event):
+    """[公共] 批量记录同一类事件：{帖子 id: 次数}"""
+    for post_id, count in post_deltas.items():
+        record_event(post_id, event, count)
+
+
+def record_likes(added, removed, liked_at=None):
+    """
+    [公共] 记录写回数据库的帖子点赞变化：added / removed 为 (帖子 id, 用户 id) 列表。
+    取消点赞按记下的点赞时间折算；没有记录的 (功能上线前的点赞或已清理的) 按帖子发布时间折算。
+    """
+    now = liked_at or time.time()
+    redis = get_redis_connection('default')
+    if added:
+        redis.zadd(LIKE_TIMES_KEY, {f"{post_id}:{user_id}": now for post_id, user_id in added})
+        counts = {}
+        for post_id, _ in added:
+            counts[post_id] = counts.get(post_id, 0) + 1
+        record_events(counts, 'like')
+    if not removed:
+        return
+    members = [f"{post_id}:{user_id}" for post_id, user_id in removed]
+    times = redis.zmscore(LIKE_TIMES_KEY, members)
+    redis.zrem(LIKE_TIMES_KEY, *members)
+    unknown = {post_id for (post_id, _), liked in zip(removed, times) if liked is None}
+    created = dict(CommunityPost.objects.filter(pk__in=unknown).values_list('pk', 'created_at')) if unknown else {}
+    for (post_id, _), liked in zip(removed, times):
+        occurred_at = liked if liked is not None else created.get(post_id)
+        if occurred_at is not None:
+            record_event(post_id, 'like', -1, occurred_at=occurred_at)
+
+
+def _prune_like_times(now):
+    """清理贡献已衰减到 MIN_SCORE 以下的点赞时间"""
+    horizon = settings.COMMUNITY_HOT_HALF_LIFE_HOURS * 3600 * math.log2(max(_weight('like') / MIN_SCORE, 1))
+    get_redis_connection('default').zremrangebyscore(LIKE_TIMES_KEY, '-inf', now - horizon)
+
+
+def decay_factor(elapsed_seconds):
+    half_life = settings.COMMUNITY_HOT_HALF_LIFE_HOURS * 3600
+    return 0.5 ** (elapsed_seconds / half_life)
+
+
+def decay_scores(default_interval=3600):
+    """
+    [公共] 按距离上次衰减的实际时间整体衰减热度 (由 Celery 定时任务调用)，返回更新的行数。
+    按主键分段更新，避免一条 UPDATE 长时间锁住整张帖子表。
+    同一时间只执行一次衰减；上一次还没结束时直接返回 0，避免重叠执行把热度衰减两次。
+    """
+    if not cache.add(DECAY_LOCK_KEY, 1, DECAY_LOCK_TIMEOUT):
+        return 0
+    try:
+        now = time.time()
+        last = cache.get(_LAST_DECAY_KEY)
+        elapsed = now - last if last else default_interval
+        factor = decay_factor(max(elapsed, 0))
+        cache.set(_LAST_DECAY_KEY, now, None)
+
+        max_id = CommunityPost.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        updated = 0
+        for start in range(0, max_id + 1, DECAY_BATCH_SIZE):
+            batch = CommunityPost.objects.filter(id__gte=start, id__lt=start + DECAY_BATCH_SIZE, hot_score__gt=0)
+            # 先把衰减后会低于阈值的归零，再衰减其余的行
+            updated += batch.filter(hot_score__lt=MIN_SCORE / factor).update(hot_score=0.0)
+            updated += batch.filter(hot_score__gte=MIN_SCORE / factor).update(hot_score=F('hot_score') * factor)
+        _prune_like_times(now)
+        return updated
+    finally:
+        cache.delete(DECAY_LOCK_KEY)
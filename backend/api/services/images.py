@@ -0,0 +1,210 @@
+import io
+import logging
+import os
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from ..models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 图片派生服务
+# 为封面、头像、练习图片生成固定宽度的缩略图 (WebP + JPEG)，去掉 EXIF 等元数据。
+# 上传后由 Celery 生成；列表接口读取时如发现缺失，则加锁后补投一次任务。
+# -----------------------------------------------------------------------------
+
+# 生成锁的有效期 (秒)，防止并发请求重复投递同一张图片的生成任务
+LOCK_TIMEOUT = 300
+# srcset 缓存有效期 (秒)
+SRCSET_CACHE_TIMEOUT = 60 * 60 * 24
+
+_SAVE_OPTIONS = {
+    ImageDerivative.FormatChoices.WEBP: {'format': 'WEBP', 'quality': 80, 'method': 4},
+    ImageDerivative.FormatChoices.JPEG: {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def _widths(profile):
+    return settings.IMAGE_DERIVATIVE_WIDTHS[profile]
+
+
+def _lock_key(source_name):
+    return f"image-derivatives:lock:{source_name}"
+
+
+def _srcset_key(source_name):
+    return f"image-derivatives:srcset:{source_name}"
+
+
+def _derivative_name(source_name, width, fmt):
+    base, _ = os.path.splitext(source_name)
+    return f"{base}_{width}w.{'jpg' if fmt == ImageDerivative.FormatChoices.JPEG else fmt}"
+
+
+def _render(image, width, fmt):
+    """缩放到目标宽度并编码；不传 exif / icc 等信息，等同于去除元数据。"""
+    resized = image.copy()
+    if resized.width > width:
+        resized.thumbnail((width, width * 10), Image.Resampling.LANCZOS)
+
+    if fmt == ImageDerivative.FormatChoices.JPEG and resized.mode != 'RGB':
+        background = Image.new('RGB', resized.size, (255, 255, 255))
+        if resized.mode in ('RGBA', 'LA', 'P'):
+            resized = resized.convert('RGBA')
+            background.paste(resized, mask=resized.split()[-1])
+        else:
+            background.paste(resized.convert('RGB'))
+        resized = background
+
+    buffer = io.BytesIO()
+    resized.save(buffer, **_SAVE_OPTIONS[fmt])
+    return resized.size, buffer.getvalue()
+
+
+def generate_derivatives(source_name, profile):
+    """
+    [公共] 为一张原图生成 profile 对应的全部派生图 (由 Celery 任务调用)。
+    已存在的派生图会跳过；比原图还宽的尺寸只生成一份原尺寸版本。
+    """
+    if not source_name or not default_storage.exists(source_name):
+        return 0
+
+    existing = set(
+        ImageDerivative.objects.filter(source_name=source_name).values_list('format', 'target_width')
+    )
+
+    with default_storage.open(source_name, 'rb') as fp:
+        image = Image.open(fp)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image.load()
+
+    created = 0
+    rendered_widths = set()
+    for width in sorted(_widths(profile)):
+        effective_width = min(width, image.width)
+        if effective_width in rendered_widths:
+            continue
+        rendered_widths.add(effective_width)
+
+        for fmt in ImageDerivative.FormatChoices.values:
+            if (fmt, width) in existing:
+                continue
+            (actual_width, actual_height), data = _render(image, effective_width, fmt)
+            derivative = ImageDerivative(
+                source_name=source_name,
+                format=fmt,
+                target_width=width,
+                width=actual_width,
+                height=actual_height,
+                size_bytes=len(data),
+            )
+            derivative.file.save(_derivative_name(source_name, width, fmt), ContentFile(data), save=False)
+            derivative.save()
+            created += 1
+
+    cache.delete(_srcset_key(source_name))
+    return created
+
+
+def request_derivatives(source_name, profile):
+    """
+    [公共] 投递生成任务。同一张原图在锁有效期内只投递一次。
+    """
+    from ..tasks import generate_image_derivatives
+
+    if not source_name or profile not in settings.IMAGE_DERIVATIVE_WIDTHS:
+        return False
+    if not cache.add(_lock_key(source_name), 1, LOCK_TIMEOUT):
+        return False
+    transaction.on_commit(lambda: generate_image_derivatives.delay(source_name, profile))
+    return True
+
+
+def release_lock(source_name):
+    cache.delete(_lock_key(source_name))
+
+
+def load_srcsets(source_names):
+    """
+    [公共] 批量读取原图的派生图列表：{原图名: {格式: [(url, 宽度), ...]}}，没有派生图的为 {}。
+    一次 cache.get_many；未命中的原图用一条查询补齐并写回缓存。
+    """
+    keys = {_srcset_key(name): name for name in source_names if name}
+    srcsets = {keys[key]: srcset for key, srcset in cache.get_many(list(keys)).items()}
+    missing = [name for name in keys.values() if name not in srcsets]
+    if not missing:
+        return srcsets
+
+    loaded = {}
+    derivatives = (
+        ImageDerivative.objects.filter(source_name__in=missing)
+        .order_by('source_name', 'format', 'width')
+        .values_list('source_name', 'format', 'width', 'file')
+    )
+    seen = set()
+    for source_name, fmt, width, name in derivatives:
+        if (source_name, fmt, width) in seen:
+            continue
+        seen.add((source_name, fmt, width))
+        loaded.setdefault(source_name, {}).setdefault(fmt, []).append((default_storage.url(name), width))
+
+    if loaded:
+        cache.set_many({_srcset_key(name): srcset for name, srcset in loaded.items()}, SRCSET_CACHE_TIMEOUT)
+    for name in missing:
+        srcsets[name] = loaded.get(name, {})
+    return srcsets
+
+
+def _load_srcset(source_name):
+    return load_srcsets([source_name]).get(source_name, {})
+
+
+def get_srcset(field_file, profile, request=None, srcsets=None):
+    """
+    [公共] 返回图片字段的派生图 srcset：{"webp": "url 320w, url 640w", "jpeg": "..."}。
+    还没有派生图时返回 None 并投递生成任务，前端此时使用原图。
+    srcsets 为 load_srcsets 批量取回的结果 (列表序列化时)，其中没有这张图时单独读取。
+    """
+    if not field_file:
+        return None
+
+    if srcsets is not None and field_file.name in srcsets:
+        srcset = srcsets[field_file.name]
+    else:
+        srcset = _load_srcset(field_file.name)
+    if not srcset:
+        request_derivatives(field_file.name, profile)
+        return None
+
+    build = request.build_absolute_uri if request is not None else (lambda url: url)
+    return {
+        fmt: ", ".join(f"{build(url)} {width}w" for url, width in entries)
+        for fmt, entries in srcset.items()
+    }
+
+
+def get_thumbnail_url(field_file, profile, max_width):
+    """[公共] 返回不超过 max_width 的最大 JPEG 派生图地址，没有时退回原图地址。"""
+    if not field_file:
+        return None
+    entries = _load_srcset(field_file.name).get(ImageDerivative.FormatChoices.JPEG, [])
+    candidates = [url for url, width in entries if width <= max_width]
+    if candidates:
+        return candidates[-1]
+    if not entries:
+        request_derivatives(field_file.name, profile)
+    return field_file.url
+
+
+def delete_derivatives(source_name):
+    """[公共] 原图被释放时删除其全部派生图。"""
+    for derivative in ImageDerivative.objects.filter(source_name=source_name):
+        derivative.file.delete(save=False)
+        derivative.delete()
+    cache.delete(_srcset_key(source_name))
@@ -0,0 +1,296 @@
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django_redis import get_redis_connection
+from ..models import CommunityPost, CommunityReply, User
+from . import hot_ranking as hot_ranking_service
+
+# -----------------------------------------------------------------------------
+# 点赞服务 (帖子 / 回帖)
+#
+# 每个对象的点赞用户保存在 Redis 集合 likes:<kind>:<id> 中，切换和计数都是 O(1)。
+# 集合里固定有一个哨兵成员，用来区分 "没人点赞" 和 "还没从数据库加载"。
+# 点赞变化先记在哈希 likes:pending 中 (同一用户对同一对象只保留最终状态)，
+# 由 api.tasks.flush_pending_likes 批量写回 likes 多对多表，不触发 m2m_changed。
+# 点赞表每次提交变化 (批量写回、后台直接修改) 后递增对象的版本号；从数据库加载集合时
+# 版本号变了说明快照可能缺少那次提交，丢弃重新加载。
+# -----------------------------------------------------------------------------
+
+LIKE_KINDS = {
+    CommunityPost: 'post',
+    CommunityReply: 'reply',
+}
+_MODELS_BY_KIND = {kind: model for model, kind in LIKE_KINDS.items()}
+
+SENTINEL = '-'
+# 集合的过期时间 (秒)，每次点赞会续期；过期后下次访问从数据库重新加载
+SET_TTL = 60 * 60 * 24 * 7
+PENDING_KEY = 'likes:pending'
+PROCESSING_KEY = 'likes:pending:processing'
+FLUSH_LOCK_KEY = 'likes:flush-lock'
+FLUSH_LOCK_TIMEOUT = 300
+WARM_CHUNK_SIZE = 5000
+# 加载期间版本号一直在变时最多重试的次数；仍然失败时按短有效期写入，过期后重新加载
+WARM_ATTEMPTS = 3
+CONTENDED_SET_TTL = 60
+
+# 返回 {是否点赞, 点赞数}；集合尚未加载时返回 -1
+_TOGGLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local liked
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    redis.call('SREM', KEYS[1], ARGV[1])
+    liked = 0
+else
+    redis.call('SADD', KEYS[1], ARGV[1])
+    liked = 1
+end
+redis.call('HSET', KEYS[2], ARGV[2], liked)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {liked, redis.call('SCARD', KEYS[1]) - 1}
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _key(kind, obj_id):
+    return f"likes:{kind}:{obj_id}"
+
+
+def _version_key(kind, obj_id):
+    return f"likes:{kind}:{obj_id}:version"
+
+
+# 版本号 (KEYS[3]) 与加载前读到的 (ARGV[1]) 相同时才把临时键 (KEYS[1]) 改名为集合 (KEYS[2])；
+# ARGV[2] 为 1 时不检查版本号。返回 1 表示集合已存在 (本次写入或其他请求已加载)
+_INSTALL_SCRIPT = """
+if ARGV[2] ~= '1' and (redis.call('GET', KEYS[3]) or '0') ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+if redis.call('RENAMENX', KEYS[1], KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+
+def _bump_versions(kind, obj_ids):
+    pipe = _redis().pipeline(transaction=False)
+    for obj_id in obj_ids:
+        pipe.incr(_version_key(kind, obj_id))
+        pipe.expire(_version_key(kind, obj_id), SET_TTL)
+    pipe.execute()
+
+
+def _through_fields(model):
+    """返回 likes 中间表中指向对象、指向用户的外键字段名"""
+    field = model._meta.get_field('likes')
+    return field.m2m_field_name(), field.m2m_reverse_field_name()
+
+
+def _warm(model, obj_id, force=False):
+    """
+    从数据库加载一个对象的点赞用户。先写入临时键再 RENAMENX，
+    已被其他请求加载过 (可能还包含尚未写回的点赞) 时放弃本次结果；
+    读取期间点赞表有提交 (版本号变化) 时也放弃并返回 False。
+    force 为 True 时不检查版本号，集合只保留 CONTENDED_SET_TTL 秒。
+    """
+    kind = LIKE_KINDS[model]
+    redis = _redis()
+    version = redis.get(_version_key(kind, obj_id)) or b'0'
+    through = model.likes.through
+    obj_field, user_field = _through_fields(model)
+    user_ids = (
+        through.objects.filter(**{f"{obj_field}_id": obj_id})
+        .values_list(f"{user_field}_id", flat=True)
+        .iterator(chunk_size=WARM_CHUNK_SIZE)
+    )
+
+    temp_key = f"{_key(kind, obj_id)}:warm:{uuid.uuid4().hex}"
+    pipe = redis.pipeline(transaction=False)
+    pipe.sadd(temp_key, SENTINEL)
+    chunk = []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) >= WARM_CHUNK_SIZE:
+            pipe.sadd(temp_key, *chunk)
+            chunk = []
+    if chunk:
+        pipe.sadd(temp_key, *chunk)
+    pipe.expire(temp_key, CONTENDED_SET_TTL if force else SET_TTL)
+    pipe.execute()
+
+    install = redis.register_script(_INSTALL_SCRIPT)
+    return bool(install(keys=[temp_key, _key(kind, obj_id), _version_key(kind, obj_id)], args=[version, int(force)]))
+
+
+def toggle_like(obj, user):
+    """
+    [公共] 切换用户对帖子 / 回帖的点赞状态，返回 (是否已点赞, 点赞数)。
+    """
+    model = type(obj)
+    kind = LIKE_KINDS[model]
+    redis = _redis()
+    script = redis.register_script(_TOGGLE_SCRIPT)
+    keys = [_key(kind, obj.pk), PENDING_KEY]
+    args = [user.pk, f"{kind}:{obj.pk}:{user.pk}", SET_TTL]
+
+    result = script(keys=keys, args=args)
+    attempt = 0
+    while result == -1:
+        attempt += 1
+        _warm(model, obj.pk, force=attempt >= WARM_ATTEMPTS)
+        result = script(keys=keys, args=args)
+    if attempt >= WARM_ATTEMPTS:
+        # 强制写入的集合可能缺少并发的提交，不随这次点赞续期
+        redis.expire(keys[0], CONTENDED_SET_TTL)
+    liked, count = result
+    return bool(liked), count
+
+
+def get_like_states(model, obj_ids, user=None):
+    """
+    [公共] 批量返回 {对象 id: (点赞数, 当前用户是否点赞)}，已加载的对象只用一次 pipeline。
+    尚未加载到 Redis 的对象用两条聚合查询从数据库补齐，不在读取时加载整份点赞名单。
+    """
+    obj_ids = list(dict.fromkeys(obj_ids))
+    if not obj_ids:
+        return {}
+    kind = LIKE_KINDS[model]
+    user_id = user.pk if user is not None and user.is_authenticated else None
+
+    pipe = _redis().pipeline(transaction=False)
+    for obj_id in obj_ids:
+        key = _key(kind, obj_id)
+        pipe.scard(key)
+        pipe.sismember(key, user_id if user_id is not None else SENTINEL)
+    results = pipe.execute()
+
+    states = {}
+    cold = []
+    for index, obj_id in enumerate(obj_ids):
+        size, is_member = results[index * 2], results[index * 2 + 1]
+        if size == 0:
+            cold.append(obj_id)
+        else:
+            states[obj_id] = (size - 1, user_id is not None and bool(is_member))
+
+    if cold:
+        through = model.likes.through
+        obj_field, user_field = _through_fields(model)
+        rows = through.objects.filter(**{f"{obj_field}_id__in": cold})
+        counts = dict(
+            rows.values_list(f"{obj_field}_id").annotate(count=Count('pk')).values_list(f"{obj_field}_id", 'count')
+        )
+        liked = set()
+        if user_id is not None:
+            liked = set(rows.filter(**{f"{user_field}_id": user_id}).values_list(f"{obj_field}_id", flat=True))
+        for obj_id in cold:
+            states[obj_id] = (counts.get(obj_id, 0), obj_id in liked)
+    return states
+
+
+def invalidate(model, obj_ids):
+    """[公共] 点赞表被直接修改 (例如后台编辑) 后丢弃 Redis 中的集合，下次访问时重新加载。"""
+    kind = LIKE_KINDS[model]
+    keys = [_key(kind, obj_id) for obj_id in obj_ids]
+    if keys:
+        _redis().delete(*keys)
+        _bump_versions(kind, obj_ids)
+
+
+def _apply(model, changes):
+    """把 {(对象 id, 用户 id): 是否点赞} 写回多对多表，返回真正新增和删除的 (对象 id, 用户 id) 列表"""
+    through = model.likes.through
+    obj_field, user_field = _through_fields(model)
+
+    # 排队期间被删除的对象 / 用户直接丢弃，避免外键错误
+    existing_objs = set(
+        model.objects.filter(pk__in={obj_id for obj_id, _ in changes}).values_list('pk', flat=True)
+    )
+    existing_users = set(
+        User.objects.filter(pk__in={user_id for _, user_id in changes}).values_list('pk', flat=True)
+    )
+    changes = {
+        pair: liked for pair, liked in changes.items()
+        if pair[0] in existing_objs and pair[1] in existing_users
+    }
+
+    # 先查出已经存在的行，只插入真正新增、只删除真正存在的点赞，净变化也据此计算
+    existing = set()
+    if changes:
+        condition = Q()
+        for obj_id, user_id in changes:
+            condition |= Q(**{f"{obj_field}_id": obj_id, f"{user_field}_id": user_id})
+        existing = set(through.objects.filter(condition).values_list(f"{obj_field}_id", f"{user_field}_id"))
+
+    adds = [pair for pair, liked in changes.items() if liked and pair not in existing]
+    removes = [pair for pair, liked in changes.items() if not liked and pair in existing]
+    with transaction.atomic():
+        through.objects.bulk_create(
+            [through(**{f"{obj_field}_id": obj_id, f"{user_field}_id": user_id}) for obj_id, user_id in adds],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+        if removes:
+            condition = Q()
+            for obj_id, user_id in removes:
+                condition |= Q(**{f"{obj_field}_id": obj_id, f"{user_field}_id": user_id})
+            through.objects.filter(condition).delete()
+    return adds, removes
+
+
+def flush_pending(batch_size=1000):
+    """
+    [公共] 把排队的点赞变化写回数据库 (由 Celery 定时任务调用)，返回写回的条数。
+    待处理哈希先整体改名再处理；处理失败时保留改名后的键，下次优先重试。
+    """
+    from search.tasks import update_document_fields
+
+    if not cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        return 0
+    try:
+        redis = _redis()
+        if not redis.exists(PROCESSING_KEY):
+            if not redis.exists(PENDING_KEY):
+                return 0
+            redis.rename(PENDING_KEY, PROCESSING_KEY)
+
+        flushed = 0
+        post_adds, post_removes = [], []
+        cursor = 0
+        while True:
+            cursor, entries = redis.hscan(PROCESSING_KEY, cursor, count=batch_size)
+            changes = {}
+            for field, value in entries.items():
+                kind, obj_id, user_id = field.decode().split(':')
+                changes.setdefault(kind, {})[(int(obj_id), int(user_id))] = value == b'1'
+            for kind, kind_changes in changes.items():
+                model = _MODELS_BY_KIND[kind]
+                adds, removes = _apply(model, kind_changes)
+                _bump_versions(kind, {obj_id for obj_id, _ in adds + removes})
+                if model is CommunityPost:
+                    post_adds.extend(adds)
+                    post_removes.extend(removes)
+                flushed += len(kind_changes)
+            if cursor == 0:
+                break
+        redis.delete(PROCESSING_KEY)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+    hot_ranking_service.record_likes(post_adds, post_removes)
+    # 帖子索引中只有点赞数受影响：局部更新 likes_count，不重新准备整个文档
+    changed_posts = {post_id for post_id, _ in post_adds + post_removes}
+    if changed_posts:
+        states = get_like_states(CommunityPost, list(changed_posts))
+        update_document_fields.delay(
+            'api', 'communitypost', {post_id: {'likes_count': count} for post_id, (count, _) in states.items()}
+        )
+    return flushed
@@ -156,4 +156,55 @@ def transfer_points(
         operator=from_user # 收入也是由 'from_user' 的购买行为触发的
     )
     
-    return (tx_expense, tx_income)
\ No newline at end of file
+    return (tx_expense, tx_income)
+
+@transaction.atomic
+def bulk_adjust_points(
+    entries,
+    transaction_type: PointsTransaction.TransactionType,
+    operator: User = None
+) -> list[PointsTransaction]:
+    """
+    [公共] 在一个事务中批量调整多个用户的积分，每条 entry 生成一条流水。
+
+    entries: [(user_id, amount, description, related_object), ...]，同一用户可以出现多次。
+    与逐条调用 adjust_points 的区别：用户行一次性按主键顺序加锁 (避免死锁)，
+    余额用一条 bulk_update 写回，流水用 bulk_create 写入，查询数与条目数无关。
+
+    用于：
+    - (退款) 过期悬赏批量退回: bulk_adjust_points([(payer_id, 50, "...", post), ...], REFUND)
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+    if any(amount == 0 for _, amount, _, _ in entries):
+        raise ValueError("调整金额不能为 0")
+
+    user_ids = sorted({user_id for user_id, _, _, _ in entries})
+    users = {
+        user.pk: user
+        for user in User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').only('pk', 'currentPoints')
+    }
+    missing = set(user_ids) - set(users)
+    if missing:
+        raise ValueError(f"ID 为 {sorted(missing)} 的用户不存在")
+
+    logs = []
+    for user_id, amount, description, related_object in entries:
+        user = users[user_id]
+        new_balance = user.currentPoints + amount
+        if new_balance < 0:
+            raise InsufficientPointsError("积分不足，操作失败")
+        user.currentPoints = new_balance
+        logs.append(PointsTransaction(
+            user=user,
+            amount=amount,
+            balance_after=new_balance,
+            transaction_type=transaction_type,
+            description=description,
+            content_object=related_object,
+            operator=operator,
+        ))
+
+    User.objects.bulk_update(users.values(), ['currentPoints'], batch_size=1000)
+    return PointsTransaction.objects.bulk_create(logs, batch_size=1000)
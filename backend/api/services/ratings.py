@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Count
+from django.db.models.functions import Cast, Coalesce, NullIf
+from ..models import GalleryItem, GalleryItemRating
+
+# -----------------------------------------------------------------------------
+# 画廊作品评分聚合服务
+# GalleryItem 上维护 rating_sum / rating_count，每次评分增删改只做一条 F() 更新，
+# 同时重算平均分 rating 和用于排序的贝叶斯平均分 bayesian_score，读取时不再扫描评分表。
+# -----------------------------------------------------------------------------
+
+MIN_RATING = 1
+MAX_RATING = 5
+
+
+def _prior():
+    return float(settings.GALLERY_RATING_PRIOR_WEIGHT), float(settings.GALLERY_RATING_PRIOR_MEAN)
+
+
+def bayesian_score(rating_sum, rating_count):
+    """
+    [公共] 按当前先验参数计算贝叶斯平均分 (与数据库中的更新公式一致)。
+    没有评分的作品记为 0，在 top_rated 排序中排在所有已评分作品之后。
+    """
+    if not rating_count:
+        return 0.0
+    weight, mean = _prior()
+    return (weight * mean + rating_sum) / (weight + rating_count)
+
+
+def apply_delta(item_id, sum_delta, count_delta):
+    """
+    [公共] 把一次评分变化累加到作品上。
+    UPDATE 中引用的都是更新前的列值，所以新值 = 旧值 + 增量，一条语句内完成，无需加锁。
+    """
+    if not sum_delta and not count_delta:
+        return
+    weight, mean = _prior()
+    new_sum = Cast(F('rating_sum') + sum_delta, FloatField())
+    new_count = F('rating_count') + count_delta
+    # 评分人数归零时 NullIf 得到 NULL，两个分数都退回 0
+    nonzero_count = NullIf(new_count, 0)
+    GalleryItem.objects.filter(pk=item_id).update(
+        rating_sum=F('rating_sum') + sum_delta,
+        rating_count=new_count,
+        rating=Coalesce(new_sum / nonzero_count, 0.0, output_field=FloatField()),
+        bayesian_score=Coalesce(
+            (new_sum + weight * mean) / (nonzero_count + weight), 0.0, output_field=FloatField()
+        ),
+    )
+    # F() 更新不触发 post_save，索引里的 rating 要单独放入缓冲区
+    from search.buffer import enqueue_update
+    enqueue_update(GalleryItem, [item_id])
+
+
+def rate(user, item: GalleryItem, value):
+    """
+    [公共] 创建或修改用户对作品的评分。聚合字段由 signals.py 中的评分信号维护。
+    返回 (评分记录, 是否新建)。
+    """
+    if not MIN_RATING <= value <= MAX_RATING:
+        raise ValueError(f"评分必须在 {MIN_RATING} 到 {MAX_RATING} 之间")
+    with transaction.atomic():
+        return GalleryItemRating.objects.update_or_create(
+            user=user, gallery_item=item, defaults={'rating': value}
+        )
+
+
+def recompute_aggregates(item_ids=None):
+    """
+    [公共] 从评分表重新计算聚合字段，用于修改先验参数后或数据修复。返回更新的作品数。
+    """
+    items = GalleryItem.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=item_ids)
+
+    totals = {
+        row['gallery_item']: (row['total'], row['count'])
+        for row in GalleryItemRating.objects.filter(gallery_item__in=items)
+        .values('gallery_item').annotate(total=Sum('rating'), count=Count('id'))
+    }
+    updated = []
+    for item in items.only('pk'):
+        rating_sum, rating_count = totals.get(item.pk, (0, 0))
+        item.rating_sum = rating_sum
+        item.rating_count = rating_count
+        item.rating = rating_sum / rating_count if rating_count else 0.0
+        item.bayesian_score = bayesian_score(rating_sum, rating_count)
+        updated.append(item)
+    GalleryItem.objects.bulk_update(
+        updated, ['rating_sum', 'rating_count', 'rating', 'bayesian_score'], batch_size=500
+    )
+    return len(updated)
@@ -0,0 +1,168 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from ..models import Chapter, Exercise, Option, CourseContentChange
+
+# -----------------------------------------------------------------------------
+# 课程内容增量同步服务
+# 章节 / 练习 / 选项 的每次保存或删除都会写入 CourseContentChange，
+# 离线客户端携带上次拿到的游标 (cursor) 即可只拉取变化的部分。
+# 自增 id 在插入时分配、事务提交的顺序却可能不同：id 较小的变更可能在较大的之后才可见。
+# 因此游标只推进到 COURSE_SYNC_CURSOR_SAFETY_SECONDS 秒之前的变更为止，
+# 更新的变更照常返回，但下次同步还会再返回一次，晚提交的变更不会被游标跳过。
+# -----------------------------------------------------------------------------
+
+# 单次最多返回的变更日志条数，超出部分通过 has_more 让客户端继续拉取
+DEFAULT_PAGE_SIZE = 500
+
+_KIND_BY_MODEL = {
+    Chapter: CourseContentChange.Kind.CHAPTER,
+    Exercise: CourseContentChange.Kind.EXERCISE,
+    Option: CourseContentChange.Kind.OPTION,
+}
+
+
+def _chapter_course_id(chapter_id, cached_chapter=None):
+    if cached_chapter is not None:
+        return cached_chapter.course_id
+    return Chapter.objects.filter(pk=chapter_id).values_list('course_id', flat=True).first()
+
+
+def _course_id_for(instance):
+    """
+    (内部使用) 找到内容对象所属的课程 ID。
+    优先使用实例上已缓存的外键对象，避免额外的查询。
+    """
+    if isinstance(instance, Chapter):
+        return instance.course_id
+
+    if isinstance(instance, Exercise):
+        return _chapter_course_id(instance.chapter_id, instance._state.fields_cache.get('chapter'))
+
+    # Option
+    exercise = instance._state.fields_cache.get('exercise')
+    if exercise is not None:
+        return _chapter_course_id(exercise.chapter_id, exercise._state.fields_cache.get('chapter'))
+    return Exercise.objects.filter(pk=instance.exercise_id).values_list('chapter__course_id', flat=True).first()
+
+
+def record_change(instance, action):
+    """
+    [公共] 为单个章节/练习/选项写入一条变更记录。
+    由 api/signals.py 中的 post_save / post_delete 信号调用。
+    """
+    kind = _KIND_BY_MODEL.get(type(instance))
+    if kind is None:
+        return None
+
+    course_id = _course_id_for(instance)
+    if course_id is None:
+        # 父对象已不存在 (例如整门课程被删除)，没有客户端需要这条记录
+        return None
+
+    return CourseContentChange.objects.create(
+        course_id=course_id,
+        kind=kind,
+        object_id=instance.pk,
+        action=action,
+    )
+
+
+def record_bulk_changes(course_id, kind, object_ids, action=CourseContentChange.Action.UPSERT):
+    """
+    [公共] 为 queryset.update() 之类绕过信号的批量操作补写变更记录。
+    """
+    CourseContentChange.objects.bulk_create([
+        CourseContentChange(course_id=course_id, kind=kind, object_id=object_id, action=action)
+        for object_id in object_ids
+    ])
+
+
+def _content_querysets(course):
+    return {
+        CourseContentChange.Kind.CHAPTER: Chapter.objects.filter(course=course),
+        CourseContentChange.Kind.EXERCISE: Exercise.objects.filter(chapter__course=course),
+        CourseContentChange.Kind.OPTION: Option.objects.filter(exercise__chapter__course=course),
+    }
+
+
+def _safety_cutoff():
+    return timezone.now() - timedelta(seconds=settings.COURSE_SYNC_CURSOR_SAFETY_SECONDS)
+
+
+def get_snapshot(course):
+    """
+    [公共] 首次同步 (没有游标) 时返回课程的全部内容。
+    先取游标再读内容：读取期间发生的变更会在下一次增量同步中被重放 (upsert 是幂等的)。
+    游标停在安全窗口内第一条变更之前，窗口内可能还有没提交的变更。
+    """
+    changes = CourseContentChange.objects.filter(course_id=course.pk)
+    bounds = changes.aggregate(
+        latest=Max('id'),
+        first_recent=Min('id', filter=Q(changed_at__gt=_safety_cutoff())),
+    )
+    if bounds['first_recent'] is not None:
+        cursor = bounds['first_recent'] - 1
+    else:
+        cursor = bounds['latest'] or 0
+    upserted = {kind: list(qs.order_by('pk')) for kind, qs in _content_querysets(course).items()}
+    deleted = {kind: [] for kind in upserted}
+    return {'cursor': cursor, 'has_more': False, 'full': True, 'upserted': upserted, 'deleted': deleted}
+
+
+def get_changes(course, cursor, limit=DEFAULT_PAGE_SIZE):
+    """
+    [公共] 返回游标之后课程内容的新增/更新/删除。
+
+    同一个对象在窗口内多次变更时只保留最后一次动作；
+    变更日志里标记为 upsert 但已查不到的对象按删除处理。
+    返回的游标不越过安全窗口内的第一条变更 (见模块说明)。
+    """
+    rows = list(
+        CourseContentChange.objects
+        .filter(course_id=course.pk, id__gt=cursor)
+        .order_by('id')
+        .values_list('id', 'kind', 'object_id', 'action', 'changed_at')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    cutoff = _safety_cutoff()
+    next_cursor = cursor
+    for row in rows:
+        if row[4] > cutoff:
+            # 后面的都在安全窗口内；不必继续翻页，等窗口过去再从这里取
+            has_more = False
+            break
+        next_cursor = row[0]
+
+    latest_actions = {}
+    for _, kind, object_id, action, _ in rows:
+        latest_actions[(kind, object_id)] = action
+
+    querysets = _content_querysets(course)
+    upserted = {kind: [] for kind in querysets}
+    deleted = {kind: [] for kind in querysets}
+
+    upsert_ids = {kind: [] for kind in querysets}
+    for (kind, object_id), action in latest_actions.items():
+        if action == CourseContentChange.Action.DELETE:
+            deleted[kind].append(object_id)
+        else:
+            upsert_ids[kind].append(object_id)
+
+    for kind, ids in upsert_ids.items():
+        if not ids:
+            continue
+        found = list(querysets[kind].filter(pk__in=ids).order_by('pk'))
+        upserted[kind] = found
+        found_ids = {obj.pk for obj in found}
+        deleted[kind].extend(object_id for object_id in ids if object_id not in found_ids)
+
+    return {
+        'cursor': next_cursor,
+        'has_more': has_more,
+        'upserted': upserted,
+        'deleted': deleted,
+    }
@@ -0,0 +1,279 @@
+import glob
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import ChunkedUpload
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 分块上传服务
+# 客户端先创建上传会话，再按偏移量 PATCH 分块，最后 finalize。
+# 分块先不加锁地写到单独的暂存文件，再在行锁内校验偏移量并追加到临时文件，
+# 慢速客户端上传期间不会一直占着数据库行锁。
+# SHA-256 在同一进程连续收到分块时增量计算；分块落在不同 worker 上时 finalize 读一遍文件计算，
+# 总开销始终是 O(文件大小)。
+# -----------------------------------------------------------------------------
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+# 不同用途允许的 MIME 前缀 (None 表示不限制)
+ALLOWED_MIME_PREFIXES = {
+    ChunkedUpload.PurposeChoices.GALLERY_WORK: None,
+    ChunkedUpload.PurposeChoices.COURSE_COVER: ('image/',),
+    ChunkedUpload.PurposeChoices.CERTIFICATION: ('image/', 'application/pdf'),
+}
+
+# 常见文件头 -> MIME，先于扩展名判断，避免改扩展名绕过封面图等的类型限制
+_MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+)
+
+
+class UploadError(Exception):
+    """分块上传协议错误，message 直接返回给客户端。"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# 进程内的增量哈希状态：upload_id -> (offset, hasher)
+# hashlib 对象无法持久化；偏移量对不上 (上一个分块落在别的 worker) 时直接丢弃，
+# 不在每个分块上重读已接收的部分，由 finalize 一次性计算
+_HASHER_CACHE_SIZE = 256
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def sniff_mime(head, filename, trust_extension=True):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, mime in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime
+    if trust_extension:
+        return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return 'application/octet-stream'
+
+
+def _max_size(purpose):
+    return settings.CHUNKED_UPLOAD_MAX_SIZE.get(purpose, 0)
+
+
+def create_upload(owner, purpose, filename, size):
+    """[公共] 创建上传会话并预先建好空的临时文件。"""
+    max_size = _max_size(purpose)
+    if size <= 0 or (max_size and size > max_size):
+        raise UploadError(f"文件大小必须在 1 到 {max_size} 字节之间。", status_code=413)
+
+    upload = ChunkedUpload.objects.create(
+        owner=owner,
+        purpose=purpose,
+        filename=os.path.basename(filename),
+        size=size,
+        expires_at=timezone.now() + timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS),
+    )
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(upload.temp_path, 'wb').close()
+    return upload
+
+
+def _take_hasher(upload):
+    """取出与当前偏移量一致的增量哈希状态，没有时返回 None。"""
+    with _hashers_lock:
+        cached = _hashers.pop(str(upload.pk), None)
+    if cached is not None and cached[0] == upload.offset:
+        return cached[1]
+    return None
+
+
+def _put_hasher(upload, hasher):
+    with _hashers_lock:
+        _hashers[str(upload.pk)] = (upload.offset, hasher)
+        while len(_hashers) > _HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _file_sha256(path, size):
+    """已接收部分 (前 size 字节) 的 SHA-256；中断的追加可能在末尾留下多余字节"""
+    hasher = hashlib.sha256()
+    remaining = size
+    with open(path, 'rb') as fp:
+        while remaining > 0:
+            data = fp.read(min(READ_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher.hexdigest()
+
+
+def _check_appendable(upload, offset):
+    if upload is None:
+        raise UploadError("上传会话不存在。", status_code=404)
+    if upload.status != ChunkedUpload.StatusChoices.UPLOADING or upload.expires_at <= timezone.now():
+        raise UploadError("上传会话已结束或已过期。", status_code=410)
+    if offset != upload.offset:
+        raise UploadError(f"Upload-Offset 不匹配，服务器当前偏移量为 {upload.offset}。", status_code=409)
+
+
+def _stage_chunk(upload, stream, remaining):
+    """把请求体写到暂存文件 (不持有行锁)，返回 (暂存文件路径, 字节数)。"""
+    path = os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{upload.pk}.{uuid.uuid4().hex}.chunk")
+    written = 0
+    try:
+        with open(path, 'wb') as fp:
+            while True:
+                try:
+                    data = stream.read(min(READ_BLOCK_SIZE, remaining - written + 1))
+                except OSError:
+                    # 客户端中途断开：保留已收到的部分，下次从新的偏移量继续
+                    logger.info(f"Chunked upload {upload.pk} interrupted after {written} bytes")
+                    break
+                if not data:
+                    break
+                if written + len(data) > remaining:
+                    raise UploadError("分块超出了声明的文件大小。", status_code=413)
+                fp.write(data)
+                written += len(data)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, written
+
+
+def append_chunk(upload_id, owner, offset, stream, content_length=None):
+    """
+    [公共] 把一个分块追加到临时文件，返回更新后的上传会话。
+    请求体先写到暂存文件，之后才取行锁校验偏移量并追加，同一会话的并发 PATCH 只在追加时串行；
+    偏移量不一致时返回 409，客户端应先 HEAD 查询。
+    """
+    upload = ChunkedUpload.objects.filter(pk=upload_id, owner=owner).first()
+    _check_appendable(upload, offset)
+    remaining = upload.size - upload.offset
+    if content_length is not None and content_length > remaining:
+        raise UploadError("分块超出了声明的文件大小。", status_code=413)
+
+    staged, written = _stage_chunk(upload, stream, remaining)
+    try:
+        with transaction.atomic():
+            upload = ChunkedUpload.objects.select_for_update().filter(pk=upload_id, owner=owner).first()
+            # 暂存期间可能有别的请求写入了同一偏移量
+            _check_appendable(upload, offset)
+            if not written:
+                return upload
+
+            hasher = _take_hasher(upload)
+            if hasher is None and upload.offset == 0:
+                hasher = hashlib.sha256()
+            with open(staged, 'rb') as source, open(upload.temp_path, 'r+b') as fp:
+                # 截掉上一次中断写入留下的多余字节
+                fp.truncate(upload.offset)
+                fp.seek(upload.offset)
+                for data in iter(lambda: source.read(READ_BLOCK_SIZE), b''):
+                    if upload.offset == 0 and fp.tell() == 0:
+                        # 有类型限制的用途只认文件头，不认扩展名
+                        trust_extension = ALLOWED_MIME_PREFIXES.get(upload.purpose) is None
+                        upload.mime_type = sniff_mime(data[:16], upload.filename, trust_extension)
+                    fp.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+
+            upload.offset += written
+            upload.save(update_fields=['offset', 'mime_type', 'updated_at'])
+            if hasher is not None:
+                _put_hasher(upload, hasher)
+    finally:
+        os.remove(staged)
+    return upload
+
+
+def finalize_upload(upload_id, owner, expected_sha256=None):
+    """[公共] 确认所有字节已到达，记录 SHA-256 并校验类型。"""
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().filter(pk=upload_id, owner=owner).first()
+        if upload is None:
+            raise UploadError("上传会话不存在。", status_code=404)
+        if upload.status == ChunkedUpload.StatusChoices.COMPLETE:
+            return upload
+        if upload.offset != upload.size:
+            raise UploadError(f"文件尚未上传完整 ({upload.offset}/{upload.size})。", status_code=409)
+
+        allowed = ALLOWED_MIME_PREFIXES.get(upload.purpose)
+        if allowed and not upload.mime_type.startswith(allowed):
+            raise UploadError("不支持的文件类型。")
+
+        hasher = _take_hasher(upload)
+        digest = hasher.hexdigest() if hasher is not None else _file_sha256(upload.temp_path, upload.offset)
+        if expected_sha256 and expected_sha256.lower() != digest:
+            raise UploadError("SHA-256 校验失败。", status_code=422)
+
+        upload.sha256 = digest
+        upload.status = ChunkedUpload.StatusChoices.COMPLETE
+        upload.save(update_fields=['sha256', 'status', 'updated_at'])
+    return upload
+
+
+def attach_upload(upload, model, field_name):
+    """
+    [公共] 把已完成的上传移动到模型文件字段的存储位置，返回可直接赋给字段的文件名。
+    本地存储下是一次 rename (或链接到已有的相同内容)，不会重新读取或复制文件内容。
+    """
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    name = field.generate_filename(None, upload.filename)
+
+    if hasattr(storage, 'save_existing_file'):
+        # 去重存储：SHA-256 在上传时已算好，内容重复时直接链接到已有文件
+        name = storage.save_existing_file(name, upload.temp_path, upload.sha256)
+        upload.delete()
+        return name
+
+    name = storage.get_available_name(name)
+    try:
+        target = storage.path(name)
+    except NotImplementedError:
+        # 非本地存储 (对象存储等) 只能走一次普通保存
+        with open(upload.temp_path, 'rb') as fp:
+            name = storage.save(name, fp)
+        os.remove(upload.temp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(upload.temp_path, target)
+
+    upload.delete()
+    return name
+
+
+def delete_expired_uploads(now=None):
+    """[公共] 删除过期的上传会话及其临时文件，返回删除数量。"""
+    now = now or timezone.now()
+    expired = list(ChunkedUpload.objects.filter(expires_at__lte=now))
+    for upload in expired:
+        # 临时文件，以及写入暂存时进程被杀掉留下的暂存文件
+        for path in [upload.temp_path, *glob.glob(os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{upload.pk}.*.chunk"))]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with _hashers_lock:
+            _hashers.pop(str(upload.pk), None)
+    ChunkedUpload.objects.filter(pk__in=[u.pk for u in expired]).delete()
+    return len(expired)
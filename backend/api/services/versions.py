@@ -0,0 +1,118 @@
+from django.core.cache import cache
+from django.db import connection
+from ..models import GalleryItem, GalleryDownloadRecord
+
+# -----------------------------------------------------------------------------
+# 画廊作品版本链服务
+# 作品通过 prerequisiteWork 串成版本链。用一条递归 CTE 同时查出某个作品的
+# 全部祖先 (更早的版本) 和后代 (更新的版本，可能有分支)，结果按代际深度排序。
+# -----------------------------------------------------------------------------
+
+# 防止数据里出现环 (A -> B -> A) 时递归不终止
+MAX_CHAIN_DEPTH = 500
+
+CHAIN_CACHE_TIMEOUT = 60 * 60
+_GENERATION_KEY = 'gallery-versions:generation'
+
+
+def _chain_sql():
+    qn = connection.ops.quote_name
+    table = qn(GalleryItem._meta.db_table)
+    prerequisite = qn(GalleryItem._meta.get_field('prerequisiteWork').column)
+    return f"""
+        WITH RECURSIVE ancestors (id, prerequisite_id, depth) AS (
+            SELECT id, {prerequisite}, 0 FROM {table} WHERE id = %(item_id)s
+            UNION ALL
+            SELECT g.id, g.{prerequisite}, a.depth - 1
+            FROM {table} g JOIN ancestors a ON g.id = a.prerequisite_id
+            WHERE a.depth > -%(max_depth)s
+        ),
+        descendants (id, depth) AS (
+            SELECT id, 0 FROM {table} WHERE id = %(item_id)s
+            UNION ALL
+            SELECT g.id, d.depth + 1
+            FROM {table} g JOIN descendants d ON g.{prerequisite} = d.id
+            WHERE d.depth < %(max_depth)s
+        ),
+        chain (id, depth) AS (
+            SELECT id, depth FROM ancestors
+            UNION
+            SELECT id, depth FROM descendants
+        )
+        SELECT g.id, g.title, g.version, g.status, g.author_id, g.{prerequisite}, g.created_at,
+               MIN(c.depth) AS chain_depth
+        FROM chain c JOIN {table} g ON g.id = c.id
+        GROUP BY g.id, g.title, g.version, g.status, g.author_id, g.{prerequisite}, g.created_at
+        ORDER BY chain_depth, g.created_at, g.id
+    """
+
+
+def _generation():
+    return cache.get(_GENERATION_KEY, 0)
+
+
+def invalidate_chains():
+    """
+    [公共] 任一作品保存或删除后调用，使所有缓存的版本链失效。
+    用全局代数计数而不是逐个删除：一个作品的变化可能影响多条链。
+    """
+    if not cache.add(_GENERATION_KEY, 1, None):
+        try:
+            cache.incr(_GENERATION_KEY)
+        except ValueError:
+            cache.set(_GENERATION_KEY, 1, None)
+
+
+def get_chain(item_id):
+    """
+    [公共] 返回作品所在的完整版本链 (不含用户相关信息)，结果带缓存。
+    每个元素：{id, title, version, status, author_id, prerequisiteWork, created_at, depth}
+    depth 为相对当前作品的代数，负数是旧版本，正数是新版本。
+    """
+    cache_key = f"gallery-versions:{_generation()}:{item_id}"
+    chain = cache.get(cache_key)
+    if chain is not None:
+        return chain
+
+    # raw() 会按模型字段转换列值 (例如时间字段)，仍然只有一条 SQL
+    items = GalleryItem.objects.raw(_chain_sql(), {'item_id': item_id, 'max_depth': MAX_CHAIN_DEPTH})
+    chain = [
+        {
+            'id': item.id,
+            'title': item.title,
+            'version': item.version,
+            'status': item.status,
+            'author_id': item.author_id,
+            'prerequisiteWork': item.prerequisiteWork_id,
+            'created_at': item.created_at,
+            'depth': item.chain_depth,
+        }
+        for item in items
+    ]
+    cache.set(cache_key, chain, CHAIN_CACHE_TIMEOUT)
+    return chain
+
+
+def get_chain_for_user(item_id, user):
+    """
+    [公共] 版本链 + 当前用户在链上每个版本的下载状态。
+    未发布的版本只对作者本人可见。
+    """
+    user_id = user.id if user and user.is_authenticated else None
+    chain = [
+        dict(node) for node in get_chain(item_id)
+        if node['status'] == GalleryItem.StatusChoices.PUBLISHED or node['author_id'] == user_id
+    ]
+
+    downloaded = set()
+    if user_id is not None and chain:
+        downloaded = set(
+            GalleryDownloadRecord.objects
+            .filter(user_id=user_id, gallery_item_id__in=[node['id'] for node in chain])
+            .values_list('gallery_item_id', flat=True)
+        )
+
+    for node in chain:
+        node['is_current'] = node['id'] == item_id
+        node['is_downloaded'] = node['id'] in downloaded
+    return chain
@@ -0,0 +1,270 @@
+# backend/api/signals.py
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import (Chapter, Exercise, Option, CourseContentChange,
+                     User, CertificationRequest, PendingCertificationRequest,
+                     Course, GalleryItem, GalleryItemRating, Community,
+                     CommunityPost, CommunityReply, Subscription, GalleryDownloadRecord)
+from .services import sync as sync_service
+from .services import images as image_service
+from .services import versions as version_service
+from .services import ratings as rating_service
+from .services import likes as like_service
+from .services import hot_ranking as hot_ranking_service
+from .services import entitlements as entitlement_service
+from .services import bounties as bounty_service
+from .storage import ContentAddressedStorage
+from .tasks import compute_gallery_file_metadata
+
+
+# ===============================================
+# =======     课程内容变更日志 (离线同步)     =======
+# ===============================================
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_save, sender=Exercise)
+@receiver(post_save, sender=Option)
+def log_course_content_saved(sender, instance, **kwargs):
+    sync_service.record_change(instance, CourseContentChange.Action.UPSERT)
+
+
+@receiver(post_delete, sender=Chapter)
+@receiver(post_delete, sender=Exercise)
+@receiver(post_delete, sender=Option)
+def log_course_content_deleted(sender, instance, **kwargs):
+    sync_service.record_change(instance, CourseContentChange.Action.DELETE)
+
+
+# ===============================================
+# =======  媒体文件变更 (去重引用/派生图/元数据)  =======
+# ===============================================
+# 文件被替换或所属对象被删除时释放内容寻址存储中的引用。
+# Course / GalleryItem 由 django-reversion 管理历史版本，恢复旧版本时仍需要旧文件，因此不在这里释放。
+
+RELEASABLE_FILE_FIELDS = {
+    User: ['avatarUrl'],
+    CertificationRequest: ['certificationFile'],
+    PendingCertificationRequest: ['certificationFile'],
+    Exercise: ['image_upload'],
+    Community: ['coverImage'],
+}
+
+# 上传后需要生成缩略图 / WebP 的图片字段 -> settings.IMAGE_DERIVATIVE_WIDTHS 中的用途
+DERIVATIVE_IMAGE_FIELDS = {
+    User: {'avatarUrl': 'avatar'},
+    Course: {'coverImage': 'cover'},
+    GalleryItem: {'coverImage': 'cover'},
+    Community: {'coverImage': 'cover'},
+    Exercise: {'image_upload': 'exercise'},
+}
+
+# 变化后需要重新计算文件元数据的字段 (大小 / SHA-256 / MIME / 压缩包文件数)
+METADATA_FILE_FIELDS = {
+    GalleryItem: ['workFile'],
+}
+
+TRACKED_FILE_FIELDS = {
+    model: (set(RELEASABLE_FILE_FIELDS.get(model, []))
+            | set(DERIVATIVE_IMAGE_FIELDS.get(model, {}))
+            | set(METADATA_FILE_FIELDS.get(model, [])))
+    for model in set(RELEASABLE_FILE_FIELDS) | set(DERIVATIVE_IMAGE_FIELDS) | set(METADATA_FILE_FIELDS)
+}
+
+
+def _file_name(instance, attname):
+    """
+    返回字段中已经保存到存储里的文件名；尚未保存的上传文件返回 None。
+    直接读 __dict__，避免访问被 defer 的字段时触发额外查询。
+    """
+    value = instance.__dict__.get(attname)
+    if isinstance(value, FieldFile):
+        return value.name if value._committed else None
+    return value if isinstance(value, str) and value else None
+
+
+def _release_file(instance, attname, name):
+    storage = instance._meta.get_field(attname).storage
+    if not name or not isinstance(storage, ContentAddressedStorage):
+        return
+
+    def release():
+        storage.delete(name)
+        if attname in DERIVATIVE_IMAGE_FIELDS.get(type(instance), {}):
+            image_service.delete_derivatives(name)
+
+    transaction.on_commit(release)
+
+
+def remember_file_names(sender, instance, **kwargs):
+    instance._loaded_file_names = {
+        attname: _file_name(instance, attname) for attname in TRACKED_FILE_FIELDS[sender]
+    }
+
+
+def handle_changed_files(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_file_names', {})
+    releasable = RELEASABLE_FILE_FIELDS.get(sender, [])
+    derivative_profiles = DERIVATIVE_IMAGE_FIELDS.get(sender, {})
+
+    for attname in TRACKED_FILE_FIELDS[sender]:
+        current = _file_name(instance, attname)
+        # 新建的对象没有旧文件：分块上传在第一次保存前就把文件名写进了字段，
+        # post_init 记下的是这个新文件名，不能当成 "未变化"
+        previous = None if created else loaded.get(attname)
+        if current == previous:
+            continue
+        if previous and attname in releasable:
+            _release_file(instance, attname, previous)
+        if current and attname in derivative_profiles:
+            image_service.request_derivatives(current, derivative_profiles[attname])
+        if attname in METADATA_FILE_FIELDS.get(sender, []):
+            transaction.on_commit(lambda pk=instance.pk: compute_gallery_file_metadata.delay(pk))
+        loaded[attname] = current
+    instance._loaded_file_names = loaded
+
+
+def release_deleted_files(sender, instance, **kwargs):
+    for attname in RELEASABLE_FILE_FIELDS.get(sender, []):
+        _release_file(instance, attname, _file_name(instance, attname))
+
+
+for _model in TRACKED_FILE_FIELDS:
+    post_init.connect(remember_file_names, sender=_model)
+    post_save.connect(handle_changed_files, sender=_model)
+    post_delete.connect(release_deleted_files, sender=_model)
+
+
+# ===============================================
+# =======        画廊作品版本链缓存失效        =======
+# ===============================================
+
+@receiver(post_save, sender=GalleryItem)
+@receiver(post_delete, sender=GalleryItem)
+def invalidate_gallery_version_chains(sender, instance, **kwargs):
+    version_service.invalidate_chains()
+
+
+# ===============================================
+# =======         画廊作品评分聚合维护         =======
+# ===============================================
+# 记录加载时的评分和作品，保存 / 删除时只把差值累加到作品的 rating_sum / rating_count。
+
+@receiver(post_init, sender=GalleryItemRating)
+def remember_rating(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._loaded_rating = None
+    else:
+        instance._loaded_rating = (instance.__dict__.get('gallery_item_id'), instance.__dict__.get('rating'))
+
+
+@receiver(post_save, sender=GalleryItemRating)
+def apply_rating_saved(sender, instance, created, **kwargs):
+    loaded = None if created else instance._loaded_rating
+    if loaded is None:
+        rating_service.apply_delta(instance.gallery_item_id, instance.rating, 1)
+    elif loaded[0] != instance.gallery_item_id:
+        rating_service.apply_delta(loaded[0], -loaded[1], -1)
+        rating_service.apply_delta(instance.gallery_item_id, instance.rating, 1)
+    else:
+        rating_service.apply_delta(instance.gallery_item_id, instance.rating - loaded[1], 0)
+    instance._loaded_rating = (instance.gallery_item_id, instance.rating)
+
+
+@receiver(post_delete, sender=GalleryItemRating)
+def apply_rating_deleted(sender, instance, **kwargs):
+    item_id, rating = instance._loaded_rating or (instance.gallery_item_id, instance.rating)
+    rating_service.apply_delta(item_id, -rating, -1)
+
+
+# ===============================================
+# =======     点赞表被直接修改 (后台编辑等)     =======
+# ===============================================
+# 正常点赞走 services/likes.py 的 Redis 集合并批量写回中间表 (不经过这里)；
+# 通过 ORM 直接 add/remove 时丢弃对应的 Redis 集合，下次访问重新加载。
+
+@receiver(m2m_changed, sender=CommunityPost.likes.through)
+@receiver(m2m_changed, sender=CommunityReply.likes.through)
+def invalidate_like_sets(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance 是用户，model 是帖子 / 回帖；post_clear 时 pk_set 为空，无法知道涉及哪些对象
+        target_model = model
+        obj_ids = list(pk_set or [])
+    else:
+        target_model = type(instance)
+        obj_ids = [instance.pk]
+    transaction.on_commit(lambda: like_service.invalidate(target_model, obj_ids))
+
+
+# ===============================================
+# =======           社群帖子热度事件           =======
+# ===============================================
+# 点赞在 services/likes.py 批量写回时记录；采纳最佳答案在视图中记录。
+
+@receiver(post_save, sender=CommunityPost)
+def record_post_created(sender, instance, created, **kwargs):
+    if created:
+        hot_ranking_service.record_event(instance.pk, 'post')
+
+
+@receiver(post_save, sender=CommunityReply)
+def record_reply_created(sender, instance, created, **kwargs):
+    if created:
+        hot_ranking_service.record_event(instance.post_id, 'reply')
+
+
+@receiver(post_delete, sender=CommunityReply)
+def record_reply_deleted(sender, instance, **kwargs):
+    hot_ranking_service.record_event(instance.post_id, 'reply', -1, occurred_at=instance.created_at)
+
+
+# ===============================================
+# =======             悬赏托管             =======
+# ===============================================
+
+@receiver(pre_delete, sender=CommunityPost)
+def refund_deleted_bounty(sender, instance, **kwargs):
+    # 删除帖子 (包括随社群级联删除) 时退回托管中的悬赏，与删除在同一事务中
+    bounty_service.refund_deleted(instance)
+
+
+# ===============================================
+# =======        用户权益索引 (社群门禁)        =======
+# ===============================================
+
+ENTITLEMENT_SOURCES = {
+    Subscription: (entitlement_service.COURSES, 'course_id'),
+    GalleryDownloadRecord: (entitlement_service.GALLERY, 'gallery_item_id'),
+}
+
+
+def _record_entitlement(sender, instance, added):
+    kind, attname = ENTITLEMENT_SOURCES[sender]
+    user_id, obj_id = instance.user_id, getattr(instance, attname)
+    transaction.on_commit(lambda: entitlement_service.record_change(user_id, kind, obj_id, added))
+
+
+def entitlement_created(sender, instance, created, **kwargs):
+    if created:
+        _record_entitlement(sender, instance, True)
+
+
+def entitlement_deleted(sender, instance, **kwargs):
+    kind, attname = ENTITLEMENT_SOURCES[sender]
+    # 下载记录没有唯一约束，同一作品可能还有其他记录
+    if not sender.objects.filter(user_id=instance.user_id, **{attname: getattr(instance, attname)}).exists():
+        _record_entitlement(sender, instance, False)
+
+
+for _model in ENTITLEMENT_SOURCES:
+    post_save.connect(entitlement_created, sender=_model)
+    post_delete.connect(entitlement_deleted, sender=_model)
+
+
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+def forget_community_gate(sender, instance, **kwargs):
+    entitlement_service.forget_community_gate(instance.pk)
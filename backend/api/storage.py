@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 内容文件存放在 settings.MEDIA_BLOB_ROOT 下 (不对外提供)，和业务文件名在同一文件系统才能建立硬链接。
+# 公开存储 (MEDIA_ROOT) 和不公开存储 (PROTECTED_MEDIA_ROOT) 共用这一份内容文件，MediaBlob 的引用计数覆盖两者
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    内容寻址、去重的本地文件存储。
+
+    文件内容按 SHA-256 存放在 MEDIA_BLOB_ROOT/ab/cd/<sha256>，业务文件名 (例如 gallery_files/xxx.zip)
+    是指向它的硬链接 (文件系统不支持时退回为符号链接)。
+    因此 url() / path() / X-Accel-Redirect 等照常工作，而重复上传只占用一份磁盘空间。
+
+    每个文件名对应一条 StoredFile，MediaBlob.ref_count 记录引用数；
+    delete() 只删除链接并减少引用，归零的内容由 api.tasks.collect_media_blobs 回收。
+    """
+
+    def blob_name(self, sha256):
+        return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+    def blob_path(self, sha256):
+        return os.path.join(settings.MEDIA_BLOB_ROOT, self.blob_name(sha256))
+
+    def _save(self, name, content):
+        os.makedirs(settings.MEDIA_BLOB_ROOT, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=settings.MEDIA_BLOB_ROOT, suffix='.tmp')
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(HASH_BLOCK_SIZE):
+                    hasher.update(chunk)
+                    fp.write(chunk)
+            return self.save_existing_file(name, temp_path, hasher.hexdigest())
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def save_existing_file(self, name, source_path, sha256):
+        """
+        [公共] 把磁盘上已经算好哈希的文件 (例如分块上传的临时文件) 存入，返回最终文件名。
+        内容已存在时直接丢弃源文件，不做任何复制。
+        """
+        from .models import MediaBlob, StoredFile
+
+        with transaction.atomic():
+            # 行锁和回收任务互斥，保证链接建立时内容文件不会被删掉
+            blob = MediaBlob.objects.select_for_update().filter(pk=sha256).first()
+            if blob is None:
+                blob, _ = MediaBlob.objects.get_or_create(
+                    pk=sha256, defaults={'size': os.path.getsize(source_path)}
+                )
+                blob = MediaBlob.objects.select_for_update().get(pk=sha256)
+
+            blob_path = self.blob_path(sha256)
+            if os.path.exists(blob_path):
+                os.remove(source_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                shutil.move(source_path, blob_path)
+                self._set_permissions(blob_path)
+
+            name = self._link(blob_path, name)
+            StoredFile.objects.create(name=name, blob=blob)
+            MediaBlob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1, released_at=None)
+        return name
+
+    def _set_permissions(self, path):
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+
+    def _link(self, blob_path, name):
+        """为内容文件建立业务文件名的链接，文件名冲突时换一个可用的名字重试。"""
+        while True:
+            name = self.get_available_name(name)
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                try:
+                    os.link(blob_path, full_path)
+                except OSError as e:
+                    if isinstance(e, FileExistsError):
+                        raise
+                    os.symlink(blob_path, full_path)
+            except FileExistsError:
+                continue
+            return name.replace('\\', '/')
+
+    def delete(self, name):
+        from .models import MediaBlob, StoredFile
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is not None:
+                blob_id = stored.blob_id
+                stored.delete()
+                MediaBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+                MediaBlob.objects.filter(pk=blob_id, ref_count=0).update(released_at=timezone.now())
+            super().delete(name)
+
+    def collect_garbage(self, grace=timedelta(hours=1), batch_size=500):
+        """
+        [公共] 删除引用计数已归零且超过宽限期的内容文件，返回删除数量。
+        宽限期用于覆盖 "文件已删除但事务尚未提交的重新上传" 等边界情况。
+        """
+        from .models import MediaBlob
+
+        deleted = 0
+        cutoff = timezone.now() - grace
+        while True:
+            with transaction.atomic():
+                blobs = list(
+                    MediaBlob.objects.select_for_update(skip_locked=True)
+                    .filter(ref_count=0, released_at__lt=cutoff)[:batch_size]
+                )
+                if not blobs:
+                    break
+                for blob in blobs:
+                    try:
+                        os.remove(self.blob_path(blob.sha256))
+                    except FileNotFoundError:
+                        pass
+                MediaBlob.objects.filter(pk__in=[blob.pk for blob in blobs]).delete()
+                deleted += len(blobs)
+        return deleted
+
+
+def protected_storage():
+    """
+    [公共] 不公开的文件 (画廊作品文件、差分补丁、课程离线包) 使用的存储，位于 PROTECTED_MEDIA_ROOT，
+    不在 MEDIA_URL 下提供，只能经过签名的下载接口获取。作为可调用对象传给 FileField，迁移里不记录路径。
+    """
+    return storages['protected']
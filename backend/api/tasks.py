@@ -1,8 +1,11 @@
 
+import logging
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 @shared_task
 def send_verification_code_email(email, code):
     """
@@ -15,4 +18,154 @@ def send_verification_code_email(email, code):
     
     send_mail(subject, message, from_email, recipient_list)
     
-    return f"Verification code email sent to {email}"
\ No newline at end of file
+    return f"Verification code email sent to {email}"
+
+@shared_task
+def build_course_bundle(bundle_id):
+    """
+    生成课程离线包的异步任务
+    """
+    from .models import CourseBundle
+    from .services import bundles as bundle_service
+
+    try:
+        bundle = CourseBundle.objects.select_related('course').get(pk=bundle_id)
+    except CourseBundle.DoesNotExist:
+        return f"Course bundle {bundle_id} no longer exists"
+
+    try:
+        bundle_service.build_bundle(bundle)
+    except Exception:
+        logger.exception(f"Failed to build course bundle {bundle_id}")
+        CourseBundle.objects.filter(pk=bundle_id).update(status=CourseBundle.StatusChoices.FAILED)
+        raise
+
+    return f"Course bundle {bundle_id} built ({bundle.size_bytes} bytes)"
+
+
+@shared_task
+def cleanup_expired_uploads():
+    """
+    定时清理过期的分块上传会话和临时文件 (由 celery beat 调度)
+    """
+    from .services import uploads as upload_service
+
+    count = upload_service.delete_expired_uploads()
+    return f"Removed {count} expired chunked uploads"
+
+
+@shared_task
+def collect_media_blobs():
+    """
+    回收引用计数归零的去重存储内容文件 (由 celery beat 调度)
+    """
+    from django.core.files.storage import default_storage
+    from .storage import ContentAddressedStorage
+
+    if not isinstance(default_storage, ContentAddressedStorage):
+        return "Default storage is not content-addressed, nothing to collect"
+
+    count = default_storage.collect_garbage()
+    return f"Removed {count} unreferenced media blobs"
+
+
+@shared_task
+def generate_image_derivatives(source_name, profile):
+    """
+    生成封面/头像/练习图片的缩略图和 WebP 版本
+    """
+    from .services import images as image_service
+
+    try:
+        count = image_service.generate_derivatives(source_name, profile)
+    except Exception:
+        # 不释放锁：损坏或无法识别的图片在锁过期前不会被反复重试
+        logger.exception(f"Failed to generate derivatives for {source_name}")
+        raise
+
+    if count:
+        image_service.release_lock(source_name)
+
+    return f"Generated {count} derivatives for {source_name}"
+
+
+@shared_task
+def compute_gallery_file_metadata(gallery_item_id):
+    """
+    作品文件变化后计算文件大小、SHA-256、MIME 和压缩包文件数
+    """
+    from .models import GalleryItem
+    from .services import file_metadata as file_metadata_service
+
+    item = GalleryItem.objects.filter(pk=gallery_item_id).first()
+    if item is None:
+        return f"Gallery item {gallery_item_id} no longer exists"
+
+    metadata = file_metadata_service.compute_metadata(item)
+    if metadata is None:
+        return f"Gallery item {gallery_item_id} has no work file"
+
+    # 文件变化后，与前一版本、后续版本之间的差分补丁都需要重新生成
+    from .services import deltas as delta_service
+    delta_service.request_delta(item)
+    for child in GalleryItem.objects.filter(prerequisiteWork=item).select_related('prerequisiteWork'):
+        delta_service.request_delta(child)
+
+    return f"Gallery item {gallery_item_id}: {metadata.size_bytes} bytes, {metadata.mime_type}"
+
+
+@shared_task
+def build_gallery_delta(delta_id):
+    """
+    生成相邻作品版本之间的二进制差分补丁
+    """
+    from .models import GalleryItemDelta
+    from .services import deltas as delta_service
+
+    delta = GalleryItemDelta.objects.select_related('source', 'target').filter(pk=delta_id).first()
+    if delta is None:
+        return f"Gallery delta {delta_id} no longer exists"
+
+    try:
+        delta = delta_service.build_delta(delta)
+    except Exception:
+        logger.exception(f"Failed to build gallery delta {delta_id}")
+        GalleryItemDelta.objects.filter(pk=delta_id).update(status=GalleryItemDelta.StatusChoices.FAILED)
+        raise
+
+    if delta is None:
+        return f"Gallery delta {delta_id} skipped: files changed while queued"
+    return f"Gallery delta {delta_id}: {delta.status}, {delta.patch_size} bytes"
+
+
+@shared_task
+def flush_pending_likes():
+    """
+    把 Redis 中排队的点赞变化批量写回数据库
+    """
+    from .services import likes as like_service
+
+    flushed = like_service.flush_pending()
+    return f"Flushed {flushed} like changes"
+
+
+@shared_task
+def decay_community_hot_scores():
+    """
+    按半衰期衰减社群帖子热度
+    """
+    from .services import hot_ranking as hot_ranking_service
+
+    updated = hot_ranking_service.decay_scores()
+    return f"Decayed hot score of {updated} posts"
+
+
+@shared_task
+def refund_expired_bounties():
+    """
+    批量退回到期未采纳的悬赏积分
+    """
+    from .services import bounties as bounty_service
+
+    refunded = bounty_service.refund_expired()
+    return f"Refunded {refunded} expired bounties"
@@ -1,3 +1,629 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import (
+    BountyEscrow, Chapter, ChunkedUpload, Community, CommunityPost, CommunityReply, Course, CourseBundle, CourseContentChange,
+    GalleryCollection, GalleryDownloadRecord, GalleryItem, ImageDerivative, PointsTransaction, Subscription, User,
+)
+from .services import access as access_service
+from .services import bounties as bounty_service
+from .services import bundles as bundle_service
+from .services import entitlements as entitlement_service
+from .serializers import CourseListSerializer
+from .services import hot_ranking as hot_ranking_service
+from .services import images as image_service
+from .services import likes as like_service
+from .services import sync as sync_service
+from .services import uploads as upload_service
+from .storage import ContentAddressedStorage
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class IsolatedMediaTestCase(TestCase):
+    """公开 / 不公开的媒体目录都指向临时目录"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        protected_root = f"{self.media_root}/protected"
+        settings_override = override_settings(
+            MEDIA_ROOT=f"{self.media_root}/public",
+            PROTECTED_MEDIA_ROOT=protected_root,
+            MEDIA_BLOB_ROOT=f"{protected_root}/blobs",
+            CHUNKED_UPLOAD_DIR=f"{protected_root}/chunked_uploads",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # 字段的 storage 在模型加载时就已经创建，单独替换
+        for field in (GalleryItem._meta.get_field('workFile'), CourseBundle._meta.get_field('bundle_file')):
+            storage_patch = mock.patch.object(field, 'storage', ContentAddressedStorage(location=protected_root))
+            storage_patch.start()
+            self.addCleanup(storage_patch.stop)
+        self.author = User.objects.create_user(
+            username='artist', email='artist@example.com', phone='13800000000', password='pw', role='artist',
+        )
+
+    def _chunked_upload(self, content):
+        upload = upload_service.create_upload(
+            self.author, ChunkedUpload.PurposeChoices.GALLERY_WORK, 'work.zip', len(content),
+        )
+        upload_service.append_chunk(upload.pk, self.author, 0, io.BytesIO(content), len(content))
+        return upload_service.finalize_upload(upload.pk, self.author)
+
+
+class ChunkedUploadGalleryItemTests(IsolatedMediaTestCase):
+    """分块上传的作品文件在第一次保存前就写进了字段，新建作品时仍然要计算文件元数据"""
+
+    def test_metadata_computed_for_item_created_from_chunked_upload(self):
+        upload = self._chunked_upload(b'PK\x03\x04' + b'x' * 1024)
+        name = upload_service.attach_upload(upload, GalleryItem, 'workFile')
+
+        with mock.patch('api.signals.compute_gallery_file_metadata') as compute, \
+                self.captureOnCommitCallbacks(execute=True):
+            item = GalleryItem.objects.create(title='作品', description='d', author=self.author, workFile=name)
+
+        compute.delay.assert_called_once_with(item.pk)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload.pk).exists())
+
+
+class ChunkedUploadHashTests(IsolatedMediaTestCase):
+    """分块落在不同 worker 上时 SHA-256 仍然正确；请求体在取行锁之前写到暂存文件"""
+
+    def _create(self, content):
+        return upload_service.create_upload(
+            self.author, ChunkedUpload.PurposeChoices.GALLERY_WORK, 'work.zip', len(content),
+        )
+
+    def test_sha256_when_chunks_hit_different_workers(self):
+        content = b'PK\x03\x04' + os.urandom(4096)
+        upload = self._create(content)
+        for start in range(0, len(content), 1000):
+            # 模拟每个分块落在一个新的 worker 上
+            upload_service._hashers.clear()
+            chunk = content[start:start + 1000]
+            upload_service.append_chunk(upload.pk, self.author, start, io.BytesIO(chunk), len(chunk))
+        upload = upload_service.finalize_upload(upload.pk, self.author, hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload.sha256, hashlib.sha256(content).hexdigest())
+
+    def test_concurrent_append_at_same_offset_is_rejected(self):
+        content = b'PK\x03\x04' + b'z' * 100
+        upload = self._create(content)
+
+        class RacingStream(io.BytesIO):
+            # 读取请求体期间另一个请求已经写入了同一偏移量
+            raced = False
+
+            def read(inner, size=-1):
+                if not inner.raced:
+                    inner.raced = True
+                    upload_service.append_chunk(upload.pk, self.author, 0, io.BytesIO(content[:10]), 10)
+                return super().read(size)
+
+        with self.assertRaises(upload_service.UploadError) as raised:
+            upload_service.append_chunk(upload.pk, self.author, 0, RacingStream(content), len(content))
+        self.assertEqual(raised.exception.status_code, 409)
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, 10)
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [f"{upload.pk}.part"])
+
+
+class GalleryWorkFileAccessTests(IsolatedMediaTestCase):
+    """作品文件不在公开的媒体目录里，详情接口只给有权下载的用户返回签名链接"""
+
+    def setUp(self):
+        super().setUp()
+        upload = self._chunked_upload(b'PK\x03\x04' + b'y' * 1024)
+        name = upload_service.attach_upload(upload, GalleryItem, 'workFile')
+        self.item = GalleryItem.objects.create(
+            title='作品', description='d', author=self.author, workFile=name,
+            status=GalleryItem.StatusChoices.PUBLISHED, requiredPoints=10,
+        )
+        self.student = User.objects.create_user(
+            username='student', email='student@example.com', phone='13900000000', password='pw',
+        )
+
+    def _detail(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(reverse('gallery-item-detail', kwargs={'pk': self.item.pk}))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_work_file_is_stored_outside_media_root(self):
+        self.assertTrue(os.path.exists(os.path.join(settings.PROTECTED_MEDIA_ROOT, self.item.workFile.name)))
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, self.item.workFile.name)))
+
+    def test_detail_hides_file_from_users_without_download(self):
+        data = self._detail(self.student)
+        self.assertNotIn('workFile', data)
+        self.assertIsNone(data['workFileUrl'])
+
+    def test_detail_returns_signed_url_after_download(self):
+        GalleryDownloadRecord.objects.create(user=self.student, gallery_item=self.item, points_spent=10)
+        url = self._detail(self.student)['workFileUrl']
+        self.assertIn('token=', url)
+
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'PK\x03\x04' + b'y' * 1024)
+
+
+class CommunityHotScoreTests(TestCase):
+    """撤销事件只减去衰减后剩下的贡献；衰减任务不会重叠执行"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='member', email='member@example.com', phone='13700000000', password='pw',
+        )
+        community = Community.objects.create(name='社群', founder=self.user)
+        self.post = CommunityPost.objects.create(community=community, author=self.user, title='帖子', content='c')
+
+    def _hot_score(self):
+        return CommunityPost.objects.values_list('hot_score', flat=True).get(pk=self.post.pk)
+
+    def test_deleting_reply_removes_only_decayed_weight(self):
+        reply = CommunityReply.objects.create(post=self.post, author=self.user, content='r')
+        weights = settings.COMMUNITY_HOT_WEIGHTS
+        self.assertAlmostEqual(self._hot_score(), weights['post'] + weights['reply'])
+
+        # 回复发布后过了一个半衰期
+        half_life = settings.COMMUNITY_HOT_HALF_LIFE_HOURS * 3600
+        CommunityReply.objects.filter(pk=reply.pk).update(created_at=timezone.now() - timedelta(seconds=half_life))
+        reply.refresh_from_db()
+        cache.set(hot_ranking_service._LAST_DECAY_KEY, time.time() - half_life, None)
+        with mock.patch.object(hot_ranking_service, 'get_redis_connection'):
+            hot_ranking_service.decay_scores()
+        reply.delete()
+
+        self.assertAlmostEqual(self._hot_score(), weights['post'] / 2, places=3)
+
+    def test_overlapping_decay_is_skipped(self):
+        cache.add(hot_ranking_service.DECAY_LOCK_KEY, 1)
+        self.assertEqual(hot_ranking_service.decay_scores(), 0)
+        self.assertAlmostEqual(self._hot_score(), settings.COMMUNITY_HOT_WEIGHTS['post'])
+
+    def test_plain_save_keeps_hot_score(self):
+        post = CommunityPost.objects.get(pk=self.post.pk)
+        hot_ranking_service.record_event(post.pk, 'best_answer')
+        post.title = '新标题'
+        post.save()
+        weights = settings.COMMUNITY_HOT_WEIGHTS
+        self.assertAlmostEqual(self._hot_score(), weights['post'] + weights['best_answer'])
+
+
+@unittest.skipUnless(fakeredis, '需要 fakeredis')
+class RedisSnapshotRaceTests(TestCase):
+    """从数据库加载 Redis 集合期间有提交时，不写入缺少那次提交的快照"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for service in (entitlement_service, like_service):
+            patcher = mock.patch.object(service, '_redis', return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            username='member', email='member@example.com', phone='13700000000', password='pw',
+        )
+
+    def _commit_during_query(self, manager, commit):
+        real_filter = manager.filter
+
+        def filter_with_commit(*args, **kwargs):
+            queryset = real_filter(*args, **kwargs)
+            commit()
+            return queryset
+
+        return mock.patch.object(manager, 'filter', side_effect=filter_with_commit)
+
+    def test_entitlement_snapshot_discarded_after_concurrent_change(self):
+        key = entitlement_service._key(self.user.pk, entitlement_service.COURSES)
+        commit = lambda: entitlement_service.record_change(self.user.pk, entitlement_service.COURSES, 42, True)
+        with self._commit_during_query(Subscription.objects, commit):
+            entitlement_service._load(self.user.pk, entitlement_service.COURSES)
+        self.assertFalse(self.redis.exists(key))
+
+        entitlement_service._load(self.user.pk, entitlement_service.COURSES)
+        self.assertTrue(self.redis.exists(key))
+
+    def test_like_set_reloaded_after_concurrent_flush(self):
+        community = Community.objects.create(name='社群', founder=self.user)
+        post = CommunityPost.objects.create(community=community, author=self.user, title='帖子', content='c')
+        other = User.objects.create_user(
+            username='other', email='other@example.com', phone='13500000000', password='pw',
+        )
+        through = CommunityPost.likes.through
+        commits = []
+
+        def flush_like():
+            # 只有第一次加载时有写回提交
+            if not commits:
+                commits.append(through.objects.create(communitypost_id=post.pk, user_id=other.pk))
+                like_service._bump_versions('post', [post.pk])
+
+        with self._commit_during_query(through.objects, flush_like):
+            liked, count = like_service.toggle_like(post, self.user)
+
+        self.assertEqual((liked, count), (True, 2))
+        self.assertGreater(self.redis.ttl(like_service._key('post', post.pk)), like_service.CONTENDED_SET_TTL)
+
+
+class ImageSrcsetListTests(TestCase):
+    """列表序列化时整页图片的 srcset 一次取回，不逐个对象读取缓存"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        author = User.objects.create_user(
+            username='teacher', email='teacher@example.com', phone='13600000000', password='pw',
+            avatarUrl='avatars/teacher.png',
+        )
+        self.courses = [
+            Course.objects.create(title=f'课程{index}', description='d', author=author, coverImage=f'covers/{index}.png')
+            for index in range(3)
+        ]
+        for name in ['avatars/teacher.png'] + [f'covers/{index}.png' for index in range(3)]:
+            ImageDerivative.objects.create(
+                source_name=name, format=ImageDerivative.FormatChoices.JPEG, target_width=320, width=320,
+                file=name.replace('.png', '_320w.jpg'),
+            )
+
+    def _serialize(self):
+        courses = Course.objects.filter(pk__in=[course.pk for course in self.courses]).select_related('author')
+        return CourseListSerializer(courses, many=True).data
+
+    def test_srcsets_loaded_in_one_batch(self):
+        with mock.patch.object(image_service, '_load_srcset') as load_one, \
+                mock.patch.object(image_service.cache, 'get_many', wraps=image_service.cache.get_many) as get_many:
+            data = self._serialize()
+        load_one.assert_not_called()
+        get_many.assert_called_once()
+        self.assertTrue(all(item['coverImageSrcset'] and item['author']['avatarSrcset'] for item in data))
+
+    def test_cached_srcsets_need_no_queries(self):
+        self._serialize()
+        courses = list(Course.objects.filter(pk__in=[course.pk for course in self.courses]).select_related('author'))
+        with mock.patch.object(image_service.ImageDerivative.objects, 'filter') as query:
+            CourseListSerializer(courses, many=True).data
+        query.assert_not_called()
+
+
+class GalleryListFollowersTests(TestCase):
+    """画廊列表的关注人数只按当前返回的作品统计，评分排序的查询不做 GROUP BY"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='artist', email='artist@example.com', phone='13800000000', password='pw', role='artist',
+        )
+        self.fans = [
+            User.objects.create_user(
+                username=f'fan{index}', email=f'fan{index}@example.com', phone=f'1390000000{index}', password='pw',
+            )
+            for index in range(2)
+        ]
+        self.items = [
+            GalleryItem.objects.create(
+                title=f'作品{index}', description='d', author=self.author, workFile=f'gallery_files/{index}.zip',
+                status=GalleryItem.StatusChoices.PUBLISHED,
+            )
+            for index in range(2)
+        ]
+        GalleryItem.objects.filter(pk=self.items[1].pk).update(bayesian_score=4.5)
+        for fan in self.fans:
+            GalleryCollection.objects.create(user=fan, gallery_item=self.items[1])
+        # 同一用户下载两次只算一人
+        for _ in range(2):
+            GalleryDownloadRecord.objects.create(user=self.fans[0], gallery_item=self.items[1], points_spent=0)
+
+    def test_top_rated_counts_followers_per_page(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(reverse('gallery-item-list'), {'ordering': 'top_rated'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['id'], item['followers_count']) for item in response.json()],
+            [(self.items[1].pk, 3), (self.items[0].pk, 0)],
+        )
+        list_query = next(query['sql'] for query in queries if 'bayesian_score' in query['sql'])
+        self.assertNotIn('GROUP BY', list_query)
+
+    def test_detail_counts_followers(self):
+        response = APIClient().get(reverse('gallery-item-detail', kwargs={'pk': self.items[1].pk}))
+        self.assertEqual(response.json()['followers_count'], 3)
+
+
+class GalleryMaintainedFieldsTests(TestCase):
+    """普通保存不覆盖后台任务写入的字段"""
+
+    def test_save_keeps_estimated_download_time(self):
+        author = User.objects.create_user(
+            username='artist', email='artist@example.com', phone='13800000000', password='pw', role='artist',
+        )
+        item = GalleryItem.objects.create(title='作品', description='d', author=author, workFile='gallery_files/a.zip')
+        loaded = GalleryItem.objects.get(pk=item.pk)
+        # 元数据任务在加载之后写入
+        GalleryItem.objects.filter(pk=item.pk).update(estimated_download_time=12.5)
+        loaded.title = '改过的标题'
+        loaded.save()
+
+        item.refresh_from_db()
+        self.assertEqual((item.title, item.estimated_download_time), ('改过的标题', 12.5))
+
+
+class CourseSyncCursorTests(TestCase):
+    """增量同步的游标不越过安全窗口内的变更，晚提交的变更不会被跳过"""
+
+    def setUp(self):
+        author = User.objects.create_user(
+            username='teacher', email='teacher@example.com', phone='13600000000', password='pw',
+        )
+        self.course = Course.objects.create(title='课程', description='d', author=author)
+        self.old = Chapter.objects.create(course=self.course, title='旧章节')
+        CourseContentChange.objects.filter(course_id=self.course.pk).update(
+            changed_at=timezone.now() - timedelta(minutes=5),
+        )
+        self.old_change = CourseContentChange.objects.get(course_id=self.course.pk)
+        self.recent = Chapter.objects.create(course=self.course, title='新章节')
+
+    def test_snapshot_cursor_stops_before_recent_changes(self):
+        self.assertEqual(sync_service.get_snapshot(self.course)['cursor'], self.old_change.pk)
+
+    def test_recent_changes_are_returned_again(self):
+        changes = sync_service.get_changes(self.course, self.old_change.pk - 1)
+        self.assertEqual([chapter.pk for chapter in changes['upserted']['chapter']], [self.old.pk, self.recent.pk])
+        self.assertEqual(changes['cursor'], self.old_change.pk)
+        self.assertFalse(changes['has_more'])
+
+        again = sync_service.get_changes(self.course, changes['cursor'])
+        self.assertEqual([chapter.pk for chapter in again['upserted']['chapter']], [self.recent.pk])
+        self.assertEqual(again['cursor'], changes['cursor'])
+
+    @override_settings(COURSE_SYNC_CURSOR_SAFETY_SECONDS=0)
+    def test_cursor_advances_once_window_has_passed(self):
+        latest = CourseContentChange.objects.filter(course_id=self.course.pk).latest('id').pk
+        self.assertEqual(sync_service.get_changes(self.course, self.old_change.pk)['cursor'], latest)
+        self.assertEqual(sync_service.get_snapshot(self.course)['cursor'], latest)
+
+
+class CourseBundleBuildTests(IsolatedMediaTestCase):
+    """生成完成后只清理更早的已就绪离线包"""
+
+    def setUp(self):
+        super().setUp()
+        self.course = Course.objects.create(title='课程', description='d', author=self.author)
+        Chapter.objects.create(course=self.course, title='第一章')
+
+    def _bundle(self, version):
+        return CourseBundle.objects.create(course=self.course, content_version=version)
+
+    def test_stale_build_keeps_newer_bundle(self):
+        old, new = self._bundle('1-1'), self._bundle('2-1')
+        bundle_service.build_bundle(new)
+        bundle_service.build_bundle(old)
+
+        new.refresh_from_db()
+        self.assertEqual(new.status, CourseBundle.StatusChoices.READY)
+        self.assertTrue(new.bundle_file.storage.exists(new.bundle_file.name))
+        self.assertTrue(new.bundle_file.path.startswith(settings.PROTECTED_MEDIA_ROOT))
+
+    def test_building_bundle_is_not_deleted(self):
+        old, new = self._bundle('1-1'), self._bundle('2-1')
+        bundle_service.build_bundle(old)
+        self.assertTrue(CourseBundle.objects.filter(pk=new.pk, status=CourseBundle.StatusChoices.BUILDING).exists())
+
+    def test_older_ready_bundle_is_replaced(self):
+        old, new = self._bundle('1-1'), self._bundle('2-1')
+        bundle_service.build_bundle(old)
+        old_name = old.bundle_file.name
+        bundle_service.build_bundle(new)
+
+        self.assertFalse(CourseBundle.objects.filter(pk=old.pk).exists())
+        self.assertFalse(new.bundle_file.storage.exists(old_name))
+        with new.bundle_file.open('rb') as fp, zipfile.ZipFile(fp) as zf:
+            manifest = json.loads(zf.read('manifest.json'))
+        self.assertEqual(manifest['content_version'], '2-1')
+        self.assertEqual([chapter['title'] for chapter in manifest['chapters']], ['第一章'])
+
+
+class BountyEscrowTests(TestCase):
+    """悬赏托管：扣除、发放、到期退回和删除帖子时退回，每笔积分只结算一次"""
+
+    def setUp(self):
+        self.payer = User.objects.create_user(
+            username='asker', email='asker@example.com', phone='13500000000', password='pw', currentPoints=100,
+        )
+        self.winner = User.objects.create_user(
+            username='answerer', email='answerer@example.com', phone='13500000001', password='pw', currentPoints=0,
+        )
+        self.community = Community.objects.create(name='社群', founder=self.payer)
+
+    def _points(self, user):
+        return User.objects.values_list('currentPoints', flat=True).get(pk=user.pk)
+
+    def _bounty_post(self, payer=None, amount=30):
+        payer = payer or self.payer
+        post = CommunityPost.objects.create(
+            community=self.community, author=payer, title='悬赏', content='c', rewardPoints=amount,
+        )
+        bounty_service.hold(post, payer, amount)
+        return post
+
+    def _refunds(self, user):
+        return PointsTransaction.objects.filter(user=user, transaction_type=PointsTransaction.TransactionType.REFUND)
+
+    def _expire(self, *posts):
+        BountyEscrow.objects.filter(post__in=posts).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def test_insufficient_balance_rolls_back_post(self):
+        client = APIClient()
+        client.force_authenticate(self.payer)
+        with mock.patch.object(entitlement_service, 'can_post_in_community', return_value=True):
+            response = client.post(
+                reverse('community-post-list', kwargs={'community_pk': self.community.pk}),
+                {'title': '悬赏', 'content': 'c', 'rewardPoints': 500},
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CommunityPost.objects.exists())
+        self.assertFalse(BountyEscrow.objects.exists())
+        self.assertEqual(self._points(self.payer), 100)
+
+    def test_award_pays_winner_once(self):
+        post = self._bounty_post()
+        self.assertEqual(bounty_service.award(post, self.winner), 30)
+        self.assertEqual(bounty_service.award(post, self.winner), 0)
+        self.assertEqual(self._points(self.winner), 30)
+        self.assertEqual(self._points(self.payer), 70)
+        self.assertEqual(BountyEscrow.objects.get(post=post).status, BountyEscrow.StatusChoices.AWARDED)
+
+    def test_award_after_refund_pays_nothing(self):
+        post = self._bounty_post()
+        self._expire(post)
+        self.assertEqual(bounty_service.refund_expired(), 1)
+        self.assertEqual(bounty_service.award(post, self.winner), 0)
+        self.assertEqual(self._points(self.winner), 0)
+        self.assertEqual(self._points(self.payer), 100)
+
+    def test_award_after_expiry_refunds_payer(self):
+        # 到期后、退款任务执行前采纳
+        post = self._bounty_post()
+        self._expire(post)
+        self.assertEqual(bounty_service.award(post, self.winner), 0)
+        self.assertEqual(bounty_service.refund_expired(), 0)
+        self.assertEqual(self._points(self.winner), 0)
+        self.assertEqual(self._points(self.payer), 100)
+        self.assertEqual(self._refunds(self.payer).count(), 1)
+
+    def test_bulk_refund_credits_each_escrow_once(self):
+        other = User.objects.create_user(
+            username='other', email='other@example.com', phone='13500000002', password='pw', currentPoints=50,
+        )
+        posts = [self._bounty_post(amount=30), self._bounty_post(amount=20), self._bounty_post(payer=other, amount=40)]
+        held = self._bounty_post(amount=10)
+        self._expire(*posts)
+
+        # 每批两条，分两批处理
+        self.assertEqual(bounty_service.refund_expired(batch_size=2), 3)
+        self.assertEqual(bounty_service.refund_expired(batch_size=2), 0)
+
+        self.assertEqual(self._points(self.payer), 90)
+        self.assertEqual(self._points(other), 50)
+        self.assertEqual(sorted(self._refunds(self.payer).values_list('amount', flat=True)), [20, 30])
+        self.assertEqual(list(self._refunds(other).values_list('amount', 'balance_after')), [(40, 50)])
+        self.assertEqual(
+            BountyEscrow.objects.filter(status=BountyEscrow.StatusChoices.REFUNDED, settled_at__isnull=False).count(), 3,
+        )
+        self.assertEqual(BountyEscrow.objects.get(post=held).status, BountyEscrow.StatusChoices.HELD)
+
+    def test_deleting_post_refunds_held_escrow(self):
+        post = self._bounty_post()
+        self.assertEqual(self._points(self.payer), 70)
+        post.delete()
+
+        self.assertEqual(self._points(self.payer), 100)
+        escrow = BountyEscrow.objects.get(payer=self.payer)
+        self.assertIsNone(escrow.post_id)
+        self.assertEqual(escrow.status, BountyEscrow.StatusChoices.REFUNDED)
+        self.assertEqual(self._refunds(self.payer).count(), 1)
+
+    def test_deleting_community_refunds_held_escrow(self):
+        self._bounty_post()
+        self.community.delete()
+        self.assertEqual(self._points(self.payer), 100)
+
+
+@unittest.skipUnless(fakeredis, '需要 fakeredis')
+class AccessCheckTests(TestCase):
+    """批量访问状态：各标志位、未发布对象只对作者可见、前置作品、匿名用户，查询次数固定"""
+
+    def setUp(self):
+        patcher = mock.patch.object(entitlement_service, '_redis', return_value=fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = User.objects.create_user(
+            username='teacher', email='teacher@example.com', phone='13600000000', password='pw', role='artist',
+        )
+        self.student = User.objects.create_user(
+            username='student', email='student@example.com', phone='13900000000', password='pw',
+            currentPoints=50, vip_expiration_date=timezone.now() + timedelta(days=30),
+        )
+        published = Course.StatusChoices.PUBLISHED
+
+        def course(**kwargs):
+            return Course.objects.create(**{
+                'title': '课程', 'description': 'd', 'author': self.author, 'status': published, 'pricePoints': 100,
+                **kwargs,
+            })
+
+        def work(**kwargs):
+            return GalleryItem.objects.create(**{
+                'title': '作品', 'description': 'd', 'author': self.author, 'workFile': 'gallery_files/a.zip',
+                'status': GalleryItem.StatusChoices.PUBLISHED, 'requiredPoints': 30, **kwargs,
+            })
+
+        self.own_draft = course(author=self.student, status=Course.StatusChoices.DRAFT)
+        self.subscribed = course()
+        Subscription.objects.create(user=self.student, course=self.subscribed)
+        self.vip_free = course(is_vip_free=True)
+        self.expensive = course()
+        self.free = course(pricePoints=0)
+        self.draft = course(status=Course.StatusChoices.DRAFT)
+        self.prequel = work(requiredPoints=0)
+        GalleryDownloadRecord.objects.create(user=self.student, gallery_item=self.prequel, points_spent=0)
+        self.sequel = work(prerequisiteWork=self.prequel)
+        self.locked_sequel = work(prerequisiteWork=work())
+
+    def _items(self):
+        return [
+            ('course', self.own_draft.pk), ('course', self.subscribed.pk), ('course', self.vip_free.pk),
+            ('course', self.expensive.pk), ('course', self.free.pk), ('course', self.draft.pk), ('course', 999999),
+            ('gallery', self.prequel.pk), ('gallery', self.sequel.pk), ('gallery', self.locked_sequel.pk),
+        ]
+
+    def test_flags_for_student(self):
+        base = access_service.FOUND | access_service.PREREQUISITE_MET
+        self.assertEqual(access_service.check_access(self.student, self._items()), [
+            base | access_service.OWNED,
+            base | access_service.ACQUIRED,
+            base | access_service.VIP_FREE,
+            base,
+            base | access_service.FREE | access_service.AFFORDABLE,
+            0,
+            0,
+            base | access_service.ACQUIRED | access_service.FREE | access_service.AFFORDABLE,
+            base | access_service.AFFORDABLE,
+            access_service.FOUND | access_service.AFFORDABLE,
+        ])
+
+    def test_anonymous_user(self):
+        base = access_service.FOUND | access_service.PREREQUISITE_MET
+        self.assertEqual(access_service.check_access(AnonymousUser(), self._items()), [
+            0, base, base, base, base | access_service.FREE, 0, 0,
+            base | access_service.FREE, access_service.FOUND, access_service.FOUND,
+        ])
+
+    def test_query_count_is_fixed(self):
+        # 权益集合已加载后，课程、作品各一条查询，与条目数无关
+        access_service.check_access(self.student, self._items())
+        with self.assertNumQueries(2):
+            access_service.check_access(self.student, self._items() * 20)
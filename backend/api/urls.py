@@ -42,6 +42,10 @@ urlpatterns = [
     path('auth/change-mail/commit/', ChangeEmailCommitView.as_view(), name='change_email_commit'),
     path('certification/submit/', CertificationSubmitView.as_view(), name='certification_submit'),
     path('uploads/editor-image/', EditorImageView.as_view(), name='editor-image-upload'),
+    path('uploads/', views.ChunkedUploadCreateView.as_view(), name='chunked-upload-create'),
+    path('uploads/<uuid:pk>/', views.ChunkedUploadDetailView.as_view(), name='chunked-upload-detail'),
+    path('uploads/<uuid:pk>/finalize/', views.ChunkedUploadFinalizeView.as_view(), name='chunked-upload-finalize'),
+    path('access/check/', views.AccessCheckView.as_view(), name='access-check'),
     path('', include(router.urls)),    
     path('', include(communities_router.urls)),
     path('', include(posts_router.urls)),
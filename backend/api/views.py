@@ -1,4 +1,7 @@
 # backend/api/views.py
+import io
+import os
+import hashlib
 import random
 import json
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -9,6 +12,7 @@ from rest_framework.views import APIView
 from django.db.models import Count, Q,Exists,OuterRef,Subquery,Count,Prefetch
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import get_object_or_404,render
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.contenttypes.models import ContentType
@@ -20,6 +24,7 @@ from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.db import transaction
 from .permissions import IsStudent,IsArtist,IsAdmin,IsOwner,IsPaidUsers
+from .pagination import ReplyCursorPagination
 from .tasks import send_verification_code_email
 from .serializers import (
     UserRegisterSerializer, UserProfileSerializer, UserSummarySerializer,UserLoginSerializer,
@@ -29,20 +34,35 @@ from .serializers import (
     PasswordResetRequestSerializer, PasswordResetConfirmSerializer,
     CourseProgressSerializer, ExerciseSubmissionSerializer,UserExerciseSubmission,
     GalleryListSerializer, GalleryDetailSerializer, CourseCreateSerializer,GalleryItemCreateSerializer,CommunityCreateSerializer,
-    CommunityListSerializer, CommunityPostListSerializer, CommunityPostDetailSerializer,
+    CommunityListSerializer, CommunityPostListSerializer, CommunityPostDetailSerializer, CommunityReplySerializer,
     CommunityPostCreateSerializer,CommunityReplyCreateSerializer,
     CommunityDetailSerializer,MessageCreateSerializer,MessageThreadListSerializer,MessageThreadDetailSerializer,
     MyCollectionsSerializer,MySupportedSerializer,MyCreationsSerializer,MyParticipationsSerializer,
-    ChapterSerializer,ExerciseSerializer,PointsTransactionSerializer)
+    ChapterSerializer,ExerciseSerializer,PointsTransactionSerializer,CourseChangesSerializer,
+    ChunkedUploadSerializer,GalleryVersionSerializer,GalleryRatingSerializer,AccessCheckSerializer)
 from .models import (CertificationRequest,Course,Chapter,
                      Subscription,Collection,Exercise,UserChapterCompletion,
                      GalleryItem,GalleryCollection,GalleryDownloadRecord,
                      Community,CommunityPost,CommunityReply,
                      User,Tag,Message,MessageThread,
-                     UserExerciseCompletion,PointsTransaction)
+                     UserExerciseCompletion,PointsTransaction,CourseContentChange,CourseBundle,
+                     ChunkedUpload,GalleryItemDelta)
 import logging
 from .services import points as points_service # 导入我们的积分服务模块
 from .services.points import InsufficientPointsError # 导入自定义的"积分不足"异常
+from .services import sync as sync_service
+from .services import bundles as bundle_service
+from .services import delivery as delivery_service
+from .services import uploads as upload_service
+from .services import file_metadata as file_metadata_service
+from .services import deltas as delta_service
+from .services import versions as version_service
+from .services import ratings as rating_service
+from .services import likes as like_service
+from .services import hot_ranking as hot_ranking_service
+from .services import access as access_service
+from .services import bounties as bounty_service
+from search import query as search_service
 
 
 logger = logging.getLogger(__name__)
@@ -331,6 +351,97 @@ class EditorImageView(generics.CreateAPIView):
         return Response({'imageUrl': image_url}, status=status.HTTP_201_CREATED)
 
 
+class ChunkedUploadCreateView(generics.CreateAPIView):
+    """
+    POST /uploads/
+    创建分块上传会话：{"purpose": "gallery_work", "filename": "...", "size": 123}
+    之后用 PATCH /uploads/{id}/ 按偏移量上传分块，最后 POST /uploads/{id}/finalize/。
+    """
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            upload = upload_service.create_upload(request.user, data['purpose'], data['filename'], data['size'])
+        except upload_service.UploadError as e:
+            return Response({"detail": str(e)}, status=e.status_code)
+
+        response = Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(reverse('chunked-upload-detail', kwargs={'pk': upload.pk}))
+        return response
+
+
+class ChunkedUploadDetailView(APIView):
+    """
+    HEAD  /uploads/{id}/ -> 通过 Upload-Offset 响应头查询已接收的字节数 (断点续传前调用)
+    GET   /uploads/{id}/ -> 上传会话详情
+    PATCH /uploads/{id}/ -> 追加一个分块
+          请求头 Upload-Offset 必须等于服务器当前偏移量，
+          Content-Type 为 application/offset+octet-stream，请求体为原始字节。
+    """
+    permission_classes = [IsAuthenticated]
+
+    def _get_upload(self, request, pk):
+        return get_object_or_404(ChunkedUpload, pk=pk, owner=request.user)
+
+    @staticmethod
+    def _offset_headers(response, upload):
+        response['Upload-Offset'] = str(upload.offset)
+        response['Upload-Length'] = str(upload.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def get(self, request, pk):
+        upload = self._get_upload(request, pk)
+        return self._offset_headers(Response(ChunkedUploadSerializer(upload).data), upload)
+
+    def head(self, request, pk):
+        upload = self._get_upload(request, pk)
+        return self._offset_headers(Response(status=status.HTTP_200_OK), upload)
+
+    def patch(self, request, pk):
+        if request.content_type != 'application/offset+octet-stream':
+            return Response({"detail": "Content-Type 必须为 application/offset+octet-stream。"},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+        except (KeyError, ValueError):
+            return Response({"detail": "缺少或无效的 Upload-Offset 请求头。"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = None
+
+        try:
+            upload = upload_service.append_chunk(
+                pk, request.user, offset, request.stream or io.BytesIO(), content_length=content_length
+            )
+        except upload_service.UploadError as e:
+            return Response({"detail": str(e)}, status=e.status_code)
+
+        return self._offset_headers(Response(status=status.HTTP_204_NO_CONTENT), upload)
+
+
+class ChunkedUploadFinalizeView(APIView):
+    """
+    POST /uploads/{id}/finalize/
+    所有分块上传完成后调用，可选 {"sha256": "..."} 做端到端校验。
+    返回的 id 可作为 workFileUploadId / coverImageUploadId / certificationFileUploadId 提交。
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        try:
+            upload = upload_service.finalize_upload(pk, request.user, request.data.get('sha256'))
+        except upload_service.UploadError as e:
+            return Response({"detail": str(e)}, status=e.status_code)
+        return Response(ChunkedUploadSerializer(upload).data)
+
+
 # ===============================================
 # =======          课程模块视图          =======
 # ===============================================
@@ -526,6 +637,58 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
             id__in=completed_chapter_ids
         ).order_by('order').first()
         return next_chapter.id if next_chapter else None
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def changes(self, request, pk=None):
+        """
+        離線增量同步：返回遊標 (?cursor=) 之後新增、更新、刪除的章節/練習/選項。
+        不帶遊標 (或 cursor=0) 時返回完整內容及當前遊標，供客戶端首次緩存。
+        """
+        # 這裡不走 get_object()：列表用的 queryset 會預取全部訂閱者和收藏者
+        course = get_object_or_404(Course, pk=pk, status='published')
+        user = request.user
+
+        if course.author_id != user.id and not Subscription.objects.filter(user=user, course=course).exists():
+            return Response({"detail": "用戶未訂閱本課程"}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            cursor = int(request.query_params.get('cursor', 0))
+        except (TypeError, ValueError):
+            return Response({"detail": "cursor 必須是整數。"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if cursor <= 0:
+            changes = sync_service.get_snapshot(course)
+        else:
+            changes = sync_service.get_changes(course, cursor)
+
+        return Response(CourseChangesSerializer(changes, context={'request': request}).data)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def bundle(self, request, pk=None):
+        """
+        離線包下載：當前內容版本的離線包已生成時直接返回 zip (支持 Range 斷點續傳)，
+        否則觸發異步生成並返回 202，客戶端稍後輪詢同一地址。
+        """
+        course = get_object_or_404(Course, pk=pk, status='published')
+        user = request.user
+
+        if course.author_id != user.id and not Subscription.objects.filter(user=user, course=course).exists():
+            return Response({"detail": "用戶未訂閱本課程"}, status=status.HTTP_403_FORBIDDEN)
+
+        bundle = bundle_service.request_bundle(course)
+        if bundle.status != CourseBundle.StatusChoices.READY or not bundle.bundle_file:
+            return Response(
+                {"status": bundle.status, "content_version": bundle.content_version},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        return delivery_service.serve_file(
+            request,
+            bundle.bundle_file,
+            f"course_{course.pk}.zip",
+            content_type='application/zip',
+            etag=f'"{bundle.content_version}"',
+        )
     
 # ==============================================================================
 # 2. 新建 ChapterViewSet 並重構練習提交視圖
@@ -641,7 +804,7 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
     """
     用於處理畫廊作品列表、詳情及相關操作的視圖集
     """
-    queryset = GalleryItem.objects.filter(status='published').select_related('author', 'prerequisiteWork').prefetch_related('tags')
+    queryset = GalleryItem.objects.filter(status='published').select_related('author', 'prerequisiteWork', 'file_metadata').prefetch_related('tags')
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -656,10 +819,8 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
         if self.action not in ['list', 'retrieve']:
             return queryset
         user = self.request.user
-        queryset = queryset.annotate(
-            annotated_collectors_count=Count('collectors', distinct=True),
-            annotated_downloaders_count=Count('downloaders', distinct=True)
-        )
+        # 關注人數由序列化器只按當前頁的作品統計 (GalleryFollowersListSerializer)，
+        # 不在這裡對整個畫廊 GROUP BY，評分排序才能直接走 (status, -bayesian_score, -id) 索引
         if user and user.is_authenticated:
 
             collected_subquery = GalleryCollection.objects.filter(
@@ -675,6 +836,10 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
                 annotated_is_collected=Exists(collected_subquery),
                 annotated_is_downloaded=Exists(downloaded_subquery)
             )
+
+        # 評分排序直接讀取預先計算的貝葉斯平均分 (有索引)，不在查詢時聚合評分表
+        if self.request.query_params.get('ordering') == 'top_rated':
+            queryset = queryset.order_by('-bayesian_score', '-id')
         
         return queryset
     
@@ -700,6 +865,121 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({"detail": "You have not collected this work."}, status=status.HTTP_404_NOT_FOUND)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsStudent])
+    def rate(self, request, pk=None):
+        """為作品評分 (1-5)，重複提交視為修改評分。只有下載過作品的用戶可以評分。"""
+        work = self.get_object()
+        user = request.user
+        serializer = GalleryRatingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if not GalleryDownloadRecord.objects.filter(user=user, gallery_item=work).exists():
+            return Response({"detail": _("下載作品後才能評分。")}, status=status.HTTP_403_FORBIDDEN)
+
+        _rating, created = rating_service.rate(user, work, serializer.validated_data['rating'])
+        work.refresh_from_db(fields=['rating', 'rating_count'])
+        return Response({
+            "rating": work.rating,
+            "rating_count": work.rating_count,
+            "myRating": serializer.validated_data['rating'],
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        """
+        返回作品所在的完整版本鏈 (舊版本 -> 新版本) 以及當前用戶在每個版本上的下載狀態。
+        """
+        work = get_object_or_404(GalleryItem, pk=pk, status='published')
+        chain = version_service.get_chain_for_user(work.pk, request.user)
+        return Response({
+            "itemId": work.pk,
+            "versions": GalleryVersionSerializer(chain, many=True).data,
+        })
+
+    def _download_payload(self, request, work, user):
+        """
+        下載鏈接 + 已計算好的文件信息 (供客戶端展示大小、校驗完整性)。
+        客戶端傳入 baseItemId (本地已有的前一版本) 且差分補丁可用時，優先返回補丁。
+        """
+        full_url = delivery_service.signed_gallery_file_url(request, work, user)
+        payload = {"downloadType": "full", "downloadUrl": full_url}
+        metadata = file_metadata_service.get_current_metadata(work)
+        if metadata is not None:
+            payload.update({
+                "fileSize": metadata.size_bytes,
+                "sha256": metadata.sha256,
+                "mimeType": metadata.mime_type,
+            })
+
+        base_id = request.data.get('baseItemId')
+        if base_id and work.prerequisiteWork_id and str(base_id) == str(work.prerequisiteWork_id):
+            # 能走到這裡說明用戶已有前一版本的下載記錄 (見前置條件檢查)
+            delta = delta_service.get_usable_delta(work.prerequisiteWork, work)
+            if delta is not None:
+                payload.update({
+                    "downloadType": "delta",
+                    "downloadUrl": delivery_service.signed_gallery_file_url(request, work, user, delta=delta),
+                    "fullDownloadUrl": full_url,
+                    "delta": {
+                        "baseItemId": delta.source_id,
+                        "baseSha256": delta.source_sha256,
+                        "patchSize": delta.patch_size,
+                    },
+                })
+        return payload
+
+    @action(detail=True, methods=['get'], url_path='file',
+            permission_classes=[AllowAny], authentication_classes=[])
+    def file(self, request, pk=None):
+        """
+        憑 download 接口返回的簽名鏈接下載作品文件，支持 Range / If-Range 斷點續傳。
+        """
+        payload = delivery_service.read_download_token(request.query_params.get('token'))
+        if not payload or str(payload.get('w')) != str(pk):
+            return Response({"detail": _("下载链接无效或已过期。")}, status=status.HTTP_403_FORBIDDEN)
+
+        if payload.get('d'):
+            return self._serve_delta(request, pk, payload)
+
+        work = get_object_or_404(GalleryItem.objects.select_related('file_metadata'), pk=pk, status='published')
+        if not work.workFile or work.workFile.name != payload.get('f'):
+            # 作品文件已被替換，舊鏈接作廢，客戶端需重新調用 download
+            return Response({"detail": _("该作品的文件已更新，请重新下载。")}, status=status.HTTP_410_GONE)
+
+        file_name = work.workFile.name
+        metadata = file_metadata_service.get_current_metadata(work)
+        if metadata is not None:
+            # 元數據已算好：直接使用內容哈希作 ETag、已知大小，不再查詢存儲
+            return delivery_service.serve_file(
+                request, work.workFile, os.path.basename(file_name),
+                content_type=metadata.mime_type or None,
+                etag=f'"{metadata.sha256}"',
+                size=metadata.size_bytes,
+            )
+        return delivery_service.serve_file(
+            request,
+            work.workFile,
+            os.path.basename(file_name),
+            etag='"%s"' % hashlib.sha1(file_name.encode()).hexdigest()[:20],
+        )
+
+    def _serve_delta(self, request, pk, payload):
+        delta = get_object_or_404(
+            GalleryItemDelta, pk=payload['d'], target_id=pk, target__status='published',
+            status=GalleryItemDelta.StatusChoices.READY,
+        )
+        if not delta.patch_file or delta.patch_file.name != payload.get('f'):
+            return Response({"detail": _("该作品的文件已更新，请重新下载。")}, status=status.HTTP_410_GONE)
+
+        return delivery_service.serve_file(
+            request,
+            delta.patch_file,
+            f"{delta.target_id}_from_{delta.source_id}.delta",
+            content_type='application/octet-stream',
+            etag=f'"{delta.source_sha256[:20]}-{delta.target_sha256[:20]}"',
+            size=delta.patch_size,
+        )
+
     @action(detail=True, methods=['post'], permission_classes=[IsStudent])
     def download(self, request, pk=None):
         """
@@ -726,7 +1006,7 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
         # 3. 检查是否为重复下载
         is_redownload = GalleryDownloadRecord.objects.filter(user=user, gallery_item=work).exists()
         if is_redownload:
-            return Response({"downloadUrl": request.build_absolute_uri(work.workFile.url)})
+            return Response(self._download_payload(request, work, user))
 
         # 4. 检查是否为“免费”下载 (首次)
         is_student_vip = user.is_vip
@@ -743,7 +1023,7 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
                 points_spent=0, 
                 version_at_download=work.version
             )
-            return Response({"downloadUrl": request.build_absolute_uri(work.workFile.url)})
+            return Response(self._download_payload(request, work, user))
         
         # --- 走到这里，说明是付费的、首次下载 ---
 
@@ -795,11 +1075,33 @@ class GalleryItemViewSet(viewsets.ReadOnlyModelViewSet):
         
         # 9. 返回成功响应
         return Response({
-            "downloadUrl": request.build_absolute_uri(work.workFile.url),
+            **self._download_payload(request, work, user),
             "points_spent": price,
             "new_balance": tx_expense.balance_after # 告知前端新余额
         })
     
+# ===============================================
+# =======      目录页批量访问状态视图      =======
+# ===============================================
+
+class AccessCheckView(generics.GenericAPIView):
+    """
+    批量查詢課程 / 作品對當前用戶的訪問狀態 (已擁有 / 已訂閱 / VIP 免費 / 鎖定等角標)。
+    POST {"items": [{"type": "course", "id": 1}, ...]}
+    返回 {"flags": {"FOUND": 1, ...}, "access": [3, 0, ...]}，access 與 items 一一對應。
+    """
+    permission_classes = [AllowAny]
+    serializer_class = AccessCheckSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(item['type'], item['id']) for item in serializer.validated_data['items']]
+        return Response({
+            "flags": access_service.FLAGS,
+            "access": access_service.check_access(request.user, items),
+        })
+
 # ===============================================
 # =======          社群模块视图          =======
 # ===============================================
@@ -857,7 +1159,14 @@ class CommunityPostViewSet(viewsets.ModelViewSet):
         
         # 继承自 CommunityPostListView / DetailView 的逻辑
         if self.action in ['list', 'retrieve']:
-             qs = qs.filter(status='published')
+             qs = qs.filter(status='published').select_related('author')
+        if self.action == 'retrieve':
+            # 置顶的最佳答案和帖子一起取出
+            qs = qs.select_related('best_answer__author')
+
+        # 热度排序读取预先维护的 hot_score (有索引)，不在请求时统计点赞和回复
+        if self.action == 'list' and self.request.query_params.get('ordering') == 'hot':
+            qs = qs.order_by('-hot_score', '-id')
         
         # 继承自 CommunityPostDestroyView (虽然 IsOwner 权限会做检查，但双重保险)
         if self.action == 'destroy':
@@ -904,19 +1213,14 @@ class CommunityPostViewSet(viewsets.ModelViewSet):
         if user.accountStatus == 'suspended':
             raise serializers.ValidationError({"error": "您的账户已被禁言，无法发布帖子。"})
             
-        community = get_object_or_404(Community, pk=self.kwargs.get('community_pk'))
+        # 社群是否存在已由 IsPaidUsers 通过门禁映射确认，这里不再查询社群
         reward_points = serializer.validated_data.get('rewardPoints', 0)
         
-        post = serializer.save(author=user, community=community)
+        post = serializer.save(author=user, community_id=self.kwargs.get('community_pk'))
         if reward_points > 0:
             try:
-                points_service.adjust_points(
-                    user=user,
-                    amount=-reward_points,
-                    transaction_type=PointsTransaction.TransactionType.COMMUNITY_REWARD,
-                    description=f"发布悬赏帖子: {post.title}",
-                    related_object=post #关联帖子
-                )
+                # 悬赏积分进入托管，到期未采纳会自动退回
+                bounty_service.hold(post, user, reward_points)
             except InsufficientPointsError:
                 raise serializers.ValidationError({"error": "您的积分不足以支付悬赏。"})
             except Exception as e:
@@ -926,15 +1230,11 @@ class CommunityPostViewSet(viewsets.ModelViewSet):
     def like(self, request, community_pk=None, post_pk=None):
         """
         继承自 CommunityPostLikeView.post
+        点赞状态由 Redis 维护，数据库中的 likes 由后台任务批量写回。
         """
         post = self.get_object() 
-        user = request.user
-        if user in post.likes.all():
-            post.likes.remove(user)
-            return Response({"status": "unliked", "likes_count": post.likes.count()})
-        else:
-            post.likes.add(user)
-            return Response({"status": "liked", "likes_count": post.likes.count()})
+        liked, likes_count = like_service.toggle_like(post, request.user)
+        return Response({"status": "liked" if liked else "unliked", "likes_count": likes_count})
 
 class CommunityReplyViewSet(mixins.CreateModelMixin, 
                           mixins.ListModelMixin, # (推荐) 添加 List
@@ -945,12 +1245,25 @@ class CommunityReplyViewSet(mixins.CreateModelMixin,
     queryset = CommunityReply.objects.all().order_by('-created_at')
     serializer_class = CommunityReplyCreateSerializer
     permission_classes = [IsStudent] 
+    pagination_class = ReplyCursorPagination
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CommunityReplySerializer
+        return CommunityReplyCreateSerializer
+
+    def _post_pk(self):
+        # 嵌套路由 lookup='post' 加上帖子视图的 lookup_url_kwarg='post_pk'，URL 参数名为 post_post_pk
+        return self.kwargs.get('post_post_pk')
 
     def get_queryset(self):
         """根据 URL 中的 post_pk 过滤回复"""
-        return super().get_queryset().filter(
-            post_id=self.kwargs.get('post_pk')
+        queryset = super().get_queryset().filter(
+            post_id=self._post_pk()
         )
+        if self.action == 'list':
+            queryset = queryset.select_related('author')
+        return queryset
 
     def perform_create(self, serializer):
         """
@@ -961,11 +1274,18 @@ class CommunityReplyViewSet(mixins.CreateModelMixin,
             raise serializers.ValidationError({"error": "您的账户已被禁言，无法发布回复。"})
         
         # 注意: 我们从 URL 中获取 post_pk
-        post = get_object_or_404(CommunityPost, pk=self.kwargs.get('post_pk'))
+        post = get_object_or_404(CommunityPost, pk=self._post_pk())
         serializer.save(author=self.request.user, post=post)
+
+    @action(detail=True, methods=['post'])
+    def like(self, request, pk=None, **kwargs):
+        """点赞 / 取消点赞回复"""
+        reply = self.get_object()
+        liked, likes_count = like_service.toggle_like(reply, request.user)
+        return Response({"status": "liked" if liked else "unliked", "likes_count": likes_count})
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
-    def mark_as_best_answer(self, request, community_pk=None, post_pk=None, pk=None):
+    def mark_as_best_answer(self, request, pk=None, **kwargs):
         """
         [新增] 将此回复 (pk) 标记为所属帖子 (post_pk) 的最佳答案。
         
@@ -998,9 +1318,6 @@ class CommunityReplyViewSet(mixins.CreateModelMixin,
                 status=status.HTTP_409_CONFLICT
             )
             
-        # 3. 检查悬赏金额
-        reward_points = post.rewardPoints
-        
         try:
             # 4. [核心] 使用事务
             with transaction.atomic():
@@ -1009,25 +1326,11 @@ class CommunityReplyViewSet(mixins.CreateModelMixin,
                 post.best_answer = reply
                 post.status = CommunityPost.StatusChoices.CLOSED # 采纳后自动关闭帖子
                 post.save(update_fields=['best_answer', 'status'])
+                hot_ranking_service.record_event(post.pk, 'best_answer')
                 
-                # 6. 如果有悬赏，调用服务发放积分
-                if reward_points > 0:
-                    
-                    # 检查：不能自己给自己发奖
-                    if post_author == reply_author:
-                        # 这是一个业务决策：你可以选择退还积分，
-                        # 或只是标记答案但不发奖。我们选择后者。
-                        pass # 作者采纳自己的回答，不发放积分
-                    else:
-                        # --- 这是核心 ---
-                        # 将积分“发放”给回复的作者
-                        points_service.adjust_points(
-                            user=reply_author,
-                            amount=reward_points, # 正数，表示收入
-                            transaction_type=PointsTransaction.TransactionType.BOUNTY_AWARD,
-                            description=f"赢得悬赏: '{post.title}'",
-                            related_object=post # 关联到这个帖子
-                        )
+                # 6. 如果有托管中的悬赏，发放给回复的作者
+                #    作者采纳自己的回答时退回托管积分；悬赏已到期退回时不再发放
+                reward_points = bounty_service.award(post, reply_author)
 
         except Exception as e:
             logging.error(f"在发放悬赏时发生内部错误: {e}", exc_info=True)
@@ -1040,7 +1343,7 @@ class CommunityReplyViewSet(mixins.CreateModelMixin,
         return Response(
             {
                 "detail": _("成功采纳为最佳答案！"),
-                "reward_points_awarded": reward_points if post_author != reply_author else 0,
+                "reward_points_awarded": reward_points,
                 "best_answer_id": reply.id
             },
             status=status.HTTP_200_OK
@@ -1224,14 +1527,21 @@ class UserSearchView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        # 从 URL query a参数中获取搜索关键词
-       query = self.request.query_params.get('q', None)
-       if query:
-        return User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(nickname__icontains=query)
-        ).filter(is_active=True)[:10]
-       return User.objects.none() 
+        # 从 URL query 参数中获取搜索关键词，由输入提示服务 (ES，后备为 pg_trgm 索引) 匹配，
+        # 不再对整个用户表做 icontains。用户名或昵称中包含 q (两个字符以上的子串) 或以 q 开头的都能找到，
+        # 以 q 开头的排在前面
+        query = self.request.query_params.get('q', '').strip()[:50]
+        if not query:
+            return User.objects.none()
+        ids = [item['id'] for item in search_service.suggest('user', query)]
+        users = User.objects.in_bulk(ids)
+        return [users[pk] for pk in ids if pk in users]
+
+    def list(self, request, *args, **kwargs):
+        try:
+            return super().list(request, *args, **kwargs)
+        except search_service.SearchUnavailable:
+            return Response({"detail": "搜索服务暂时不可用，请稍后再试。"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 # ===============================================
 # =======     个人中心 API 视图            =======
 # ===============================================
@@ -1494,8 +1804,13 @@ class ChapterOrderUpdateView(generics.GenericAPIView):
             
         # 批量更新排序
         with transaction.atomic(): # 确保操作的原子性
+            now = timezone.now()
+            updated_ids = []
             for index, chapter_id in enumerate(chapter_ids):
-                Chapter.objects.filter(id=chapter_id, course=course).update(order=index + 1)
+                # update() 不会触发 auto_now 和信号，需手动更新时间并补写同步日志
+                if Chapter.objects.filter(id=chapter_id, course=course).update(order=index + 1, updated_at=now):
+                    updated_ids.append(chapter_id)
+            sync_service.record_bulk_changes(course.pk, CourseContentChange.Kind.CHAPTER, updated_ids)
                 
         return Response({"status": "顺序已更新"}, status=status.HTTP_200_OK)
 class ExerciseCreateView(generics.CreateAPIView):
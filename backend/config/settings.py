@@ -14,6 +14,7 @@ from pathlib import Path
 import os 
 from environ import Env  # 导入 Env 类
 from datetime import timedelta
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -159,6 +160,38 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# 定时任务 (由 celery beat 调度)
+CELERY_BEAT_SCHEDULE = {
+    'cleanup-expired-chunked-uploads': {
+        'task': 'api.tasks.cleanup_expired_uploads',
+        'schedule': timedelta(hours=1),
+    },
+    'collect-unreferenced-media-blobs': {
+        'task': 'api.tasks.collect_media_blobs',
+        'schedule': timedelta(hours=6),
+    },
+    'flush-pending-likes': {
+        'task': 'api.tasks.flush_pending_likes',
+        'schedule': timedelta(seconds=10),
+    },
+    'decay-community-hot-scores': {
+        'task': 'api.tasks.decay_community_hot_scores',
+        'schedule': timedelta(hours=1),
+    },
+    'refund-expired-bounties': {
+        'task': 'api.tasks.refund_expired_bounties',
+        'schedule': timedelta(minutes=15),
+    },
+    'flush-search-index-buffer': {
+        'task': 'search.flush_index_buffer',
+        'schedule': timedelta(seconds=10),
+    },
+    'audit-search-index': {
+        'task': 'search.audit_search_index',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+
 # 4. 缓存 (Cache) 的配置
 CACHES = {
     "default": {
@@ -179,6 +212,79 @@ CORS_ALLOWED_ORIGINS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 不公开的上传文件 (画廊作品文件、差分补丁、分块上传的临时文件) 放在 MEDIA_ROOT 之外，
+# 不由 MEDIA_URL 提供，只能经过权限检查后的签名下载接口获取
+PROTECTED_MEDIA_ROOT = os.path.join(BASE_DIR, 'protected_media')
+# 去重存储的内容文件 (按 SHA-256 命名)，公开和不公开的文件都链接到这里，同样不能对外提供；
+# 必须与 MEDIA_ROOT / PROTECTED_MEDIA_ROOT 在同一文件系统
+MEDIA_BLOB_ROOT = os.path.join(PROTECTED_MEDIA_ROOT, 'blobs')
+
+# 上传文件按内容去重存储 (api/storage.py)，静态文件保持 Django 默认
+STORAGES = {
+    "default": {
+        "BACKEND": "api.storage.ContentAddressedStorage",
+    },
+    "protected": {
+        "BACKEND": "api.storage.ContentAddressedStorage",
+        "OPTIONS": {"location": PROTECTED_MEDIA_ROOT, "base_url": None},
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# 大文件下发：'nginx' 使用 X-Accel-Redirect，'xsendfile' 使用 X-Sendfile，留空则由 Django 自己流式发送
+SENDFILE_BACKEND = env('SENDFILE_BACKEND', default=None)
+# nginx 中映射到 MEDIA_ROOT / PROTECTED_MEDIA_ROOT 的 internal location
+SENDFILE_URL_PREFIX = env('SENDFILE_URL_PREFIX', default='/protected-media/')
+SENDFILE_PROTECTED_URL_PREFIX = env('SENDFILE_PROTECTED_URL_PREFIX', default='/protected-files/')
+# 签名下载链接的有效期 (秒)
+DOWNLOAD_URL_MAX_AGE = env.int('DOWNLOAD_URL_MAX_AGE', default=300)
+
+# 图片派生版本 (缩略图 / WebP) 的目标宽度，按用途区分
+IMAGE_DERIVATIVE_WIDTHS = {
+    'avatar': [64, 128, 256],
+    'cover': [320, 640, 1280],
+    'exercise': [480, 960],
+}
+
+# 作品版本差分补丁超过新版本文件大小的这个比例时不使用，直接下载完整文件
+GALLERY_DELTA_MAX_RATIO = 0.5
+
+# 画廊作品贝叶斯平均分：score = (C * m + 评分总和) / (C + 评分人数)
+# m 为先验平均分，C 为先验权重 (相当于每个作品先有 C 个 m 分的虚拟评分)，少量高分不会排到最前。
+# 修改后需要执行 api.services.ratings.recompute_aggregates() 重新计算已有作品。
+GALLERY_RATING_PRIOR_MEAN = 3.0
+GALLERY_RATING_PRIOR_WEIGHT = 10
+
+# 社群帖子热度：各类事件的加分，以及热度衰减的半衰期 (小时)
+COMMUNITY_HOT_WEIGHTS = {
+    'post': 10.0,
+    'like': 1.0,
+    'reply': 3.0,
+    'best_answer': 5.0,
+}
+COMMUNITY_HOT_HALF_LIFE_HOURS = 24
+
+# 离线增量同步：自增 id 按插入顺序分配，但事务可能乱序提交；
+# 游标只推进到这么多秒之前的变更，之后的变更会在下次同步时重新返回 (upsert 是幂等的)
+COURSE_SYNC_CURSOR_SAFETY_SECONDS = 30
+
+# 悬赏托管：发布后多少天内未采纳最佳答案则退回积分；退款任务每批 / 每次运行的处理量
+BOUNTY_ESCROW_DAYS = 14
+BOUNTY_REFUND_BATCH_SIZE = 1000
+BOUNTY_REFUND_MAX_BATCHES = 100
+
+# 分块上传：临时文件不能公开访问，放在 PROTECTED_MEDIA_ROOT 下 (与 MEDIA_ROOT 同一文件系统)，
+# 完成后可以直接 rename 到目标位置
+CHUNKED_UPLOAD_DIR = os.path.join(PROTECTED_MEDIA_ROOT, 'chunked_uploads')
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+CHUNKED_UPLOAD_MAX_SIZE = {
+    'gallery_work': 10 * 1024 ** 3,
+    'course_cover': 20 * 1024 ** 2,
+    'certification': 50 * 1024 ** 2,
+}
+
 # 邮件配置 (开发环境使用控制台后端)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -339,4 +445,25 @@ ELASTICSEARCH_DSL = {
 }
 
 ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'search.custom_signal_processor.CelerySignalProcessor'
-ELASTICSEARCH_DSL_AUTO_REFRESH = False
\ No newline at end of file
+ELASTICSEARCH_DSL_AUTO_REFRESH = False
+# 索引缓冲区超过这个条目数时立即刷新，不等定时任务
+SEARCH_BUFFER_FLUSH_SIZE = 5000
+# 每次 _bulk 请求的文档数 (同时也是从数据库分块读取的大小)
+SEARCH_BULK_CHUNK_SIZE = 1000
+# 搜索接口：ES 端单次查询的超时，以及相同查询结果的缓存时间 (秒)
+SEARCH_TIMEOUT = '200ms'
+SEARCH_CACHE_TTL = 30
+# 输入提示 (每次按键一次请求) 的 ES 超时，超时返回已收集到的部分结果
+SEARCH_SUGGEST_TIMEOUT = '20ms'
+# 搜索后端 (search/backends.py)：主后端出错 / 过慢 / 熔断时改用后备后端；不需要后备时设为 None
+SEARCH_BACKEND = 'search.backends.ElasticsearchBackend'
+SEARCH_FALLBACK_BACKEND = 'search.backends.PostgresBackend'
+# 数据库全文检索的分词配置 ('simple' 按空白和标点切分；中日韩文本写入前已展开成两字词，见 search/cjk.py)
+SEARCH_PG_CONFIG = 'simple'
+# 熔断器：WINDOW 秒内失败 (或慢于 SLOW_SECONDS) THRESHOLD 次后，COOLDOWN 秒内直接使用后备后端
+SEARCH_BREAKER_THRESHOLD = 5
+SEARCH_BREAKER_WINDOW = 30
+SEARCH_BREAKER_COOLDOWN = 30
+SEARCH_BREAKER_SLOW_SECONDS = 0.5
+# 一致性审计 (search/audit.py) 忽略最近这么多秒内修改的对象 (可能还在索引缓冲区里)
+SEARCH_AUDIT_GRACE_SECONDS = 300
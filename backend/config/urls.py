@@ -92,6 +92,7 @@ for name, var in locals().copy().items():
 urlpatterns = [
     path('admin/', site.urls),
     path('v1/', include('api.urls')),
+    path('v1/search/', include('search.urls')),
     path('tinymce/', include('tinymce.urls')),
 ]
 
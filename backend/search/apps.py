@@ -7,4 +7,5 @@ class SearchConfig(AppConfig):
 
     def ready(self):
 
-        from . import search_indexes
\ No newline at end of file
+        from . import search_indexes
+        from . import signals
\ No newline at end of file
@@ -0,0 +1,175 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_elasticsearch_dsl.registries import registry
+from . import buffer as search_buffer
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 数据库 / 索引一致性审计
+# 索引更新可能丢失 (任务重试耗尽、绕过信号的 queryset.update 等)，索引会悄悄和数据库不一致。
+# 审计按主键升序同时遍历两边：数据库用服务器端游标分块读取 (pk, updated_at)，
+# ES 在一个 point-in-time 快照上按 id 排序用 search_after 分页读取同样的两列，
+# 像归并排序一样逐条比较，内存占用只和块大小有关。
+# - 数据库有、索引没有 (missing) 或 updated_at 不同 (stale) 的重新放入索引缓冲区；
+# - 索引有、数据库没有 (orphaned) 的放入删除缓冲区。
+# 最近 SEARCH_AUDIT_GRACE_SECONDS 秒内修改的对象可能还在缓冲区里，不算不一致。
+# 没有 updated_at 的模型 (标签、用户) 只比较是否存在。
+# -----------------------------------------------------------------------------
+
+AUDIT_LOCK_KEY = 'search:audit:lock'
+AUDIT_LOCK_TIMEOUT = 60 * 60 * 6
+PIT_KEEP_ALIVE = '5m'
+# 报告中每类不一致最多列出的主键数
+SAMPLE_SIZE = 20
+
+
+class AuditInProgress(Exception):
+    """已有审计正在执行"""
+
+
+def _has_updated_at(model):
+    return any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+
+def _db_rows(model, chunk_size):
+    columns = ('pk', 'updated_at') if _has_updated_at(model) else ('pk',)
+    rows = model._default_manager.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield row[0], row[1] if len(row) > 1 else None
+
+
+def _index_rows(doc_class, chunk_size):
+    es = doc_class._get_connection()
+    pit = es.open_point_in_time(index=doc_class._index._name, keep_alive=PIT_KEEP_ALIVE)['id']
+    search_after = None
+    try:
+        while True:
+            response = es.search(
+                pit={'id': pit, 'keep_alive': PIT_KEEP_ALIVE},
+                sort=[{'id': 'asc'}],
+                search_after=search_after,
+                size=chunk_size,
+                source=['updated_at'],
+                track_total_hits=False,
+            )
+            pit = response.get('pit_id', pit)
+            hits = response['hits']['hits']
+            for hit in hits:
+                value = hit['_source'].get('updated_at')
+                yield hit['sort'][0], parse_datetime(value) if value else None
+            if len(hits) < chunk_size:
+                return
+            search_after = hits[-1]['sort']
+    finally:
+        es.close_point_in_time(id=pit)
+
+
+def _merge(db_rows, index_rows):
+    """按主键归并两个有序序列，产生 (pk, 数据库的 updated_at, 索引的 updated_at)；缺失的一侧为 ..."""
+    db_row = next(db_rows, None)
+    index_row = next(index_rows, None)
+    while db_row is not None or index_row is not None:
+        if index_row is None or (db_row is not None and db_row[0] < index_row[0]):
+            yield db_row[0], db_row[1], ...
+            db_row = next(db_rows, None)
+        elif db_row is None or index_row[0] < db_row[0]:
+            yield index_row[0], ..., index_row[1]
+            index_row = next(index_rows, None)
+        else:
+            yield db_row[0], db_row[1], index_row[1]
+            db_row = next(db_rows, None)
+            index_row = next(index_rows, None)
+
+
+class _Requeue:
+    """攒够一块再放入缓冲区"""
+
+    def __init__(self, model, chunk_size, enabled):
+        self.model = model
+        self.chunk_size = chunk_size
+        self.enabled = enabled
+        self.pending = {search_buffer.enqueue_update: [], search_buffer.enqueue_delete: []}
+
+    def add(self, enqueue, pk):
+        self.pending[enqueue].append(pk)
+        if len(self.pending[enqueue]) >= self.chunk_size:
+            self.flush(enqueue)
+
+    def flush(self, enqueue=None):
+        for target in ([enqueue] if enqueue else list(self.pending)):
+            if self.enabled and self.pending[target]:
+                target(self.model, self.pending[target])
+            self.pending[target] = []
+
+
+def audit_document(doc_class, chunk_size=None, requeue=True, grace_seconds=None):
+    """
+    [公共] 审计一个索引，返回报告：
+    {'index', 'checked', 'missing', 'stale', 'orphaned', 'skipped', 'samples': {类别: [pk, ...]}}。
+    requeue 为 False 时只报告不修复。
+    """
+    chunk_size = chunk_size or settings.SEARCH_BULK_CHUNK_SIZE
+    grace = settings.SEARCH_AUDIT_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    model = doc_class.django.model
+
+    report = {'index': doc_class._index._name, 'checked': 0, 'missing': 0, 'stale': 0, 'orphaned': 0, 'skipped': 0}
+    samples = {'missing': [], 'stale': [], 'orphaned': []}
+    requeue_buffer = _Requeue(model, chunk_size, requeue)
+
+    for pk, db_updated, index_updated in _merge(_db_rows(model, chunk_size), _index_rows(doc_class, chunk_size)):
+        report['checked'] += 1
+        if db_updated is ...:
+            kind, enqueue = 'orphaned', search_buffer.enqueue_delete
+        elif db_updated is not None and db_updated > cutoff:
+            # 刚修改过，缓冲区可能还没刷新
+            report['skipped'] += 1
+            continue
+        elif index_updated is ...:
+            kind, enqueue = 'missing', search_buffer.enqueue_update
+        elif db_updated != index_updated:
+            kind, enqueue = 'stale', search_buffer.enqueue_update
+        else:
+            continue
+        report[kind] += 1
+        if len(samples[kind]) < SAMPLE_SIZE:
+            samples[kind].append(pk)
+        requeue_buffer.add(enqueue, pk)
+
+    requeue_buffer.flush()
+    report['samples'] = samples
+    return report
+
+
+def audit(indices=None, chunk_size=None, requeue=True, grace_seconds=None):
+    """
+    [公共] 审计 indices (索引名列表，默认全部) 并把不一致的文档放回缓冲区，返回各索引的报告列表。
+    同一时间只执行一个审计；已有审计在执行时抛出 AuditInProgress。
+    """
+    documents = {doc._index._name: doc for doc in registry.get_documents()}
+    names = indices or sorted(documents)
+    unknown = set(names) - set(documents)
+    if unknown:
+        raise ValueError(f"未知的索引: {', '.join(sorted(unknown))}")
+
+    if not cache.add(AUDIT_LOCK_KEY, 1, AUDIT_LOCK_TIMEOUT):
+        raise AuditInProgress()
+    try:
+        reports = []
+        for name in names:
+            report = audit_document(documents[name], chunk_size, requeue, grace_seconds)
+            drift = report['missing'] + report['stale'] + report['orphaned']
+            log = logger.warning if drift else logger.info
+            log(
+                f"Search index audit {name}: checked {report['checked']}, missing {report['missing']}, "
+                f"stale {report['stale']}, orphaned {report['orphaned']}, skipped {report['skipped']}"
+            )
+            reports.append(report)
+        return reports
+    finally:
+        cache.delete(AUDIT_LOCK_KEY)
@@ -0,0 +1,441 @@
+import logging
+import re
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import DatabaseError, connection
+from django.db.models import Count, F, FloatField, Q, Value
+from django.db.models.functions import Cast, Greatest
+from elasticsearch import ApiError, TransportError
+from elasticsearch_dsl import MultiSearch, Q as ESQ, Search, connections
+from api.models import Course, GalleryItem, CommunityPost, Tag, User
+from . import cjk
+from .search_indexes import CourseDocument, GalleryItemDocument, CommunityPostDocument, TagDocument, UserDocument
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# 搜索后端
+# 每个后端实现 search(params, search_after=None)，返回相同结构的结果 (见 query.search)，
+# 游标里的排序值只对签发它的后端有意义；以及输入提示 suggest(kind, q, limit, scope=None)。
+# - ElasticsearchBackend: 三个索引一次 _msearch；输入提示查询 search_as_you_type 字段；
+# - PostgresBackend: 基于各表 search_vector (tsvector + GIN 索引) 的数据库全文检索，
+#   中日韩文本按两字词切分 (search/cjk.py)；输入提示使用 pg_trgm 三元组 GIN 索引；
+#   ES 不可用或重建索引时作为后备，也可以在没有 ES 的本地环境中单独使用。
+# -----------------------------------------------------------------------------
+
+DOCUMENTS = {
+    'course': CourseDocument,
+    'gallery': GalleryItemDocument,
+    'community': CommunityPostDocument,
+}
+DOC_TYPES = tuple(DOCUMENTS)
+# 帖子没有标签
+TAGGED_TYPES = ('course', 'gallery')
+
+SOURCE_FIELDS = ['id', 'doc_type', 'title', 'author', 'tags', 'points', 'is_vip_free', 'created_at', 'likes_count', 'rating']
+POINTS_RANGES = [
+    {'key': 'free', 'to': 1},
+    {'key': '1-100', 'from': 1, 'to': 101},
+    {'key': '101-500', 'from': 101, 'to': 501},
+    {'key': '500+', 'from': 501},
+]
+TAG_FACET_SIZE = 20
+
+# 输入提示的种类：课程 / 画廊作品标题、标签名、用户名和昵称
+SUGGEST_KINDS = ('title', 'tag', 'user')
+SUGGEST_TITLE_TYPES = ('course', 'gallery')
+# 确认过非空的索引在这段时间内不再检查 (秒)
+POPULATED_CACHE_TTL = 60 * 10
+
+
+class SearchUnavailable(Exception):
+    """后端不可用或查询失败"""
+
+
+class SearchBackend:
+    name = None
+
+    def search(self, params, search_after=None):
+        """
+        params 为 SearchQuerySerializer 校验后的数据。search_after 为 None 时查询
+        params['doc_type'] (默认全部) 的第一页并返回分面；否则为 (doc_type, 排序值)，只查询这一类型的下一页。
+        返回 ({doc_type: {'results', 'next_sort', 'count'?, 'timed_out'?}}, facets 或 None)；
+        timed_out 为 True 表示查询超时，结果只是部分分片的。
+        """
+        raise NotImplementedError
+
+    def suggest(self, kind, q, limit, scope=None):
+        """
+        按前缀匹配返回最多 limit 条输入提示 (kind 见 SUGGEST_KINDS；scope 只用于标签)：
+        title -> {id, doc_type, title}；tag -> {id, name, scope}；user -> {id, username, nickname}。
+        """
+        raise NotImplementedError
+
+
+def facets_from_counts(totals, vip, points, tags):
+    """把各类型的计数合并成一组分面；标签只有 id，名称一次查询补齐"""
+    top_tags = sorted(tags.items(), key=lambda item: -item[1])[:TAG_FACET_SIZE]
+    names = dict(Tag.objects.filter(pk__in=[tag_id for tag_id, _ in top_tags]).values_list('id', 'name'))
+    return {
+        'doc_type': [{'key': doc_type, 'count': count} for doc_type, count in totals.items()],
+        'tags': [{'id': tag_id, 'name': names.get(tag_id), 'count': count} for tag_id, count in top_tags],
+        'is_vip_free': [{'key': key, 'count': count} for key, count in vip.items()],
+        'points': [{'key': item['key'], 'count': points.get(item['key'], 0)} for item in POINTS_RANGES],
+    }
+
+
+def _add_counts(target, key, count):
+    target[key] = target.get(key, 0) + count
+
+
+# ==================
+# 1. Elasticsearch
+# ==================
+class ElasticsearchBackend(SearchBackend):
+    name = 'es'
+    SEARCH_FIELDS = ['title^3', 'author.name', 'tags.name']
+
+    def _filters(self, params):
+        filters = [ESQ('term', status='published')]
+        if params.get('tags'):
+            filters.append(ESQ('terms', **{'tags.id': params['tags']}))
+        if params.get('is_vip_free') is not None:
+            filters.append(ESQ('term', is_vip_free=params['is_vip_free']))
+        points = {}
+        if params.get('points_min') is not None:
+            points['gte'] = params['points_min']
+        if params.get('points_max') is not None:
+            points['lte'] = params['points_max']
+        if points:
+            filters.append(ESQ('range', points=points))
+        return filters
+
+    def _build(self, doc_type, params, sort_values=None):
+        q = params.get('q')
+        query = ESQ('multi_match', query=q, fields=self.SEARCH_FIELDS) if q else ESQ('match_all')
+        # 标题与查询完全相同的排在最前 (title.raw 为不分词的原文)
+        should = [ESQ('term', **{'title.raw': {'value': q, 'boost': 10}})] if q else []
+        sort = ([{'_score': 'desc'}] if q else []) + [{'created_at': 'desc'}, {'id': 'desc'}]
+
+        search = (
+            DOCUMENTS[doc_type].search()
+            .query(ESQ('bool', must=[query], should=should, filter=self._filters(params)))
+            .sort(*sort)
+            .source(SOURCE_FIELDS)
+            .highlight('title', number_of_fragments=0, pre_tags=['<em>'], post_tags=['</em>'])
+            .extra(size=params['page_size'], timeout=settings.SEARCH_TIMEOUT)
+        )
+        if sort_values is not None:
+            # 翻页不需要总数和分面
+            return search.extra(search_after=sort_values, track_total_hits=False)
+
+        search.aggs.bucket('is_vip_free', 'terms', field='is_vip_free')
+        search.aggs.bucket('points', 'range', field='points', ranges=POINTS_RANGES)
+        if doc_type in TAGGED_TYPES:
+            search.aggs.bucket('tags', 'terms', field='tags.id', size=TAG_FACET_SIZE)
+        return search
+
+    def _section(self, response, page_size):
+        results = []
+        for hit in response.hits:
+            item = hit.to_dict()
+            highlight = getattr(hit.meta, 'highlight', None)
+            item['highlight'] = highlight.title[0] if highlight and 'title' in highlight else None
+            results.append(item)
+        section = {
+            'results': results,
+            'next_sort': list(response.hits[-1].meta.sort) if len(response.hits) == page_size else None,
+            # 超过 SEARCH_TIMEOUT 时 ES 仍返回 200，只带已完成分片的结果
+            'timed_out': bool(response.timed_out),
+        }
+        total = getattr(response.hits, 'total', None)
+        if total is not None:
+            section['count'] = total.value
+        return section
+
+    def _facets(self, responses):
+        totals, vip, points, tags = {}, {}, {}, {}
+        for doc_type, response in responses.items():
+            totals[doc_type] = response.hits.total.value
+            aggs = response.aggregations
+            for bucket in aggs.is_vip_free.buckets:
+                _add_counts(vip, bucket.key_as_string, bucket.doc_count)
+            for bucket in aggs.points.buckets:
+                _add_counts(points, bucket.key, bucket.doc_count)
+            if doc_type in TAGGED_TYPES:
+                for bucket in aggs.tags.buckets:
+                    _add_counts(tags, bucket.key, bucket.doc_count)
+        return facets_from_counts(totals, vip, points, tags)
+
+    def search(self, params, search_after=None):
+        if search_after is not None:
+            doc_type, sort_values = search_after
+            searches = {doc_type: self._build(doc_type, params, sort_values)}
+        else:
+            searches = {doc_type: self._build(doc_type, params) for doc_type in params.get('doc_type') or DOC_TYPES}
+
+        multi = MultiSearch()
+        for search_obj in searches.values():
+            multi = multi.add(search_obj)
+        try:
+            responses = dict(zip(searches, multi.execute()))
+        except (ApiError, TransportError) as e:
+            logger.error(f"Elasticsearch search failed: {e}")
+            raise SearchUnavailable() from e
+
+        sections = {doc_type: self._section(response, params['page_size']) for doc_type, response in responses.items()}
+        return sections, None if search_after is not None else self._facets(responses)
+
+    @staticmethod
+    def _prefix_query(q, *names):
+        # search_as_you_type 的根字段和 shingle 子字段一起查询，最后一个词按前缀匹配
+        return ESQ('multi_match', query=q, type='bool_prefix', fields=[
+            name + suffix for name in names for suffix in ('', '._2gram', '._3gram')
+        ])
+
+    def suggest(self, kind, q, limit, scope=None):
+        if kind == 'title':
+            indices = [DOCUMENTS[doc_type]._index._name for doc_type in SUGGEST_TITLE_TYPES]
+            search = Search(index=indices).query(ESQ(
+                'bool', must=[self._prefix_query(q, 'title_suggest')], filter=[ESQ('term', status='published')],
+            )).source(['id', 'doc_type', 'title'])
+        elif kind == 'tag':
+            filters = [ESQ('term', scope=scope)] if scope else []
+            indices = [TagDocument._index._name]
+            search = TagDocument.search().query(ESQ(
+                'bool', must=[self._prefix_query(q, 'name')], filter=filters,
+            )).source(['id', 'name', 'scope'])
+        else:
+            # 前缀命中的排在前面；子串字段保留原来 icontains 的匹配范围
+            indices = [UserDocument._index._name]
+            search = UserDocument.search().query(ESQ(
+                'bool',
+                should=[
+                    ESQ('bool', must=[self._prefix_query(q, 'username', 'nickname')], boost=2),
+                    ESQ('multi_match', query=q, fields=['username_substring', 'nickname_substring'], operator='and'),
+                ],
+                minimum_should_match=1,
+                filter=[ESQ('term', is_active=True), ESQ('term', is_deleted=False)],
+            )).source(['id', 'username', 'nickname'])
+
+        search = search.extra(size=limit, timeout=settings.SEARCH_SUGGEST_TIMEOUT, track_total_hits=False)
+        try:
+            response = search.execute()
+            if not response.hits:
+                self._require_populated(indices)
+        except (ApiError, TransportError) as e:
+            logger.error(f"Elasticsearch suggest failed: {e}")
+            raise SearchUnavailable() from e
+        return [hit.to_dict() for hit in response.hits]
+
+    def _require_populated(self, indices):
+        """
+        没有结果时确认索引不是空的 (刚创建、还没执行重建的索引)，否则视为不可用，由后备后端回答。
+        非空的结果缓存 POPULATED_CACHE_TTL 秒，正常的空结果不会每次都多一次 _count。
+        """
+        key = f"search:populated:{','.join(sorted(indices))}"
+        if cache.get(key):
+            return
+        if not connections.get_connection().count(index=indices)['count']:
+            logger.warning(f"Search indices {indices} are empty, falling back")
+            raise SearchUnavailable()
+        cache.set(key, True, POPULATED_CACHE_TTL)
+
+
+# ==================
+# 2. PostgreSQL 全文检索
+# ==================
+# (模型, 正文字段, 积分字段)
+PG_SOURCES = {
+    'course': (Course, 'description', 'pricePoints'),
+    'gallery': (GalleryItem, 'description', 'requiredPoints'),
+    'community': (CommunityPost, 'content', 'rewardPoints'),
+}
+VECTOR_FIELDS = {model: ('title', body) for model, body, _ in PG_SOURCES.values()}
+
+
+def search_vector(title, body):
+    """标题权重 A，正文权重 B；中日韩文本先展开成两字词 (见 search/cjk.py)"""
+    config = settings.SEARCH_PG_CONFIG
+    return (
+        SearchVector(Value(cjk.expand(title)), weight='A', config=config)
+        + SearchVector(Value(cjk.expand(body)), weight='B', config=config)
+    )
+
+
+def update_search_vector(model, pk, title, body):
+    """[公共] 对象的标题 / 正文变化后重新计算 search_vector (只在 PostgreSQL 上执行)"""
+    if connection.vendor == 'postgresql':
+        model._base_manager.filter(pk=pk).update(search_vector=search_vector(title, body))
+
+
+def highlight(title, q):
+    """把标题中出现的查询词 (排除的词除外) 用 <em> 标出；没有出现时返回 None，和 ES 的高亮一致"""
+    terms = {
+        term.strip('"') for term in re.findall(r'-?"[^"]*"|\S+', q)
+        if not term.startswith('-') and term.upper() != 'OR'
+    }
+    terms = sorted(filter(None, terms), key=len, reverse=True)
+    if not terms:
+        return None
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    highlighted, count = pattern.subn(lambda m: f"<em>{m.group()}</em>", title)
+    return highlighted if count else None
+
+
+class PostgresBackend(SearchBackend):
+    name = 'pg'
+
+    def _filtered(self, doc_type, params, query):
+        model, _, points_field = PG_SOURCES[doc_type]
+        queryset = model.objects.filter(status=model.StatusChoices.PUBLISHED)
+        if query is not None:
+            queryset = queryset.filter(search_vector=query)
+        if params.get('tags'):
+            if doc_type not in TAGGED_TYPES:
+                return queryset.none()
+            through = model.tags.through
+            column = model.tags.field.m2m_column_name()
+            queryset = queryset.filter(pk__in=through.objects.filter(tag_id__in=params['tags']).values(column))
+        if params.get('is_vip_free') is not None:
+            if doc_type not in TAGGED_TYPES:
+                return queryset.none()
+            queryset = queryset.filter(is_vip_free=params['is_vip_free'])
+        if params.get('points_min') is not None:
+            queryset = queryset.filter(**{f"{points_field}__gte": params['points_min']})
+        if params.get('points_max') is not None:
+            queryset = queryset.filter(**{f"{points_field}__lte": params['points_max']})
+        return queryset
+
+    def _page(self, doc_type, params, query, sort_values):
+        doc = DOCUMENTS[doc_type]()
+        filtered = self._filtered(doc_type, params, query)
+        # 复用文档的 get_queryset (作者 / 标签 / 点赞数)，结果结构与 ES 的 _source 一致
+        queryset = doc.get_queryset().filter(pk__in=filtered.values('pk')).defer('search_vector')
+        if query is not None:
+            # ts_rank 返回 real；转成 double precision，游标里的排序值才能原样比较，
+            # 否则 real 与 double 比较时同分的最后一行会在下一页重复出现
+            queryset = queryset.annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField()))
+            ordering = ('-rank', '-created_at', '-id')
+        else:
+            ordering = ('-created_at', '-id')
+
+        if sort_values is not None:
+            queryset = queryset.filter(self._after(ordering, sort_values))
+        objects = list(queryset.order_by(*ordering)[:params['page_size']])
+
+        results = []
+        for obj in objects:
+            item = {key: value for key, value in doc.prepare(obj).items() if key in SOURCE_FIELDS}
+            item['highlight'] = highlight(obj.title, params['q']) if query is not None else None
+            results.append(item)
+        next_sort = None
+        if len(objects) == params['page_size']:
+            last = objects[-1]
+            next_sort = [getattr(last, name.lstrip('-')) for name in ordering]
+            next_sort = [value.isoformat() if isinstance(value, datetime) else value for value in next_sort]
+        return {'results': results, 'next_sort': next_sort}
+
+    def _after(self, ordering, sort_values):
+        """按 (ordering) 降序的 keyset 条件：(a < x) OR (a = x AND b < y) OR ..."""
+        names = [name.lstrip('-') for name in ordering]
+        condition = Q()
+        for index, name in enumerate(names):
+            step = Q(**{f"{name}__lt": sort_values[index]})
+            for previous, value in zip(names[:index], sort_values[:index]):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def _facets(self, doc_types, params, query):
+        totals, vip, points, tags = {}, {}, {}, {}
+        for doc_type in doc_types:
+            model, _, points_field = PG_SOURCES[doc_type]
+            filtered = self._filtered(doc_type, params, query)
+            counts = filtered.aggregate(
+                total=Count('pk'),
+                **{
+                    item['key']: Count('pk', filter=Q(**{
+                        **({f"{points_field}__gte": item['from']} if 'from' in item else {}),
+                        **({f"{points_field}__lt": item['to']} if 'to' in item else {}),
+                    }))
+                    for item in POINTS_RANGES
+                },
+            )
+            totals[doc_type] = counts.pop('total')
+            for key, count in counts.items():
+                _add_counts(points, key, count)
+            if doc_type in TAGGED_TYPES:
+                for value, count in filtered.values_list('is_vip_free').annotate(count=Count('pk')).order_by():
+                    _add_counts(vip, 'true' if value else 'false', count)
+                through = model.tags.through
+                column = model.tags.field.m2m_column_name()
+                rows = (
+                    through.objects.filter(**{f"{column}__in": filtered.values('pk')})
+                    .values('tag_id').annotate(count=Count('pk')).order_by('-count')[:TAG_FACET_SIZE]
+                )
+                for row in rows:
+                    _add_counts(tags, row['tag_id'], row['count'])
+        return facets_from_counts(totals, vip, points, tags)
+
+    def search(self, params, search_after=None):
+        q = params.get('q')
+        query = SearchQuery(cjk.expand_query(q), config=settings.SEARCH_PG_CONFIG, search_type='websearch') if q else None
+        try:
+            if search_after is not None:
+                doc_type, sort_values = search_after
+                return {doc_type: self._page(doc_type, params, query, sort_values)}, None
+
+            doc_types = params.get('doc_type') or DOC_TYPES
+            sections = {}
+            for doc_type in doc_types:
+                sections[doc_type] = self._page(doc_type, params, query, None)
+            facets = self._facets(doc_types, params, query)
+        except DatabaseError as e:
+            logger.error(f"Database search failed: {e}")
+            raise SearchUnavailable() from e
+        for doc_type, count in ((item['key'], item['count']) for item in facets['doc_type']):
+            sections[doc_type]['count'] = count
+        return sections, facets
+
+    def suggest(self, kind, q, limit, scope=None):
+        # icontains 在 PostgreSQL 上是 ILIKE '%q%'，由 pg_trgm 的 GIN 索引 (gin_trgm_ops) 支持；
+        # 按三元组相似度排序，完全相同或更接近的排在前面
+        try:
+            if kind == 'title':
+                results = []
+                for doc_type in SUGGEST_TITLE_TYPES:
+                    model = PG_SOURCES[doc_type][0]
+                    rows = (
+                        model.objects.filter(status=model.StatusChoices.PUBLISHED, title__icontains=q)
+                        .annotate(similarity=TrigramSimilarity('title', q))
+                        .order_by('-similarity', '-id')
+                        .values('id', 'title', 'similarity')[:limit]
+                    )
+                    results += [{**row, 'doc_type': doc_type} for row in rows]
+                results.sort(key=lambda row: -row['similarity'])
+                for row in results:
+                    del row['similarity']
+                return results[:limit]
+
+            if kind == 'tag':
+                queryset = Tag.objects.filter(name__icontains=q)
+                if scope:
+                    queryset = queryset.filter(scope=scope)
+                return list(
+                    queryset.annotate(similarity=TrigramSimilarity('name', q))
+                    .order_by('-similarity', 'name')
+                    .values('id', 'name', 'scope')[:limit]
+                )
+
+            return list(
+                User.objects.filter(Q(username__icontains=q) | Q(nickname__icontains=q), is_active=True, is_deleted=False)
+                .annotate(similarity=Greatest(TrigramSimilarity('username', q), TrigramSimilarity('nickname', q)))
+                .order_by('-similarity', 'id')
+                .values('id', 'username', 'nickname')[:limit]
+            )
+        except DatabaseError as e:
+            logger.error(f"Database suggest failed: {e}")
+            raise SearchUnavailable() from e
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# -----------------------------------------------------------------------------
+# 搜索熔断器 (所有进程共享，状态保存在缓存中)
+# SEARCH_BREAKER_WINDOW 秒内 ES 出错或超过 SEARCH_BREAKER_SLOW_SECONDS 的请求累计达到
+# SEARCH_BREAKER_THRESHOLD 次时断开，之后 SEARCH_BREAKER_COOLDOWN 秒内直接使用后备搜索；
+# 冷却结束后下一个请求重新尝试 ES (半开)，再失败一次就重新断开。
+# -----------------------------------------------------------------------------
+
+_FAILURES_KEY = 'search:breaker:failures'
+_OPEN_KEY = 'search:breaker:open'
+_HALF_OPEN_KEY = 'search:breaker:half-open'
+
+
+def is_open():
+    """[公共] 熔断中 (应直接使用后备搜索) 时返回 True"""
+    return bool(cache.get(_OPEN_KEY))
+
+
+def _trip():
+    cache.set(_OPEN_KEY, 1, settings.SEARCH_BREAKER_COOLDOWN)
+    # 冷却结束后的第一次失败直接重新断开，不再等待累计
+    cache.set(_HALF_OPEN_KEY, 1, settings.SEARCH_BREAKER_COOLDOWN + settings.SEARCH_BREAKER_WINDOW)
+    cache.delete(_FAILURES_KEY)
+
+
+def record_failure():
+    """[公共] 记录一次出错 / 过慢的请求"""
+    if cache.get(_HALF_OPEN_KEY):
+        _trip()
+        return
+    cache.add(_FAILURES_KEY, 0, settings.SEARCH_BREAKER_WINDOW)
+    try:
+        failures = cache.incr(_FAILURES_KEY)
+    except ValueError:
+        # 窗口恰好在 add 和 incr 之间过期
+        failures = 1
+    if failures >= settings.SEARCH_BREAKER_THRESHOLD:
+        _trip()
+
+
+def record_success(elapsed):
+    """[公共] 记录一次成功的请求；过慢的请求按失败计算"""
+    if elapsed > settings.SEARCH_BREAKER_SLOW_SECONDS:
+        record_failure()
+    else:
+        cache.delete(_HALF_OPEN_KEY)
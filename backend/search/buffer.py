@@ -0,0 +1,264 @@
+import logging
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_elasticsearch_dsl.registries import registry
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# ES 索引缓冲区
+# 模型变更不再逐条投递 Celery 任务，而是把 "app_label.model_name:pk" 放入 Redis 集合 (天然去重)，
+# 由 search.tasks.flush_index_buffer 定时 (或缓冲区过大时) 取出，按模型分块查询后
+# 用 ES _bulk 一次提交上千条文档。同一对象在一个周期内被保存多次只索引一次。
+# -----------------------------------------------------------------------------
+
+UPDATE_KEY = 'search:buffer:update'
+DELETE_KEY = 'search:buffer:delete'
+_PROCESSING_SUFFIX = ':processing'
+FLUSH_LOCK_KEY = 'search:buffer:flush-lock'
+FLUSH_LOCK_TIMEOUT = 600
+CAPTURE_KEY = 'search:buffer:capture'
+CAPTURE_RENAMES_KEY = 'search:buffer:capture:renames'
+CAPTURE_FLAG_KEY = 'search:buffer:capturing'
+CAPTURE_TTL = 60 * 60 * 24
+# 缓冲区超过这个大小时立即投递一次刷新任务 (同一时间最多一个)
+_TRIGGER_LOCK_KEY = 'search:buffer:trigger-lock'
+_TRIGGER_LOCK_TIMEOUT = 30
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _member(model, pk):
+    return f"{model._meta.app_label}.{model._meta.model_name}:{pk}"
+
+
+def _parse(member):
+    """解析缓冲区成员，无法解析 (格式错误、模型已删除或改名) 时返回 None"""
+    try:
+        label, pk = member.decode().rsplit(':', 1)
+        return apps.get_model(label), pk
+    except (ValueError, LookupError, UnicodeDecodeError):
+        return None
+
+
+def is_indexed(model):
+    return model in registry.get_models()
+
+
+def affects_index(model, update_fields):
+    """只保存了部分字段时，是否有文档用到这些字段 (文档可用 watched_fields 声明依赖的字段，未声明视为全部)"""
+    for doc_class in registry.get_documents(models=[model]):
+        watched = getattr(doc_class, 'watched_fields', None)
+        if watched is None or set(update_fields) & set(watched):
+            return True
+    return False
+
+
+def _add(key, model, pks):
+    members = [_member(model, pk) for pk in pks if pk is not None]
+    if not members:
+        return
+
+    def push():
+        pipe = _redis().pipeline(transaction=False)
+        pipe.sadd(key, *members)
+        pipe.scard(key)
+        _, size = pipe.execute()
+        if size >= settings.SEARCH_BUFFER_FLUSH_SIZE and cache.add(_TRIGGER_LOCK_KEY, 1, _TRIGGER_LOCK_TIMEOUT):
+            from .tasks import flush_index_buffer
+            flush_index_buffer.delay()
+
+    # 事务提交后再入队，避免刷新任务读到尚未提交 (或被回滚) 的数据
+    transaction.on_commit(push)
+
+
+def enqueue_update(model, pks):
+    """[公共] 标记模型对象需要重新索引"""
+    if is_indexed(model):
+        _add(UPDATE_KEY, model, pks)
+
+
+def enqueue_delete(model, pks):
+    """[公共] 标记模型对象需要从索引中删除"""
+    if is_indexed(model):
+        _add(DELETE_KEY, model, pks)
+
+
+def _take(redis, key):
+    """把待处理集合改名为处理中 (上次失败残留的处理中集合优先处理)，返回处理中的键名或 None"""
+    processing = key + _PROCESSING_SUFFIX
+    if not redis.exists(processing):
+        if not redis.exists(key):
+            return None
+        redis.rename(key, processing)
+    return processing
+
+
+def _scan_grouped(redis, key, batch_size):
+    """
+    逐批读取处理中的集合，按模型分组返回 {model: [pk, ...]}。
+    无法解析的成员记录日志后从集合中移除，否则处理中的集合永远处理不完，之后的变更都会堆积。
+    """
+    cursor = 0
+    while True:
+        cursor, members = redis.sscan(key, cursor, count=batch_size)
+        grouped = {}
+        invalid = []
+        for member in members:
+            parsed = _parse(member)
+            if parsed is None:
+                invalid.append(member)
+                continue
+            model, pk = parsed
+            grouped.setdefault(model, []).append(pk)
+        if invalid:
+            logger.error(f"Dropping {len(invalid)} unparsable search buffer entries from {key}: {invalid[:3]}")
+            redis.srem(key, *invalid)
+        if grouped:
+            yield grouped
+        if cursor == 0:
+            break
+
+
+def _bulk(doc, objects, action):
+    success, errors = doc.update(
+        objects, action=action, raise_on_error=False, chunk_size=settings.SEARCH_BULK_CHUNK_SIZE
+    )
+    # 删除不存在的文档 (404) 不算失败
+    failed = [
+        error for error in errors
+        if not (action == 'delete' and next(iter(error.values()), {}).get('status') == 404)
+    ]
+    return success, failed
+
+
+def _index_pks(redis, model, pks):
+    indexed = 0
+    for doc_class in registry.get_documents(models=[model]):
+        doc = doc_class()
+        queryset = doc.get_queryset().filter(pk__in=pks)
+        success, failed = _bulk(doc, queryset.iterator(chunk_size=settings.SEARCH_BULK_CHUNK_SIZE), 'index')
+        indexed += success
+        if failed:
+            # 失败的文档重新放回缓冲区，下个周期重试
+            logger.error(f"{len(failed)} {model._meta.model_name} documents failed to index: {failed[:3]}")
+            failed_ids = [next(iter(error.values())).get('_id') for error in failed]
+            redis.sadd(UPDATE_KEY, *[_member(model, pk) for pk in failed_ids])
+    return indexed
+
+
+def _delete_pks(redis, model, pks):
+    # 删除后又重新创建 (例如回滚再保存) 的对象不删除
+    existing = {str(pk) for pk in model.objects.filter(pk__in=pks).values_list('pk', flat=True)}
+    stubs = [model(pk=pk) for pk in pks if str(pk) not in existing]
+    if not stubs:
+        return 0
+    deleted = 0
+    for doc_class in registry.get_documents(models=[model]):
+        success, failed = _bulk(doc_class(), stubs, 'delete')
+        deleted += success
+        if failed:
+            logger.error(f"{len(failed)} {model._meta.model_name} documents failed to delete: {failed[:3]}")
+            failed_ids = [next(iter(error.values())).get('_id') for error in failed]
+            redis.sadd(DELETE_KEY, *[_member(model, pk) for pk in failed_ids])
+    return deleted
+
+
+def _flush(redis, key, handler, batch_size):
+    processing = _take(redis, key)
+    if processing is None:
+        return 0
+    _capture_key(redis, processing)
+    count = 0
+    for grouped in _scan_grouped(redis, processing, batch_size):
+        for model, pks in grouped.items():
+            count += handler(redis, model, pks)
+    redis.delete(processing)
+    return count
+
+
+def flush(batch_size=None):
+    """
+    [公共] 把缓冲区中的变更批量写入 ES (由 Celery 任务调用)，返回 (索引数, 删除数)。
+    同一时间只有一个刷新在执行；ES 不可用时处理中的集合保留，下次重试。
+    """
+    batch_size = batch_size or settings.SEARCH_BULK_CHUNK_SIZE
+    if not cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        return 0, 0
+    try:
+        cache.delete(_TRIGGER_LOCK_KEY)
+        redis = _redis()
+        return _flush(redis, UPDATE_KEY, _index_pks, batch_size), _flush(redis, DELETE_KEY, _delete_pks, batch_size)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def pending_count():
+    """[公共] 缓冲区中待处理的条目数 (含处理中的)"""
+    redis = _redis()
+    pipe = redis.pipeline(transaction=False)
+    for key in (UPDATE_KEY, DELETE_KEY):
+        pipe.scard(key)
+        pipe.scard(key + _PROCESSING_SUFFIX)
+    return sum(pipe.execute())
+
+
+# 重建索引期间 (见 rebuild_search_index 命令) 记录所有变更过的对象和改名操作：
+# 这些变更写进的是旧索引，切换别名之后需要在新索引上再执行一遍。
+
+def start_capture():
+    """[公共] 开始记录变更"""
+    redis = _redis()
+    redis.delete(CAPTURE_KEY, CAPTURE_RENAMES_KEY)
+    redis.set(CAPTURE_FLAG_KEY, 1, ex=CAPTURE_TTL)
+
+
+def _capturing(redis):
+    return redis.exists(CAPTURE_FLAG_KEY)
+
+
+def _capture_key(redis, key):
+    if _capturing(redis):
+        redis.sunionstore(CAPTURE_KEY, [CAPTURE_KEY, key])
+        redis.expire(CAPTURE_KEY, CAPTURE_TTL)
+
+
+def capture(model, pks):
+    """[公共] 不经过缓冲区的局部更新 (例如点赞数) 也要记录"""
+    redis = _redis()
+    if _capturing(redis) and pks:
+        redis.sadd(CAPTURE_KEY, *[_member(model, pk) for pk in pks])
+
+
+def capture_rename(kind, obj_id):
+    """[公共] 记录作者 / 标签改名 (kind 为 'author' 或 'tag')"""
+    redis = _redis()
+    if _capturing(redis):
+        redis.sadd(CAPTURE_RENAMES_KEY, f"{kind}:{obj_id}")
+
+
+def stop_capture():
+    """[公共] 停止记录，返回 ({model: [pk, ...]}, [(kind, obj_id), ...])，并清空记录"""
+    redis = _redis()
+    redis.delete(CAPTURE_FLAG_KEY)
+    changed = {}
+    for grouped in _scan_grouped(redis, CAPTURE_KEY, settings.SEARCH_BULK_CHUNK_SIZE):
+        for model, pks in grouped.items():
+            changed.setdefault(model, []).extend(pks)
+    renames = []
+    for member in redis.smembers(CAPTURE_RENAMES_KEY):
+        kind, obj_id = member.decode().split(':')
+        renames.append((kind, int(obj_id)))
+    redis.delete(CAPTURE_KEY, CAPTURE_RENAMES_KEY)
+    return changed, renames
+
+
+def sync(model, pks):
+    """[公共] 立即同步一批对象：数据库中存在的重新索引，不存在的从索引中删除。返回 (索引数, 删除数)"""
+    redis = _redis()
+    return _index_pks(redis, model, pks), _delete_pks(redis, model, pks)
@@ -0,0 +1,43 @@
+import re
+import unicodedata
+
+# -----------------------------------------------------------------------------
+# 数据库全文检索的中日韩文本处理
+# PostgreSQL 的 'simple' 配置把一串连续的中文当成一个词，"学习" 匹配不到 "深度学习入门"。
+# 这里在写入 tsvector 之前把 CJK 字符串展开成相邻两字的词，和 ES 的 cjk_bigram 分析器
+# (见 search_indexes.py) 切分方式一致；查询时同样展开，并把每串 CJK 字符作为短语查询，
+# 只匹配原文中连续出现的位置。英文和数字不受影响。
+# 迁移也会用到这里的函数，不要依赖模型。
+# -----------------------------------------------------------------------------
+
+# 汉字 (含扩展 A 和兼容汉字)、平假名、片假名、谚文
+_CJK_RUN = re.compile(r'(-?)([぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+)')
+_QUOTED = re.compile(r'("[^"]*")')
+
+
+def bigrams(run):
+    """相邻两字切分；只有一个字时保留这个字"""
+    if len(run) == 1:
+        return [run]
+    return [run[index:index + 2] for index in range(len(run) - 1)]
+
+
+def expand(text):
+    """[公共] 写入 tsvector 前的文本：全角转半角，CJK 字符串展开成两字词"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _CJK_RUN.sub(lambda m: f" {m.group(1)}{' '.join(bigrams(m.group(2)))} ", text)
+
+
+def expand_query(q):
+    """
+    [公共] 展开 websearch_to_tsquery 语法的查询：每串 CJK 字符变成两字词组成的短语 ("深度 度学 学习")，
+    引号内的短语和排除 (-) 语法保持不变。
+    """
+    q = unicodedata.normalize('NFKC', q)
+    parts = []
+    for part in _QUOTED.split(q):
+        if len(part) >= 2 and part.startswith('"') and part.endswith('"'):
+            parts.append(f'"{" ".join(expand(part[1:-1]).split())}"')
+        else:
+            parts.append(_CJK_RUN.sub(lambda m: f' {m.group(1)}"{" ".join(bigrams(m.group(2)))}" ', part))
+    return ''.join(parts)
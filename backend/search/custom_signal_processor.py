@@ -1,29 +1,36 @@
 from django_elasticsearch_dsl.signals import RealTimeSignalProcessor
-from .tasks import update_index_task, delete_index_task
+from . import buffer as search_buffer
 
 class CelerySignalProcessor(RealTimeSignalProcessor):
     """
-    自定义信号处理器，将索引更新操作推送到 Celery 队列。
+    自定义信号处理器，将索引更新操作放入 Redis 缓冲区 (见 buffer.py)，
+    由 Celery 定时任务去重后通过 _bulk 批量写入 ES。
     """
 
     def handle_save(self, sender, instance, **kwargs):
         """
-        处理模型保存信号，异步更新索引。
+        处理模型保存信号，标记对象需要重新索引。
         """
-        # (重写) 不再是实时处理，而是调用 .delay()
-        update_index_task.delay(instance._meta.app_label, instance._meta.model_name, instance.pk)
+        # (重写) 不再是实时处理，同一对象在一个刷新周期内只索引一次
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not search_buffer.affects_index(sender, update_fields):
+            return
+        search_buffer.enqueue_update(sender, [instance.pk])
 
     def handle_delete(self, sender, instance, **kwargs):
         """
-        处理模型删除信号，异步删除索引。
+        处理模型删除信号，标记对象需要从索引中删除。
         """
         # (重写)
-        delete_index_task.delay(instance._meta.app_label, instance._meta.model_name, instance.pk)
+        search_buffer.enqueue_delete(sender, [instance.pk])
 
-    def handle_m2m_changed(self, sender, instance, action, **kwargs):
+    def handle_m2m_changed(self, sender, instance, action, reverse=False, model=None, pk_set=None, **kwargs):
         """
         处理 ManyToMany 字段变化信号（例如 'tags' 字段增删）
         """
         if action in ('post_add', 'post_remove', 'post_clear'):
-            # (重写) 同样是异步更新
-            update_index_task.delay(instance._meta.app_label, instance._meta.model_name, instance.pk)
\ No newline at end of file
+            # (重写) 同样放入缓冲区
+            search_buffer.enqueue_update(instance.__class__, [instance.pk])
+            if reverse and pk_set:
+                # 从反向一侧修改时 (例如 tag.courses.add(...))，变化的是另一侧的对象
+                search_buffer.enqueue_update(model, pk_set)
@@ -0,0 +1,48 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from search import audit as search_audit
+
+# -----------------------------------------------------------------------------
+# 数据库 / 索引一致性审计 (见 search/audit.py)
+# 逐条比较 (pk, updated_at)，输出不一致报告，并把不一致的文档放回索引缓冲区，
+# 由 flush_index_buffer 批量重新索引或删除。每晚由 search.audit_search_index 任务自动执行。
+# -----------------------------------------------------------------------------
+
+
+class Command(BaseCommand):
+    help = "比较数据库和搜索索引，报告并修复丢失 / 过期 / 多余的文档"
+
+    def add_arguments(self, parser):
+        parser.add_argument('indices', nargs='*', help="要审计的索引 (courses / gallery / community_posts / tags / users)，默认全部")
+        parser.add_argument('--chunk-size', type=int, default=settings.SEARCH_BULK_CHUNK_SIZE, help="每次从数据库 / ES 读取的条数")
+        parser.add_argument('--grace', type=int, default=settings.SEARCH_AUDIT_GRACE_SECONDS, help="忽略最近多少秒内修改过的对象")
+        parser.add_argument('--dry-run', action='store_true', help="只报告，不放回缓冲区")
+        parser.add_argument('--report', help="把报告以 JSON 写入这个文件")
+
+    def handle(self, *args, **options):
+        try:
+            reports = search_audit.audit(
+                options['indices'], options['chunk_size'], not options['dry_run'], options['grace'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        except search_audit.AuditInProgress:
+            raise CommandError("已有审计正在执行")
+
+        for report in reports:
+            drift = report['missing'] + report['stale'] + report['orphaned']
+            style = self.style.WARNING if drift else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{report['index']}: 检查 {report['checked']}，丢失 {report['missing']}，过期 {report['stale']}，"
+                f"多余 {report['orphaned']}，跳过 (最近修改) {report['skipped']}"
+            ))
+            for kind, pks in report['samples'].items():
+                if pks:
+                    self.stdout.write(f"  {kind}: {', '.join(str(pk) for pk in pks)}")
+        if not options['dry_run']:
+            self.stdout.write("不一致的文档已放回索引缓冲区，下一次刷新时处理")
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as report_file:
+                json.dump(reports, report_file, ensure_ascii=False, indent=2)
@@ -0,0 +1,130 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl.connections import connections as es_connections
+from api.models import Course, GalleryItem, CommunityPost
+from search.search_indexes import cjk_bigram
+
+# -----------------------------------------------------------------------------
+# 分词器对比基准
+# 用同一批标题分别建立 standard (原来的映射) 和 cjk_bigram 两个临时索引，
+# 比较索引大小、查询延迟 (ES took 和往返时间的 p50 / p95) 和相关性：
+# 以 "标题包含查询串" 作为标准答案，计算前 10 条的精确率和召回率。
+# -----------------------------------------------------------------------------
+
+TOP_K = 10
+
+
+def _variants():
+    return {
+        'standard': ({}, 'standard'),
+        'cjk_bigram': ({'analysis': cjk_bigram.get_analysis_definition()}, 'cjk_bigram'),
+    }
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = "比较 standard 与 cjk_bigram 分词器在标题搜索上的索引大小、延迟和相关性"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help="标题文件 (每行一个)；默认从课程 / 作品 / 帖子标题中取样")
+        parser.add_argument('--limit', type=int, default=20000, help="从数据库取样的标题数")
+        parser.add_argument('--queries', help="查询文件 (每行一个)；默认从标题中随机截取 2-4 个字")
+        parser.add_argument('--num-queries', type=int, default=200)
+        parser.add_argument('--query-type', choices=('phrase', 'match'), default='phrase')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help="保留临时索引")
+
+    def handle(self, *args, **options):
+        titles = self._load_titles(options)
+        if not titles:
+            raise CommandError("没有可用的标题样本")
+        queries = self._load_queries(options, titles)
+        if not queries:
+            # 否则 _report 在 _percentile / statistics.mean 处因空列表出错，且临时索引已经建好
+            raise CommandError("没有可用的查询 (查询文件为空，或标题都短于 2 个字)")
+        truths = {query: {i for i, title in enumerate(titles) if query.lower() in title.lower()} for query in queries}
+        self.stdout.write(f"样本: {len(titles)} 个标题，{len(queries)} 个查询 ({options['query_type']})")
+
+        es = es_connections.get_connection()
+        suffix = int(time.time())
+        for label, (index_settings, analyzer_name) in _variants().items():
+            index = f"search-bench-{label}-{suffix}"
+            es.indices.create(
+                index=index,
+                settings={'number_of_shards': 1, 'number_of_replicas': 0, **index_settings},
+                mappings={'properties': {'title': {'type': 'text', 'analyzer': analyzer_name}}},
+            )
+            try:
+                self._report(es, index, label, titles, queries, truths, options['query_type'])
+            finally:
+                if not options['keep']:
+                    es.indices.delete(index=index)
+
+    def _load_titles(self, options):
+        if options['corpus']:
+            with open(options['corpus'], encoding='utf-8') as corpus:
+                return [line.strip() for line in corpus if line.strip()]
+        titles = []
+        for model in (Course, GalleryItem, CommunityPost):
+            remaining = options['limit'] - len(titles)
+            if remaining <= 0:
+                break
+            titles += list(model.objects.order_by('-id').values_list('title', flat=True)[:remaining])
+        return titles
+
+    def _load_queries(self, options, titles):
+        if options['queries']:
+            with open(options['queries'], encoding='utf-8') as queries:
+                return [line.strip() for line in queries if line.strip()]
+        rng = random.Random(options['seed'])
+        queries = set()
+        candidates = [title for title in titles if len(title) >= 2]
+        for _ in range(options['num_queries'] * 10):
+            if len(queries) >= options['num_queries'] or not candidates:
+                break
+            title = rng.choice(candidates)
+            length = rng.randint(2, min(4, len(title)))
+            start = rng.randint(0, len(title) - length)
+            query = title[start:start + length].strip()
+            if len(query) >= 2:
+                queries.add(query)
+        return sorted(queries)
+
+    def _report(self, es, index, label, titles, queries, truths, query_type):
+        bulk(es, ({'_index': index, '_id': i, 'title': title} for i, title in enumerate(titles)), chunk_size=2000)
+        es.indices.refresh(index=index)
+        es.indices.forcemerge(index=index, max_num_segments=1)
+        size = es.indices.stats(index=index)['_all']['primaries']['store']['size_in_bytes']
+
+        took, wall, precisions, recalls = [], [], [], []
+        clause = 'match_phrase' if query_type == 'phrase' else 'match'
+        for query in queries:
+            started = time.perf_counter()
+            response = es.search(
+                index=index, query={clause: {'title': query}}, size=TOP_K,
+                source=False, request_cache=False,
+            )
+            wall.append((time.perf_counter() - started) * 1000)
+            took.append(response['took'])
+            hits = {int(hit['_id']) for hit in response['hits']['hits']}
+            truth = truths[query]
+            if hits:
+                precisions.append(len(hits & truth) / len(hits))
+            if truth:
+                recalls.append(len(hits & truth) / min(TOP_K, len(truth)))
+
+        self.stdout.write(self.style.SUCCESS(label))
+        self.stdout.write(f"  索引大小: {size / 1024:.0f} KiB")
+        self.stdout.write(f"  took (ms): p50 {_percentile(took, 50)}, p95 {_percentile(took, 95)}, 平均 {statistics.mean(took):.1f}")
+        self.stdout.write(f"  往返 (ms): p50 {_percentile(wall, 50):.1f}, p95 {_percentile(wall, 95):.1f}")
+        self.stdout.write(
+            f"  precision@{TOP_K}: {statistics.mean(precisions) if precisions else 0:.3f}, "
+            f"recall@{TOP_K}: {statistics.mean(recalls) if recalls else 0:.3f}"
+        )
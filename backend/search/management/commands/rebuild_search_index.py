@@ -0,0 +1,165 @@
+import math
+import multiprocessing
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections as db_connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_elasticsearch_dsl.registries import registry
+from elasticsearch_dsl.connections import connections as es_connections
+from search import buffer as search_buffer
+from search import partial_updates
+from search.search_indexes import author_name
+
+# -----------------------------------------------------------------------------
+# 零停机重建索引
+# 1. 新建带版本号的索引 (courses-20250101120000)，加载期间关闭 refresh 和副本；
+# 2. 按主键范围切分，由多个进程并行分块读取数据库并用 _bulk 写入新索引；
+# 3. 恢复 refresh / 副本设置后，一次 _aliases 请求把别名原子地切换到新索引
+#    (第一次运行时旧的同名索引在同一个请求中删除)；
+# 4. 重建期间缓冲区刷新 / 局部更新 / 改名写进的是旧索引，由 search.buffer 记录下来，
+#    切换后在新索引上补做一遍。
+# -----------------------------------------------------------------------------
+
+
+def _init_worker():
+    # fork 出来的进程不能复用父进程的数据库连接和 ES 连接池
+    db_connections.close_all()
+    es_connections.remove_connection('default')
+    es_connections.configure(**settings.ELASTICSEARCH_DSL)
+
+
+def _index_range(job):
+    """在子进程中执行：把 [start, end) 主键范围内的对象写入 index_name，返回 (成功数, 失败数)"""
+    doc_path, index_name, start, end, chunk_size = job
+    doc = import_string(doc_path)()
+    queryset = doc.get_queryset().filter(pk__gte=start, pk__lt=end).order_by('pk')
+
+    def actions():
+        for action in doc._get_actions(queryset.iterator(chunk_size=chunk_size), 'index'):
+            action['_index'] = index_name
+            yield action
+
+    success, errors = doc._bulk(actions(), raise_on_error=False, chunk_size=chunk_size)
+    return success, len(errors)
+
+
+class Command(BaseCommand):
+    help = "零停机重建搜索索引：并行写入新版本索引后原子切换别名"
+
+    def add_arguments(self, parser):
+        parser.add_argument('indices', nargs='*', help="要重建的索引 (courses / gallery / community_posts / tags / users)，默认全部")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="并行写入的进程数")
+        parser.add_argument('--chunk-size', type=int, default=settings.SEARCH_BULK_CHUNK_SIZE, help="每次读取 / _bulk 的文档数")
+        parser.add_argument('--keep-old', action='store_true', help="切换后保留旧版本索引")
+
+    def handle(self, *args, **options):
+        documents = {doc._index._name: doc for doc in registry.get_documents()}
+        names = options['indices'] or sorted(documents)
+        unknown = set(names) - set(documents)
+        if unknown:
+            raise CommandError(f"未知的索引: {', '.join(sorted(unknown))}")
+
+        search_buffer.start_capture()
+        try:
+            for name in names:
+                self._rebuild(documents[name], options)
+        finally:
+            self._catch_up()
+
+    def _rebuild(self, doc_class, options):
+        alias = doc_class._index._name
+        es = doc_class._get_connection()
+        new_index = f"{alias}-{timezone.now():%Y%m%d%H%M%S}"
+
+        index = doc_class._index.clone(name=new_index)
+        index.create()
+        load_settings = index.to_dict().get('settings', {})
+        es.indices.put_settings(index=new_index, settings={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+
+        total, failed, elapsed = self._load(doc_class, new_index, options)
+        self.stdout.write(
+            f"{alias}: {total} 个文档写入 {new_index}，失败 {failed}，用时 {elapsed:.1f}s "
+            f"({total / elapsed if elapsed else 0:.0f} docs/s)"
+        )
+        if failed:
+            es.indices.delete(index=new_index)
+            raise CommandError(f"{alias}: 有 {failed} 个文档写入失败，保留原索引")
+
+        es.indices.put_settings(index=new_index, settings={'index': {
+            'refresh_interval': load_settings.get('refresh_interval', '1s'),
+            'number_of_replicas': load_settings.get('number_of_replicas', 1),
+        }})
+        es.indices.refresh(index=new_index)
+        self._swap_alias(es, alias, new_index, options['keep_old'])
+
+    def _load(self, doc_class, index_name, options):
+        model = doc_class.django.model
+        bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return 0, 0, 0.0
+
+        workers = max(options['workers'], 1)
+        chunk_size = options['chunk_size']
+        # 切成进程数的若干倍，避免个别范围数据特别多时其他进程空等
+        span = bounds['high'] - bounds['low'] + 1
+        step = max(math.ceil(span / (workers * 4)), chunk_size)
+        doc_path = f"{doc_class.__module__}.{doc_class.__name__}"
+        jobs = [
+            (doc_path, index_name, start, start + step, chunk_size)
+            for start in range(bounds['low'], bounds['high'] + 1, step)
+        ]
+
+        db_connections.close_all()
+        started = time.monotonic()
+        total = failed = 0
+        with multiprocessing.Pool(min(workers, len(jobs)), initializer=_init_worker) as pool:
+            for success, errors in pool.imap_unordered(_index_range, jobs):
+                total += success
+                failed += errors
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"  {index_name}: {total} docs, {total / elapsed if elapsed else 0:.0f} docs/s")
+        return total, failed, time.monotonic() - started
+
+    def _swap_alias(self, es, alias, new_index, keep_old):
+        actions = []
+        old_indices = []
+        if es.indices.exists_alias(name=alias):
+            old_indices = list(es.indices.get_alias(name=alias))
+            actions += [{'remove': {'index': old, 'alias': alias}} for old in old_indices]
+        elif es.indices.exists(index=alias):
+            # 第一次运行：原来是同名的普通索引，和添加别名在同一个请求里删除
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': new_index, 'alias': alias}})
+        es.indices.update_aliases(actions=actions)
+        self.stdout.write(self.style.SUCCESS(f"{alias} -> {new_index}"))
+
+        if old_indices and not keep_old:
+            es.indices.delete(index=','.join(old_indices))
+
+    def _catch_up(self):
+        """把重建期间写进旧索引的变更在新索引上补做一遍"""
+        changed, renames = search_buffer.stop_capture()
+        indexed = deleted = 0
+        for model, pks in changed.items():
+            for start in range(0, len(pks), settings.SEARCH_BULK_CHUNK_SIZE):
+                counts = search_buffer.sync(model, pks[start:start + settings.SEARCH_BULK_CHUNK_SIZE])
+                indexed += counts[0]
+                deleted += counts[1]
+
+        from api.models import Tag, User
+        for kind, obj_id in renames:
+            if kind == 'author':
+                user = User.objects.filter(pk=obj_id).only('username', 'nickname').first()
+                if user is not None:
+                    partial_updates.rename_author(obj_id, author_name(user))
+            else:
+                name = Tag.objects.filter(pk=obj_id).values_list('name', flat=True).first()
+                if name is None:
+                    partial_updates.remove_tag(obj_id)
+                else:
+                    partial_updates.rename_tag(obj_id, name)
+        self.stdout.write(f"补做重建期间的变更：索引 {indexed}，删除 {deleted}，改名 {len(renames)}")
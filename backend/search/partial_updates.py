@@ -0,0 +1,97 @@
+import logging
+from django.conf import settings
+from django_elasticsearch_dsl.registries import registry
+from api.models import Course, GalleryItem, CommunityPost
+from . import buffer as search_buffer
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# ES 局部更新
+# - 计数类字段 (例如帖子点赞数) 用 _update + doc 只改写这几个字段，不重新准备整个文档；
+# - 冗余在文档里的作者名、标签名改变时，用 _update_by_query 按 author.id / tags.id
+#   在 ES 端分批 (scroll_size) 后台改写，不需要从数据库加载并重新准备每一个相关文档。
+# -----------------------------------------------------------------------------
+
+AUTHORED_MODELS = (Course, GalleryItem, CommunityPost)
+TAGGED_MODELS = (Course, GalleryItem)
+
+_RENAME_AUTHOR_SCRIPT = "ctx._source.author.name = params.name"
+_RENAME_TAG_SCRIPT = """
+if (ctx._source.tags != null) {
+    for (tag in ctx._source.tags) {
+        if (tag.id == params.id) { tag.name = params.name }
+    }
+}
+"""
+_REMOVE_TAG_SCRIPT = """
+if (ctx._source.tags != null) {
+    ctx._source.tags.removeIf(tag -> tag.id == params.id);
+}
+"""
+
+
+def update_fields(model, values):
+    """
+    [公共] values 为 {pk: {字段: 值}}，只改写文档中的这些字段 (bulk 的 update 操作)。
+    文档尚未建立 (404) 时忽略；其他失败的对象放回索引缓冲区，等待完整重新索引。
+    """
+    if not values:
+        return 0
+    search_buffer.capture(model, list(values))
+    updated = 0
+    for doc_class in registry.get_documents(models=[model]):
+        doc = doc_class()
+        actions = (
+            {'_op_type': 'update', '_index': doc._index._name, '_id': pk, 'doc': doc_fields}
+            for pk, doc_fields in values.items()
+        )
+        success, errors = doc._bulk(actions, raise_on_error=False, chunk_size=settings.SEARCH_BULK_CHUNK_SIZE)
+        updated += success
+        failed = [error['update'] for error in errors if error['update'].get('status') != 404]
+        if failed:
+            logger.warning(f"{len(failed)} partial updates failed for {model._meta.model_name}, falling back to reindex")
+            search_buffer.enqueue_update(model, [error['_id'] for error in failed])
+    return updated
+
+
+def _update_by_query(models, query, source, params):
+    """对每个相关索引发起一次 _update_by_query (不等待完成，由 ES 在后台分批执行)，返回 ES 任务 id"""
+    task_ids = []
+    for model in models:
+        for doc_class in registry.get_documents(models=[model]):
+            response = doc_class._get_connection().update_by_query(
+                index=doc_class._index._name,
+                query=query,
+                script={'source': source, 'lang': 'painless', 'params': params},
+                conflicts='proceed',  # 与缓冲区的完整重新索引冲突时跳过，那边已经是最新的名称
+                slices='auto',
+                scroll_size=settings.SEARCH_BULK_CHUNK_SIZE,
+                wait_for_completion=False,
+            )
+            task_ids.append(response['task'])
+    return task_ids
+
+
+def rename_author(user_id, name):
+    """[公共] 用户改名后改写其所有课程 / 作品 / 帖子文档中的 author.name"""
+    search_buffer.capture_rename('author', user_id)
+    return _update_by_query(
+        AUTHORED_MODELS, {'term': {'author.id': user_id}}, _RENAME_AUTHOR_SCRIPT, {'name': name}
+    )
+
+
+def rename_tag(tag_id, name):
+    """[公共] 标签改名后改写所有带这个标签的文档"""
+    search_buffer.capture_rename('tag', tag_id)
+    return _update_by_query(
+        TAGGED_MODELS, {'term': {'tags.id': tag_id}}, _RENAME_TAG_SCRIPT, {'id': tag_id, 'name': name}
+    )
+
+
+def remove_tag(tag_id):
+    """[公共] 标签删除后从所有文档中移除 (删除标签不会触发 m2m_changed)"""
+    search_buffer.capture_rename('tag', tag_id)
+    return _update_by_query(
+        TAGGED_MODELS, {'term': {'tags.id': tag_id}}, _REMOVE_TAG_SCRIPT, {'id': tag_id}
+    )
@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from . import breaker
+from .backends import DOC_TYPES, SUGGEST_KINDS, SearchUnavailable
+
+# -----------------------------------------------------------------------------
+# 统一搜索
+# 由 SEARCH_BACKEND 指定的后端执行 (默认 ES：三个索引一次 _msearch)；
+# 后端出错、过慢或熔断器断开时改用 SEARCH_FALLBACK_BACKEND (PostgreSQL 全文检索)。
+# 第一页同时返回各分面，翻页用 search_after 游标 (排序值 + id)，不使用 from/size 深翻页。
+# 同样的查询参数在 SEARCH_CACHE_TTL 秒内直接读缓存；超时返回的部分结果不缓存，并按过慢的请求计入熔断器。
+# 输入提示 (suggest) 走同样的主后端 / 熔断器 / 后备后端流程。
+# -----------------------------------------------------------------------------
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 20
+
+__all__ = ['DOC_TYPES', 'SUGGEST_KINDS', 'SearchUnavailable', 'InvalidCursor', 'search', 'suggest']
+
+_backends = {}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _backend(path):
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def _backend_by_name(name):
+    for path in (settings.SEARCH_BACKEND, settings.SEARCH_FALLBACK_BACKEND):
+        if path and _backend(path).name == name:
+            return _backend(path)
+    return None
+
+
+def encode_cursor(backend, doc_type, sort_values):
+    payload = json.dumps({'b': backend.name, 't': doc_type, 'a': sort_values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """[公共] 返回 (后端, doc_type, 排序值)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        backend_name, doc_type, sort_values = payload['b'], payload['t'], payload['a']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    backend = _backend_by_name(backend_name)
+    if backend is None or doc_type not in DOC_TYPES or not isinstance(sort_values, list):
+        raise InvalidCursor(cursor)
+    return backend, doc_type, sort_values
+
+
+def _run_primary(run, timed_out=None):
+    """
+    用主后端执行 run(backend) (经过熔断器)；不可用时返回 None。
+    timed_out(result) 为 True 的结果照常返回，但按过慢的请求记录。
+    """
+    primary = _backend(settings.SEARCH_BACKEND)
+    if not settings.SEARCH_FALLBACK_BACKEND:
+        return primary, run(primary)
+    if breaker.is_open():
+        return None
+    started = time.monotonic()
+    try:
+        result = run(primary)
+    except SearchUnavailable:
+        breaker.record_failure()
+        return None
+    if timed_out is not None and timed_out(result):
+        breaker.record_failure()
+    else:
+        breaker.record_success(time.monotonic() - started)
+    return primary, result
+
+
+def _run(run, timed_out=None):
+    """主后端不可用时改用后备后端，返回 (后端, 结果)"""
+    outcome = _run_primary(run, timed_out)
+    if outcome is None:
+        backend = _backend(settings.SEARCH_FALLBACK_BACKEND)
+        outcome = backend, run(backend)
+    return outcome
+
+
+def _cache_key(params):
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return f"search:results:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def _timed_out(result):
+    sections, _ = result
+    return any(section.get('timed_out') for section in sections.values())
+
+
+def search(params):
+    """
+    [公共] 执行一次统一搜索。params 为 SearchQuerySerializer 校验后的数据：
+    q / doc_type / tags / is_vip_free / points_min / points_max / page_size / cursor。
+    带游标时由签发游标的后端查询游标所属类型的下一页，不返回分面。所有后端都不可用时抛出 SearchUnavailable。
+    """
+    key = _cache_key(params)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    if params.get('cursor'):
+        backend, doc_type, sort_values = decode_cursor(params['cursor'])
+        sections, facets = backend.search(params, (doc_type, sort_values))
+    else:
+        backend, (sections, facets) = _run(lambda backend: backend.search(params), _timed_out)
+    partial = _timed_out((sections, facets))
+
+    result = {'results': {}}
+    for doc_type, section in sections.items():
+        section.pop('timed_out', None)
+        next_sort = section.pop('next_sort')
+        section['next'] = encode_cursor(backend, doc_type, next_sort) if next_sort is not None else None
+        result['results'][doc_type] = section
+    if facets is not None:
+        result['facets'] = facets
+    if not partial:
+        cache.set(key, result, settings.SEARCH_CACHE_TTL)
+    return result
+
+
+def suggest(kind, q, limit=SUGGEST_LIMIT, scope=None):
+    """
+    [公共] 输入提示：按前缀返回最多 limit 条 (结构见 SearchBackend.suggest)。
+    热门前缀在 SEARCH_CACHE_TTL 秒内直接读缓存；所有后端都不可用时抛出 SearchUnavailable。
+    """
+    q = q.strip()
+    if not q:
+        return []
+    key = _cache_key({'suggest': kind, 'q': q.lower(), 'limit': limit, 'scope': scope})
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    _, results = _run(lambda backend: backend.suggest(kind, q, limit, scope))
+    cache.set(key, results, settings.SEARCH_CACHE_TTL)
+    return results
@@ -1,7 +1,73 @@
 from django_elasticsearch_dsl.registries import registry
 from django_elasticsearch_dsl import Document, fields
-from django.contrib.auth.models import User # 假设 author/founder 指向标准 User
-from api.models import Tag, CommunityPost ,Course,GalleryItem
+from django.conf import settings
+from django.db.models import Count
+from elasticsearch_dsl import analyzer, tokenizer
+from api.models import CommunityPost ,Course,GalleryItem, Tag, User
+from api.services import likes as like_service
+
+
+# 标题、作者名、标签名以中文为主：标准分词器会把中文切成单字，倒排表膨胀、短语查询要求交集很多单字。
+# 这里用 ES 内置的 cjk_width + cjk_bigram 切成相邻两字的词 (英文和数字仍按词切分)；
+# .raw 子字段保存原文，用于精确匹配和排序。
+cjk_bigram = analyzer(
+    'cjk_bigram',
+    tokenizer='standard',
+    filter=['cjk_width', 'lowercase', 'cjk_bigram'],
+)
+
+
+def cjk_text_field(**kwargs):
+    return fields.TextField(analyzer=cjk_bigram, fields={'raw': fields.KeywordField()}, **kwargs)
+
+
+# 作者和标签的名称冗余存储在文档里；改名时由 search.partial_updates 用 _update_by_query
+# 只改写这些字段，而不是重新准备所有相关文档 (因此这里不声明 related_models)
+# 输入提示 (search.query.suggest) 使用 search_as_you_type 字段：ES 额外生成 2、3 元 shingle 子字段
+# 和末尾词的前缀索引，bool_prefix 查询只需一次词项查找，不需要在查询时展开前缀。
+def suggest_field(attr, **kwargs):
+    return fields.SearchAsYouTypeField(attr=attr, max_shingle_size=3, **kwargs)
+
+
+# 用户名 / 昵称的子串匹配 (站内信收件人提示沿用原来 icontains 的语义)：按 2、3 个字符切分，
+# 查询同样切分后要求全部命中，等价于原文中出现过这个子串 (单个字符只能靠前缀匹配)
+substring_ngram = analyzer(
+    'substring_ngram',
+    tokenizer=tokenizer('substring_ngram', 'ngram', min_gram=2, max_gram=3, token_chars=['letter', 'digit']),
+    filter=['cjk_width', 'lowercase'],
+)
+
+
+def substring_field(attr):
+    return fields.TextField(attr=attr, analyzer=substring_ngram)
+
+
+def author_field():
+    return fields.ObjectField(properties={
+        'id': fields.IntegerField(),
+        'name': cjk_text_field(),
+    })
+
+
+def tags_field():
+    return fields.ObjectField(properties={
+        'id': fields.IntegerField(),
+        'name': cjk_text_field(),
+    }, multi=True)
+
+
+def author_name(user):
+    """文档中作者的显示名称 (昵称优先)"""
+    return user.nickname or user.username
+
+
+def prepare_author(instance):
+    return {'id': instance.author_id, 'name': author_name(instance.author)}
+
+
+def prepare_tags(instance):
+    # tags.all() 读取 get_queryset 里预取的结果，不再逐个文档查询
+    return [{'id': tag.id, 'name': tag.name} for tag in instance.tags.all()]
 
 # ==================
 # 1. 课程索引
@@ -9,16 +75,17 @@ from api.models import Tag, CommunityPost ,Course,GalleryItem
 @registry.register_document
 class CourseDocument(Document):
     doc_type = fields.KeywordField()
+    # 搜索接口用 id 作为排序的最后一级 (search_after 需要唯一的排序值)，只返回已发布的对象
+    id = fields.IntegerField()
+    status = fields.KeywordField()
+    title = cjk_text_field()
+    title_suggest = suggest_field('title')
 
     # 关联作者 (外键)
-    author = fields.ObjectField(properties={
-        'name': fields.TextField(), 
-    })
+    author = author_field()
 
     # 关联标签 (多对多)
-    tags = fields.ObjectField(properties={
-        'name': fields.TextField(),
-    }, multi=True)
+    tags = tags_field()
 
     points = fields.IntegerField()
 
@@ -27,20 +94,21 @@ class CourseDocument(Document):
 
     class Django:
         model = Course # 绑定的 Django 模型
-        fields = ['title','is_vip_free','created_at']
-        related_models = [User, Tag]
+        # updated_at 用于一致性审计 (search/audit.py) 判断文档是否过期
+        fields = ['is_vip_free','created_at','updated_at']
+        # 批量索引时按块读取数据库，内存占用与总数无关
+        queryset_pagination = settings.SEARCH_BULK_CHUNK_SIZE
 
     
+    def get_queryset(self):
+        # 作者 JOIN、标签每块一次预取：每块文档的查询次数固定
+        return super().get_queryset().select_related('author').prefetch_related('tags')
     def prepare_doc_type(self, instance):
         return 'course'
-    def get_instances_from_related(self, related_instance):
-        """当 User 或 Tag 变化时，找到所有关联的课程"""
-        if isinstance(related_instance, User):
-            # 假设 Course.author 的 related_name 是 'course_set'
-            return related_instance.course_set.all() 
-        if isinstance(related_instance, Tag):
-            # 假设 Course.tags 的 related_name 是 'course_set'
-            return related_instance.course_set.all()
+    def prepare_author(self, instance):
+        return prepare_author(instance)
+    def prepare_tags(self, instance):
+        return prepare_tags(instance)
     def prepare_points(self, instance):    
         return instance.pricePoints
 
@@ -50,15 +118,15 @@ class CourseDocument(Document):
 @registry.register_document
 class GalleryItemDocument(Document): 
     doc_type = fields.KeywordField()
+    id = fields.IntegerField()
+    status = fields.KeywordField()
+    title = cjk_text_field()
+    title_suggest = suggest_field('title')
 
     # 关联作者 (外键)
-    author = fields.ObjectField(properties={ # <-- 已修正 (从 artist 改为 author)
-        'name': fields.TextField(),
-    })
+    author = author_field() # <-- 已修正 (从 artist 改为 author)
 
-    tags = fields.ObjectField(properties={
-        'name': fields.TextField(),
-    }, multi=True)
+    tags = tags_field()
 
     points = fields.IntegerField()
 
@@ -67,18 +135,16 @@ class GalleryItemDocument(Document):
 
     class Django:
         model = GalleryItem 
-        fields = ['title','is_vip_free','created_at','rating']
-        related_models = [User, Tag]
+        fields = ['is_vip_free','created_at','updated_at','rating']
+        queryset_pagination = settings.SEARCH_BULK_CHUNK_SIZE
+    def get_queryset(self):
+        return super().get_queryset().select_related('author').prefetch_related('tags')
     def prepare_doc_type(self, instance):
         return 'gallery'
-    def get_instances_from_related(self, related_instance):
-        """当 User 或 Tag 变化时，找到所有关联的画廊作品"""
-        if isinstance(related_instance, User):
-            # 假设 GalleryItem.author 的 related_name 是 'galleryitem_set'
-            return related_instance.galleryitem_set.all() 
-        if isinstance(related_instance, Tag):
-            # 假设 GalleryItem.tags 的 related_name 是 'galleryitem_set'
-            return related_instance.galleryitem_set.all()
+    def prepare_author(self, instance):
+        return prepare_author(instance)
+    def prepare_tags(self, instance):
+        return prepare_tags(instance)
     def prepare_points(self, instance):    
         return instance.requiredPoints
 
@@ -88,15 +154,12 @@ class GalleryItemDocument(Document):
 @registry.register_document
 class CommunityPostDocument(Document): # <-- 已修正
     doc_type = fields.KeywordField() 
+    id = fields.IntegerField()
+    status = fields.KeywordField()
+    title = cjk_text_field()
 
     # 关联作者 (外键)
-    author = fields.ObjectField(properties={
-        'name': fields.TextField(),
-    })
-
-    tags = fields.ObjectField(properties={
-        'name': fields.TextField(),
-    }, multi=True)
+    author = author_field()
     
     points = fields.IntegerField()
     likes_count = fields.IntegerField()
@@ -107,22 +170,66 @@ class CommunityPostDocument(Document): # <-- 已修正
     class Django:
         model = CommunityPost 
         fields = [
-            'title','created_at'
+            'created_at',
+            'updated_at',
             # 'content', # 如果你的帖子模型有 content 字段且需要被搜
         ]
-        related_models = [User, Tag]
+        queryset_pagination = settings.SEARCH_BULK_CHUNK_SIZE
+    def get_queryset(self):
+        # 点赞数和帖子在同一条查询里聚合出来，不再逐个帖子 COUNT
+        return super().get_queryset().select_related('author').annotate(likes_total=Count('likes'))
     def prepare_doc_type(self, instance):
         return 'community'
     
-    def get_instances_from_related(self, related_instance):
-        """当 User 或 Tag 变化时，找到所有关联的帖子"""
-        if isinstance(related_instance, User):
-            # 假设 CommunityPost.author 的 related_name 是 'communitypost_set'
-            return related_instance.communitypost_set.all() 
-        if isinstance(related_instance, Tag):
-            # 假设 CommunityPost.tags 的 related_name 是 'communitypost_set'
-            return related_instance.communitypost_set.all()
+    def prepare_author(self, instance):
+        return prepare_author(instance)
     def prepare_points(self, instance):    
         return instance.rewardPoints
     def prepare_likes_count(self, instance):
-        return instance.likes.count()
\ No newline at end of file
+        # 批量索引时用 get_queryset 的聚合结果；尚未写回数据库的点赞由写回后的局部更新改写
+        if hasattr(instance, 'likes_total'):
+            return instance.likes_total
+        count, _ = like_service.get_like_states(CommunityPost, [instance.pk])[instance.pk]
+        return count
+
+
+# ==================
+# 4. 标签索引 (只用于输入提示)
+# ==================
+@registry.register_document
+class TagDocument(Document):
+    id = fields.IntegerField()
+    name = suggest_field('name')
+    scope = fields.KeywordField()
+
+    class Index:
+        name = 'tags'
+
+    class Django:
+        model = Tag
+        queryset_pagination = settings.SEARCH_BULK_CHUNK_SIZE
+
+
+# ==================
+# 5. 用户索引 (只用于站内信收件人等输入提示)
+# ==================
+@registry.register_document
+class UserDocument(Document):
+    # 登录 (last_login)、积分变化等保存不影响这个索引，带 update_fields 且不含这些字段的保存不入缓冲区
+    watched_fields = ('username', 'nickname', 'is_active', 'is_deleted')
+
+    id = fields.IntegerField()
+    username = suggest_field('username')
+    # 昵称以中文为主，标准分词会切成单字，前缀查询几乎什么都能命中；改为按两字词切分
+    nickname = suggest_field('nickname', analyzer=cjk_bigram)
+    username_substring = substring_field('username')
+    nickname_substring = substring_field('nickname')
+    is_active = fields.BooleanField()
+    is_deleted = fields.BooleanField()
+
+    class Index:
+        name = 'users'
+
+    class Django:
+        model = User
+        queryset_pagination = settings.SEARCH_BULK_CHUNK_SIZE
@@ -0,0 +1,46 @@
+from rest_framework import serializers
+from api.models import Tag
+from .query import (
+    DOC_TYPES, PAGE_SIZE, MAX_PAGE_SIZE, SUGGEST_KINDS, SUGGEST_LIMIT, MAX_SUGGEST_LIMIT,
+    InvalidCursor, decode_cursor,
+)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    """
+    统一搜索的查询参数。多个类型 / 标签用重复参数传递：?doc_type=course&doc_type=gallery&tags=1&tags=2
+    翻页时带上上一页返回的 next 游标，其余参数保持不变。
+    """
+    q = serializers.CharField(required=False, allow_blank=True, max_length=100, default='')
+    doc_type = serializers.ListField(child=serializers.ChoiceField(choices=DOC_TYPES), required=False)
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=20)
+    is_vip_free = serializers.BooleanField(required=False, allow_null=True, default=None)
+    points_min = serializers.IntegerField(required=False, min_value=0)
+    points_max = serializers.IntegerField(required=False, min_value=0)
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=MAX_PAGE_SIZE, default=PAGE_SIZE)
+    cursor = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_q(self, value):
+        return value.strip()
+
+    def validate_cursor(self, value):
+        if value:
+            try:
+                decode_cursor(value)
+            except InvalidCursor:
+                raise serializers.ValidationError("无效的翻页游标。")
+        return value
+
+    def validate(self, data):
+        if data.get('points_min') is not None and data.get('points_max') is not None \
+                and data['points_min'] > data['points_max']:
+            raise serializers.ValidationError({"points_max": "不能小于 points_min。"})
+        return data
+
+
+class SuggestQuerySerializer(serializers.Serializer):
+    """输入提示的查询参数：?q=机器&type=tag&scope=course"""
+    q = serializers.CharField(max_length=50, trim_whitespace=True)
+    type = serializers.ChoiceField(choices=SUGGEST_KINDS, default='title')
+    scope = serializers.ChoiceField(choices=Tag.TagScope.choices, required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=MAX_SUGGEST_LIMIT, default=SUGGEST_LIMIT)
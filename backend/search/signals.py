@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from api.models import (
+    User, Tag, Course, GalleryItem, CommunityPost, PendingCourse, PendingGalleryItem, PendingCommunityPost,
+)
+from .backends import VECTOR_FIELDS, update_search_vector
+from .tasks import propagate_author_name, propagate_tag_change
+
+# ===============================================
+# =======     作者名 / 标签名变化 -> 局部更新     =======
+# ===============================================
+# 文档里冗余了作者名和标签名 (见 search_indexes.py)。记录加载时的名称，
+# 保存后真正变化了才投递 _update_by_query 任务；其余字段的修改不影响索引。
+
+_AUTHOR_NAME_FIELDS = ('username', 'nickname')
+
+
+@receiver(post_init, sender=User)
+def remember_author_name(sender, instance, **kwargs):
+    instance._loaded_author_name = tuple(instance.__dict__.get(field) for field in _AUTHOR_NAME_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def propagate_author_rename(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not set(update_fields) & set(_AUTHOR_NAME_FIELDS)):
+        return
+    current = tuple(instance.__dict__.get(field) for field in _AUTHOR_NAME_FIELDS)
+    if current != instance._loaded_author_name:
+        instance._loaded_author_name = current
+        transaction.on_commit(lambda: propagate_author_name.delay(instance.pk))
+
+
+@receiver(post_init, sender=Tag)
+def remember_tag_name(sender, instance, **kwargs):
+    instance._loaded_tag_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Tag)
+def propagate_tag_rename(sender, instance, created, **kwargs):
+    if not created and instance.name != instance._loaded_tag_name:
+        instance._loaded_tag_name = instance.name
+        transaction.on_commit(lambda: propagate_tag_change.delay(instance.pk))
+
+
+@receiver(post_delete, sender=Tag)
+def propagate_tag_delete(sender, instance, **kwargs):
+    tag_id = instance.pk
+    transaction.on_commit(lambda: propagate_tag_change.delay(tag_id))
+
+
+# ===============================================
+# =======      数据库全文检索 search_vector      =======
+# ===============================================
+# 标题 / 正文变化后用一条 UPDATE 重新计算 tsvector (PostgreSQL 后备搜索使用)。
+# 记录加载时的标题和正文，没有变化的保存不再更新；普通保存也不写回 search_vector 列
+# (见模型的 MAINTAINED_FIELDS)。后台审核用的 Pending* 代理模型保存时 sender 是代理类，需要单独连接。
+
+_VECTOR_MODELS = (Course, GalleryItem, CommunityPost, PendingCourse, PendingGalleryItem, PendingCommunityPost)
+
+
+def _search_text(instance):
+    return tuple(instance.__dict__.get(field) for field in VECTOR_FIELDS[instance._meta.concrete_model])
+
+
+def remember_search_text(sender, instance, **kwargs):
+    instance._loaded_search_text = _search_text(instance)
+
+
+def refresh_search_vector(sender, instance, created, update_fields=None, **kwargs):
+    fields = VECTOR_FIELDS[sender._meta.concrete_model]
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return
+    current = _search_text(instance)
+    if not created and current == instance._loaded_search_text:
+        return
+    instance._loaded_search_text = current
+    update_search_vector(sender, instance.pk, *(getattr(instance, field) for field in fields))
+
+
+for _model in _VECTOR_MODELS:
+    post_init.connect(remember_search_text, sender=_model)
+    post_save.connect(refresh_search_vector, sender=_model)
@@ -1,57 +1,87 @@
 from celery import shared_task
 from django.apps import apps
 import logging
-from django_elasticsearch_dsl.registries import registry
 
 logger = logging.getLogger(__name__)
 
-@shared_task(name="search.update_index")
-def update_index_task(app_label, model_name, pk):
+@shared_task(name="search.flush_index_buffer")
+def flush_index_buffer():
     """
-    异步任务：更新单个对象的 ES 索引
+    定时任务：把索引缓冲区中去重后的变更通过 _bulk 批量写入 ES
     """
+    from .buffer import flush
+
+    try:
+        indexed, deleted = flush()
+    except Exception as e:
+        # 处理中的集合会保留下来，下一次运行时重试
+        logger.error(f"Error flushing search index buffer: {e}")
+        return
+    if indexed or deleted:
+        logger.info(f"Flushed search index buffer: {indexed} indexed, {deleted} deleted")
+
+
+@shared_task(name="search.update_document_fields")
+def update_document_fields(app_label, model_name, values):
+    """
+    异步任务：只改写文档中的部分字段 (例如点赞数)，values 为 {pk: {字段: 值}}
+    """
+    from .partial_updates import update_fields
+
+    try:
+        update_fields(apps.get_model(app_label, model_name), values)
+    except Exception as e:
+        logger.error(f"Error partially updating {model_name} documents: {e}")
+        raise update_document_fields.retry(exc=e, countdown=60)
+
+
+@shared_task(name="search.propagate_author_name")
+def propagate_author_name(user_id):
+    """
+    异步任务：用户改名后，用 _update_by_query 改写其所有文档中的作者名
+    """
+    from api.models import User
+    from .partial_updates import rename_author
+    from .search_indexes import author_name
+
+    user = User.objects.filter(pk=user_id).only('username', 'nickname').first()
+    if user is None:
+        return
     try:
-        model = apps.get_model(app_label, model_name)
-        instance = model.objects.get(pk=pk) # 从数据库获取最新的实例
-        
-        # 遍历所有注册的 Document，找到匹配的
-        for doc in registry.get_documents(models=[model]):
-            doc().update(instance) # 更新 ES 索引
-            
-        logger.info(f"Successfully updated index for {model_name} {pk}")
-        
-    except model.DoesNotExist:
-        # 这种情况可能发生在：对象刚创建马上就被删了
-        logger.warning(f"{model_name} with pk={pk} not found for update. Skipping.")
+        # 以执行时数据库里的名称为准，连续改名只会以最后一次为准
+        rename_author(user_id, author_name(user))
     except Exception as e:
-        logger.error(f"Error updating index for {model_name} {pk}: {e}")
-        # 失败时重试（例如 ES 暂时连接不上）
-        raise update_index_task.retry(exc=e, countdown=60)
+        logger.error(f"Error propagating author name for user {user_id}: {e}")
+        raise propagate_author_name.retry(exc=e, countdown=60)
 
 
-@shared_task(name="search.delete_index")
-def delete_index_task(app_label, model_name, pk):
+@shared_task(name="search.propagate_tag_change")
+def propagate_tag_change(tag_id):
     """
-    异步任务：从 ES 索引中删除单个对象
+    异步任务：标签改名 / 删除后，用 _update_by_query 改写带这个标签的文档
     """
+    from api.models import Tag
+    from .partial_updates import rename_tag, remove_tag
+
+    name = Tag.objects.filter(pk=tag_id).values_list('name', flat=True).first()
     try:
-        model = apps.get_model(app_label, model_name)
-        
-        for doc in registry.get_documents(models=[model]):
-            # 获取 ES 索引的名称, e.g., 'courses'
-            index_name = doc._index._name
-            # 获取底层的 es-py 客户端
-            es_client = doc._get_connection()
-            
-            try:
-                # 按 ID 从 ES 中删除（ID 默认就是 Django 的 PK）
-                es_client.delete(index=index_name, id=pk, ignore=[404]) # ignore[404] 避免"已删除"时报错
-                logger.info(f"Successfully deleted index doc {pk} from {index_name}")
-            except Exception as e:
-                 logger.error(f"Error deleting index doc {pk} from {index_name}: {e}")
-                 # 失败时重试
-                 raise delete_index_task.retry(exc=e, countdown=60)
-                 
+        if name is None:
+            remove_tag(tag_id)
+        else:
+            rename_tag(tag_id, name)
     except Exception as e:
-        # (例如 apps.get_model 失败)
-        logger.error(f"Error in delete_index_task for {app_label}.{model_name} {pk}: {e}")
\ No newline at end of file
+        logger.error(f"Error propagating tag change for tag {tag_id}: {e}")
+        raise propagate_tag_change.retry(exc=e, countdown=60)
+
+
+@shared_task(name="search.audit_search_index")
+def audit_search_index():
+    """
+    定时任务 (每晚)：比较数据库和所有索引，把不一致的文档放回索引缓冲区，返回报告
+    """
+    from .audit import audit, AuditInProgress
+
+    try:
+        return audit()
+    except AuditInProgress:
+        logger.info("Search index audit already running. Skipping.")
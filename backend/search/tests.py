@@ -1,3 +1,299 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from django.db import connection
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from elasticsearch_dsl import Search
+from rest_framework.test import APIClient
+from api.models import Course, PendingCourse, Tag, User
+from . import breaker
+from . import buffer as search_buffer
+from . import cjk
+from . import query as search_service
+from .backends import DOCUMENTS, ElasticsearchBackend, PostgresBackend, SearchUnavailable, highlight
+from .search_indexes import UserDocument
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class CJKExpansionTests(SimpleTestCase):
+    """数据库全文检索的两字词展开，与 ES 的 cjk_bigram 切分一致"""
+
+    def test_expand_splits_cjk_runs_into_bigrams(self):
+        self.assertEqual(cjk.expand('深度学习Python入门').split(), ['深度', '度学', '学习', 'Python', '入门'])
+
+    def test_expand_keeps_single_character(self):
+        self.assertEqual(cjk.expand('学 Go').split(), ['学', 'Go'])
+
+    def test_expand_normalizes_full_width(self):
+        self.assertEqual(cjk.expand('Ｐｙｔｈｏｎ').split(), ['Python'])
+
+    def test_query_turns_cjk_runs_into_phrases(self):
+        self.assertEqual(cjk.expand_query('深度学习 -入门').split(), ['"深度', '度学', '学习"', '-"入门"'])
+
+    def test_query_keeps_quoted_phrases(self):
+        self.assertEqual(cjk.expand_query('"机器学习 python"'), '"机器 器学 学习 python"')
+
+    def test_highlight_marks_query_terms(self):
+        self.assertEqual(highlight('深度学习入门', '学习'), '深度<em>学习</em>入门')
+        self.assertEqual(highlight('Python 编程', 'python -编程'), '<em>Python</em> 编程')
+        self.assertIsNone(highlight('绘画基础', '学习'))
+
+
+@unittest.skipUnless(fakeredis, '需要 fakeredis')
+class IndexBufferTests(SimpleTestCase):
+    """缓冲区中无法解析的成员不能阻塞刷新"""
+
+    def test_unparsable_members_are_dropped(self):
+        redis = fakeredis.FakeRedis()
+        redis.sadd(search_buffer.UPDATE_KEY, 'api.removedmodel:1', 'garbage', 'api.course:7')
+        handled = []
+
+        def handler(redis, model, pks):
+            handled.append((model, pks))
+            return len(pks)
+
+        with self.assertLogs('search.buffer', 'ERROR'):
+            count = search_buffer._flush(redis, search_buffer.UPDATE_KEY, handler, 100)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(handled, [(Course, ['7'])])
+        self.assertFalse(redis.exists(search_buffer.UPDATE_KEY + search_buffer._PROCESSING_SUFFIX))
+
+
+class UserSuggestTests(TestCase):
+    """站内信收件人提示：昵称按两字词切分，空索引和不可用时的处理"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_nickname_uses_cjk_analyzer_and_substring_fields(self):
+        properties = UserDocument._doc_type.mapping.to_dict()['properties']
+        self.assertEqual(properties['nickname']['analyzer'], 'cjk_bigram')
+        self.assertEqual(properties['nickname_substring']['analyzer'], 'substring_ngram')
+        self.assertEqual(properties['username_substring']['analyzer'], 'substring_ngram')
+
+    def test_empty_index_is_unavailable(self):
+        es = mock.Mock()
+        es.count.return_value = {'count': 0}
+        with mock.patch.object(Search, 'execute', return_value=mock.MagicMock(hits=[])), \
+                mock.patch('search.backends.connections.get_connection', return_value=es):
+            with self.assertRaises(SearchUnavailable), self.assertLogs('search.backends', 'WARNING'):
+                ElasticsearchBackend().suggest('user', '小明', 10)
+
+    def test_no_match_in_populated_index_returns_empty(self):
+        es = mock.Mock()
+        es.count.return_value = {'count': 3}
+        with mock.patch.object(Search, 'execute', return_value=mock.MagicMock(hits=[])), \
+                mock.patch('search.backends.connections.get_connection', return_value=es):
+            self.assertEqual(ElasticsearchBackend().suggest('user', '小明', 10), [])
+            self.assertEqual(ElasticsearchBackend().suggest('user', '小红', 10), [])
+        es.count.assert_called_once()
+
+    def test_user_search_view_returns_503_when_unavailable(self):
+        user = User.objects.create_user(
+            username='sender', email='sender@example.com', phone='13400000000', password='pw',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(search_service, 'suggest', side_effect=SearchUnavailable):
+            response = client.get(reverse('user-search'), {'q': '小明'})
+        self.assertEqual(response.status_code, 503)
+
+
+class SearchTimeoutTests(TestCase):
+    """ES 超时返回的部分结果照常返回，但不缓存，并按过慢的请求计入熔断器"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.params = {'q': '学习', 'doc_type': ['course'], 'page_size': 20, 'is_vip_free': None}
+
+    def _search(self, timed_out):
+        section = {'results': [{'id': 1}], 'next_sort': None, 'count': 1, 'timed_out': timed_out}
+        with mock.patch.object(ElasticsearchBackend, 'search', return_value=({'course': section}, {})), \
+                mock.patch.object(breaker, 'record_failure') as record_failure:
+            result = search_service.search(self.params)
+        return result, record_failure
+
+    def test_timed_out_results_are_not_cached(self):
+        result, record_failure = self._search(timed_out=True)
+        self.assertEqual(result['results']['course']['results'], [{'id': 1}])
+        self.assertNotIn('timed_out', result['results']['course'])
+        record_failure.assert_called_once_with()
+        self.assertIsNone(cache.get(search_service._cache_key(self.params)))
+
+    def test_complete_results_are_cached(self):
+        result, record_failure = self._search(timed_out=False)
+        record_failure.assert_not_called()
+        self.assertEqual(cache.get(search_service._cache_key(self.params)), result)
+
+
+class SearchVectorSignalTests(TestCase):
+    """search_vector 只在标题 / 正文变化时更新，后台审核的代理模型也一样"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='teacher', email='teacher@example.com', phone='13600000000', password='pw',
+        )
+        patcher = mock.patch('search.signals.update_search_vector')
+        self.update = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.course = Course.objects.create(title='深度学习入门', description='d', author=self.author)
+        self.update.reset_mock()
+
+    def test_unchanged_text_skips_update(self):
+        course = Course.objects.get(pk=self.course.pk)
+        course.pricePoints = 10
+        course.save()
+        self.update.assert_not_called()
+
+    def test_changed_title_updates_once(self):
+        course = Course.objects.get(pk=self.course.pk)
+        course.title = '机器学习实战'
+        course.save()
+        self.update.assert_called_once_with(Course, course.pk, '机器学习实战', 'd')
+
+    def test_pending_proxy_updates(self):
+        Course.objects.filter(pk=self.course.pk).update(status=Course.StatusChoices.PENDING_REVIEW)
+        pending = PendingCourse.objects.get(pk=self.course.pk)
+        pending.title = '审核时改过的标题'
+        pending.save()
+        self.update.assert_called_once_with(PendingCourse, pending.pk, '审核时改过的标题', 'd')
+
+
+class SearchBackendContract:
+    """
+    两个搜索后端共用的用例：同样的数据、同样的查询应得到同样的结果。
+    子类实现 index_fixtures()，把 setUp 中创建的对象写入各自的索引。
+    """
+    backend_class = None
+
+    def setUp(self):
+        super().setUp()
+        author = User.objects.create_user(
+            username='teacher', email='teacher@example.com', phone='13600000000', password='pw',
+        )
+        self.tag = Tag.objects.create(name='人工智能', scope=Tag.TagScope.COURSE)
+        published = Course.StatusChoices.PUBLISHED
+        self.deep_learning = Course.objects.create(
+            title='深度学习入门', description='d', author=author, status=published, pricePoints=0,
+        )
+        self.deep_learning.tags.add(self.tag)
+        self.painting = Course.objects.create(
+            title='绘画基础', description='d', author=author, status=published, pricePoints=200,
+        )
+        self.python = Course.objects.create(
+            title='Python 编程', description='d', author=author, status=published, pricePoints=50,
+        )
+        self.draft = Course.objects.create(
+            title='机器学习实战', description='d', author=author, status=Course.StatusChoices.DRAFT,
+        )
+        # 相关度完全相同的一组，用来检查翻页
+        self.sketches = [
+            Course.objects.create(title='素描练习', description='d', author=author, status=published, pricePoints=0)
+            for _ in range(3)
+        ]
+        self.index_fixtures()
+
+    def index_fixtures(self):
+        raise NotImplementedError
+
+    def _search(self, q, **params):
+        params = {'q': q, 'doc_type': ['course'], 'page_size': 20, 'is_vip_free': None, **params}
+        sections, facets = self.backend_class().search(params)
+        return sections['course'], facets
+
+    def _ids(self, q, **params):
+        return {item['id'] for item in self._search(q, **params)[0]['results']}
+
+    def test_cjk_substring_matches(self):
+        self.assertEqual(self._ids('学习'), {self.deep_learning.pk})
+
+    def test_latin_word_is_case_insensitive(self):
+        self.assertEqual(self._ids('python'), {self.python.pk})
+
+    def test_no_match(self):
+        self.assertEqual(self._ids('烹饪'), set())
+
+    def test_only_published_objects_are_returned(self):
+        self.assertNotIn(self.draft.pk, self._ids('机器学习'))
+
+    def test_filters_and_facets(self):
+        section, facets = self._search('', tags=[self.tag.pk])
+        self.assertEqual([item['id'] for item in section['results']], [self.deep_learning.pk])
+        self.assertEqual(section['count'], 1)
+        self.assertEqual(self._ids('', points_min=100), {self.painting.pk})
+
+    def test_cursor_walks_tied_results_without_repeats(self):
+        params = {'q': '练习', 'doc_type': ['course'], 'page_size': 2, 'is_vip_free': None}
+        backend = self.backend_class()
+        sections, _ = backend.search(params)
+        first = sections['course']
+        self.assertEqual(len(first['results']), 2)
+        # 游标经过 JSON 编码后再交回后端
+        sort_values = json.loads(json.dumps(first['next_sort']))
+        sections, facets = backend.search(params, ('course', sort_values))
+        second = sections['course']
+        self.assertIsNone(facets)
+
+        ids = [item['id'] for item in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(course.pk for course in self.sketches))
+        self.assertIsNone(second['next_sort'])
+
+    def test_highlight(self):
+        section, _ = self._search('学习')
+        self.assertEqual(section['results'][0]['highlight'], '深度<em>学习</em>入门')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', '需要 PostgreSQL')
+class PostgresBackendTests(SearchBackendContract, TestCase):
+    backend_class = PostgresBackend
+
+    def index_fixtures(self):
+        # search_vector 由保存时的信号写入
+        pass
+
+
+@unittest.skipUnless(os.environ.get('SEARCH_TEST_ELASTICSEARCH'), '设置 SEARCH_TEST_ELASTICSEARCH=1 以连接 ES 测试')
+class ElasticsearchBackendTests(SearchBackendContract, TestCase):
+    backend_class = ElasticsearchBackend
+
+    def index_fixtures(self):
+        # 使用独立的索引名，不影响开发环境中的索引
+        for doc_class in DOCUMENTS.values():
+            index = doc_class._index
+            patcher = mock.patch.object(index, '_name', f"test_{index._name}")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+            if index.exists():
+                index.delete()
+            index.create()
+            self.addCleanup(index.delete)
+            doc = doc_class()
+            doc.update(doc.get_queryset(), refresh=True)
+
+
+class BenchmarkSearchAnalyzersTests(SimpleTestCase):
+    """没有查询时在创建任何临时索引之前报错"""
+
+    def test_no_queries_raises_before_creating_indices(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus, queries = os.path.join(tmp, 'corpus.txt'), os.path.join(tmp, 'queries.txt')
+            with open(corpus, 'w', encoding='utf-8') as f:
+                f.write('深度学习入门\n')
+            open(queries, 'w', encoding='utf-8').close()
+            with mock.patch('search.management.commands.benchmark_search_analyzers.es_connections') as es_connections:
+                with self.assertRaises(CommandError):
+                    call_command('benchmark_search_analyzers', corpus=corpus, queries=queries, stdout=io.StringIO())
+        es_connections.get_connection.assert_not_called()
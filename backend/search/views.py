@@ -1,3 +1,45 @@
-from django.shortcuts import render
+from rest_framework import generics, status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from . import query as search_service
+from .serializers import SearchQuerySerializer, SuggestQuerySerializer
 
-# Create your views here.
+
+class SearchView(generics.GenericAPIView):
+    """
+    统一搜索课程 / 画廊作品 / 社群帖子 (只返回已发布的内容)。
+    GET ?q=...&doc_type=course&tags=1&is_vip_free=true&points_min=0&points_max=100
+    返回 {"results": {"course": {"count", "results", "next"}, ...}, "facets": {...}}；
+    带 cursor 翻页时只返回游标所属类型的下一页，不含 count 和 facets。
+    """
+    permission_classes = [AllowAny]
+    serializer_class = SearchQuerySerializer
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        try:
+            return Response(search_service.search(serializer.validated_data))
+        except search_service.SearchUnavailable:
+            return Response({"detail": "搜索服务暂时不可用，请稍后再试。"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class SuggestView(generics.GenericAPIView):
+    """
+    搜索框输入提示。GET ?q=...&type=title|tag|user&scope=course&limit=10
+    返回 {"results": [...]}；type=user 只对登录用户开放。
+    """
+    permission_classes = [AllowAny]
+    serializer_class = SuggestQuerySerializer
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if params['type'] == 'user' and not request.user.is_authenticated:
+            self.permission_denied(request)
+        try:
+            results = search_service.suggest(params['type'], params['q'], params['limit'], params.get('scope'))
+        except search_service.SearchUnavailable:
+            return Response({"detail": "搜索服务暂时不可用，请稍后再试。"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"results": results})